@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
@@ -6,22 +8,55 @@ import sys
 
 # Determine DB Type for logging
 db_url = settings.DATABASE_URL
+replica_url = settings.DATABASE_REPLICA_URL or db_url
 print(f"Using Database: PostgreSQL ({'Production' if not settings.DEV else 'Development'})")
 
-try:
-    engine = create_engine(
-        db_url, 
+
+def _pool_kwargs(url, pool_size: int, max_overflow: int) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}  # SQLite uses its own pool classes; QueuePool sizing does not apply
+    return {
+        "pool_size": pool_size,  # Maximum number of permanent connections
+        "max_overflow": max_overflow,  # Maximum number of connections that can be created beyond pool_size
+        "pool_timeout": 30,  # Seconds to wait before giving up on getting a connection
+        "pool_recycle": 3600,  # Recycle connections after 1 hour
+    }
+
+
+def _is_postgres(url) -> bool:
+    return make_url(url).get_backend_name() == "postgresql"
+
+
+def _make_engine(url, pool_size: int, max_overflow: int, read_only: bool = False):
+    connect_args = {}
+    if read_only and _is_postgres(url):
+        # Guard the reporting pool even when it points at the primary
+        connect_args["options"] = "-c default_transaction_read_only=on"
+    return create_engine(
+        url,
         pool_pre_ping=True,  # Good for Postgres to handle dropped connections
-        pool_size=5,  # Maximum number of permanent connections
-        max_overflow=10,  # Maximum number of connections that can be created beyond pool_size
-        pool_timeout=30,  # Seconds to wait before giving up on getting a connection
-        pool_recycle=3600  # Recycle connections after 1 hour
+        connect_args=connect_args,
+        **_pool_kwargs(url, pool_size, max_overflow),
+    )
+
+
+# One pool per workload, so a burst in one cannot starve the others:
+#   engine           - interactive API (reads + writes, primary)
+#   reporting_engine - analytics/reporting reads (replica if configured, else primary)
+#   ingest_engine    - webhook ingestion and background workers (primary)
+try:
+    engine = _make_engine(db_url, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+    reporting_engine = _make_engine(
+        replica_url, settings.DB_REPORTING_POOL_SIZE, settings.DB_REPORTING_MAX_OVERFLOW, read_only=True
     )
+    ingest_engine = _make_engine(db_url, settings.DB_INGEST_POOL_SIZE, settings.DB_INGEST_MAX_OVERFLOW)
 except Exception as e:
     print(f"Database Connection Error: {e}")
     sys.exit(1)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReportingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=reporting_engine)
+IngestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=ingest_engine)
 
 Base = declarative_base()
 
@@ -31,3 +66,110 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_reporting_db():
+    """Read-only analytics session. May lag the primary when a replica is configured."""
+    db = ReportingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.rollback()  # Never write through the reporting pool
+        db.close()
+
+
+# ============ Async engine (asyncpg / aiosqlite) ============
+# Used by async def endpoints so a slow query yields the event loop instead of blocking it.
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(url: str):
+    """Map the configured sync URL onto its async driver (psycopg2 -> asyncpg, pysqlite -> aiosqlite)"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}'")
+    parsed = parsed.set(drivername=_ASYNC_DRIVERS[backend])
+    if backend == "postgresql" and "sslmode" in parsed.query:
+        # asyncpg spells libpq's sslmode as ssl
+        query = dict(parsed.query)
+        query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(query=query)
+    return parsed
+
+
+def _make_async_engine(url, pool_size: int, max_overflow: int, read_only: bool = False):
+    async_url = _async_url(url)
+    connect_args = {}
+    if read_only and _is_postgres(async_url):
+        connect_args["server_settings"] = {"default_transaction_read_only": "on"}
+    return create_async_engine(
+        async_url,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+        **_pool_kwargs(async_url, pool_size, max_overflow),
+    )
+
+
+try:
+    async_engine = _make_async_engine(db_url, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+    async_reporting_engine = _make_async_engine(
+        replica_url, settings.DB_REPORTING_POOL_SIZE, settings.DB_REPORTING_MAX_OVERFLOW, read_only=True
+    )
+except Exception as e:  # Driver not installed: async endpoints report it on first use
+    print(f"Async database engine unavailable: {e}")
+    async_engine = None
+    async_reporting_engine = None
+
+# expire_on_commit=False: response models read attributes after the session is done,
+# and an expired attribute cannot lazy-load outside the async context
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+AsyncReportingSessionLocal = async_sessionmaker(
+    bind=async_reporting_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+def _require_async_engine():
+    if async_engine is None:
+        raise RuntimeError("Async database driver missing: install asyncpg (PostgreSQL) or aiosqlite (SQLite)")
+
+
+async def get_async_db():
+    _require_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_reporting_db():
+    """Async counterpart of get_reporting_db"""
+    _require_async_engine()
+    async with AsyncReportingSessionLocal() as db:
+        try:
+            yield db
+        finally:
+            await db.rollback()
+
+
+def get_pool_stats() -> dict:
+    """Checked-out / idle connections per workload pool"""
+    engines = {
+        "interactive": engine,
+        "reporting": reporting_engine,
+        "ingest": ingest_engine,
+        "async_interactive": async_engine.sync_engine if async_engine else None,
+        "async_reporting": async_reporting_engine.sync_engine if async_reporting_engine else None,
+    }
+    stats = {}
+    for name, eng in engines.items():
+        if eng is None:
+            continue
+        pool = eng.pool
+        stats[name] = {
+            "status": pool.status(),
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "replica": name.endswith("reporting") and settings.DATABASE_REPLICA_URL is not None,
+        }
+    return stats
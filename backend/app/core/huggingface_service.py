@@ -5,10 +5,14 @@ Handles all AI inference using Hugging Face API (100% FREE)
 import os
 import json
 import base64
-from typing import Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Dict, Any, Tuple, Union
 from PIL import Image
 from io import BytesIO
 
+from app.core.image_pipeline import MODEL_INPUT_SIZE, model_input
+from app.core.llm_gateway import llm_gateway
+
 try:
     from huggingface_hub import InferenceClient
     HF_AVAILABLE = True
@@ -16,6 +20,58 @@ except ImportError:
     HF_AVAILABLE = False
     print("⚠️ Hugging Face Hub not installed. Run: pip install huggingface_hub")
 
+# Text models (Hugging Face via LiteLLM), in preference order before any latency data exists
+HF_TEXT_MODELS = [
+    "huggingface/meta-llama/Llama-3.1-8B-Instruct",
+    "huggingface/HuggingFaceH4/zephyr-7b-beta",
+    "huggingface/google/gemma-2-9b-it",
+    "huggingface/microsoft/Phi-3-mini-4k-instruct",
+]
+
+# Vision models used by analyze_image (generic crop validation, then disease classification)
+VALIDATION_MODEL = "google/vit-base-patch16-224"
+DISEASE_MODEL = "linkanjarad/mobilenet_v2_1.0_224-plant-disease-identification"
+VISION_INPUT_SIZE = MODEL_INPUT_SIZE  # Input resolution of both vision models
+MIN_DISEASE_CONFIDENCE = 0.2  # Below this the disease classifier is unsure and crop validation decides
+VALIDATION_START_DELAY = 1.0  # Seconds the classifier gets before crop validation is started alongside it
+
+# Expanded Keywords indicating valid crop/plant
+PLANT_KEYWORDS = [
+    'plant', 'tree', 'flower', 'vegetable', 'fruit', 'crop', 'leaf', 
+    'agriculture', 'garden', 'grass', 'herb', 'shrub', 'wheat', 'corn', 
+    'rice', 'potato', 'tomato', 'pepper', 'stem', 'root', 'botanical',
+    'broccoli', 'cabbage', 'carrot', 'cucumber', 'eggplant', 'lettuce', 
+    'onion', 'spinach', 'squash', 'zucchini', 'apple', 'banana', 'grape', 
+    'lemon', 'lime', 'orange', 'peach', 'pear', 'strawberry', 'watermelon',
+    'pod', 'seed', 'grain', 'bean', 'soy', 'nut', 'berry', 'food',
+    'fungus', 'mushroom', 'bark', 'forest', 'wild', 'nature'
+]
+
+# Runs the vision stages of concurrent diagnoses side by side
+_vision_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hf-vision")
+
+
+def prepare_image(image: Union[str, bytes]) -> Union[str, bytes]:
+    """
+    Decode a local image once and re-encode it at the models' 224x224 input size,
+    so the upload is a few KB instead of the original photo. URLs pass through unchanged,
+    and so do copies already produced by the upload pipeline (app/core/image_pipeline.py).
+    """
+    if isinstance(image, str) and image.startswith(("http://", "https://")):
+        return image
+    try:
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                image = f.read()
+        with Image.open(BytesIO(image)) as img:
+            if img.format == "JPEG" and img.size == VISION_INPUT_SIZE:
+                return image
+            img.draft("RGB", VISION_INPUT_SIZE)  # JPEG: decode at reduced scale
+            return model_input(img)
+    except Exception as e:
+        print(f"⚠️ Could not resize image ({e}); sending it as-is")
+        return image
+
 
 class HuggingFaceService:
     """Centralized Hugging Face AI service"""
@@ -38,22 +94,12 @@ class HuggingFaceService:
         """
         Generate text using LiteLLM (Unified Interface)
         Supports Hugging Face, OpenAI, Gemini, etc.
+        Models are tried healthiest-first; ones that failed recently are skipped (see llm_gateway).
         """
-        # Model priority list (for Hugging Face via LiteLLM)
-        models_to_try = [
-            "huggingface/meta-llama/Llama-3.1-8B-Instruct",
-            "huggingface/HuggingFaceH4/zephyr-7b-beta",
-            "huggingface/google/gemma-2-9b-it",
-            "huggingface/microsoft/Phi-3-mini-4k-instruct",
-        ]
-        
         if model:
             # Add prefix if missing
             if not model.startswith("huggingface/") and "/" in model:
                  model = f"huggingface/{model}"
-            
-            if model not in models_to_try:
-                models_to_try.insert(0, model)
         
         last_error = None
         
@@ -61,34 +107,23 @@ class HuggingFaceService:
             from app.core.llm_service import get_llm_service
             llm_service = get_llm_service()
             
-            # Try models in order
-            for model_name in models_to_try:
-                try:
-                    print(f"🤖 Trying model via LiteLLM: {model_name}")
-                    
-                    messages = [{"role": "user", "content": prompt}]
-                    
-                    # Call LiteLLM
-                    response = llm_service.completion(
-                        model=model_name,
-                        messages=messages,
-                        max_tokens=1500,
-                        temperature=0.7,
-                        # Pass API key explicitly if needed for HF, though LLMService handles ENV
-                        api_key=self.api_key if self.api_key else None
-                    )
-                    
-                    # Extract text
-                    generated_text = response.choices[0].message.content
-                    
-                    print(f"✅ Success with model: {model_name}")
-                    return generated_text
-                    
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    print(f"⚠️ {model_name} failed: {str(e)[:100]}...")
-                    last_error = e
-                    continue
+            # An explicitly requested model goes first, the rest by recent latency/error rate
+            models_to_try = ([model] if model else []) + llm_gateway.rank([m for m in HF_TEXT_MODELS if m != model])
+            try:
+                print(f"🤖 Trying models via LiteLLM: {', '.join(models_to_try)}")
+                response = llm_service.complete_any(
+                    models_to_try,
+                    [{"role": "user", "content": prompt}],
+                    max_tokens=1500,
+                    temperature=0.7,
+                    rank=False,
+                    # Pass API key explicitly if needed for HF, though LLMService handles ENV
+                    api_key=self.api_key if self.api_key else None
+                )
+                return response.choices[0].message.content
+            except Exception as e:
+                print(f"⚠️ Hugging Face models failed: {str(e)[:200]}...")
+                last_error = e
             
             # If all HF models fail, try fallback to Gemini if configured
             try:
@@ -105,78 +140,62 @@ class HuggingFaceService:
 
         raise Exception(f"All available models failed. Last error: {last_error}")
 
-    def analyze_image(self, image_path: str, question: str, model: str = None) -> str:
-        """
-        Analyze image using Hugging Face Vision models (Hybrid Strategy)
-        1. Try Captioning (BLIP Base - fast/free)
-        2. Fallback to Classification (ViT - extremely reliable)
-        3. Pass insights to LLM for final diagnosis
-        """
-        if not self.is_available():
-            raise ValueError("Hugging Face not available")
-            
-        print(f"🔬 Analyzing image with Hugging Face Vision AI")
-        
-        # Strategy 0: Crop Validation (General ViT)
-        is_val_passed = False
-        validation_warning = ""
+    def _validate_crop(self, image: Union[bytes, str]) -> Tuple[bool, str]:
+        """Generic ViT check that the photo shows a plant; returns (passed, warning)"""
         detected_generics = []
-        
         try:
-            val_model = "google/vit-base-patch16-224"
-            print(f"🔍 Validating image with {val_model}")
-            
-            # Pass image path/URL directly
-            response = self.client.image_classification(
-                image=image_path,
-                model=val_model
-            )
-            
-            # Expanded Keywords indicating valid crop/plant
-            plant_keywords = [
-                'plant', 'tree', 'flower', 'vegetable', 'fruit', 'crop', 'leaf', 
-                'agriculture', 'garden', 'grass', 'herb', 'shrub', 'wheat', 'corn', 
-                'rice', 'potato', 'tomato', 'pepper', 'stem', 'root', 'botanical',
-                'broccoli', 'cabbage', 'carrot', 'cucumber', 'eggplant', 'lettuce', 
-                'onion', 'spinach', 'squash', 'zucchini', 'apple', 'banana', 'grape', 
-                'lemon', 'lime', 'orange', 'peach', 'pear', 'strawberry', 'watermelon',
-                'pod', 'seed', 'grain', 'bean', 'soy', 'nut', 'berry', 'food',
-                'fungus', 'mushroom', 'bark', 'forest', 'wild', 'nature'
-            ]
+            print(f"🔍 Validating image with {VALIDATION_MODEL}")
+            response = llm_gateway.call(VALIDATION_MODEL, self.client.image_classification, image=image, model=VALIDATION_MODEL)
             
             # Check top 5 labels
             for item in response[:5]:
                 label_lower = item.label.lower()
                 detected_generics.append(f"{item.label}")
                 
-                if any(kw in label_lower for kw in plant_keywords):
-                    is_val_passed = True
-                    break
+                if any(kw in label_lower for kw in PLANT_KEYWORDS):
+                    print(f"✅ Crop Validation: PASSED ({item.label})")
+                    return True, ""
             
-            if not is_val_passed:
-                validation_warning = f"Generic model detected: {', '.join(detected_generics[:3])}"
-                print(f"⚠️ Validation Warning: {validation_warning}")
-            else:
-                print(f"✅ Crop Validation: PASSED ({detected_generics[0]})")
+            validation_warning = f"Generic model detected: {', '.join(detected_generics[:3])}"
+            print(f"⚠️ Validation Warning: {validation_warning}")
+            return False, validation_warning
             
         except Exception as e:
             print(f"⚠️ Validation failed: {e}. Proceeding cautiously.")
-            is_val_passed = True # Fail open checked later
+            return True, ""  # Fail open
+
+    def analyze_image(self, image_path: Union[str, bytes], question: str, model: str = None) -> str:
+        """
+        Analyze image using Hugging Face Vision models (Hybrid Strategy)
+        1. Plant disease classification (MobileNet) on one 224x224 copy of the image
+        2. Crop validation (ViT) only runs when the classifier is unsure (< MIN_DISEASE_CONFIDENCE);
+           if classification takes longer than VALIDATION_START_DELAY, validation is started
+           alongside it so a slow classifier does not serialize the two calls
+        3. Pass insights to LLM for final diagnosis
+        """
+        if not self.is_available():
+            raise ValueError("Hugging Face not available")
             
-        # We DO NOT return here anymore. We let the specialized model verify.
+        print(f"🔬 Analyzing image with Hugging Face Vision AI")
+        
+        # Decode and shrink once; both models receive the same small JPEG
+        image = prepare_image(image_path)
+        
+        class_future = _vision_executor.submit(
+            llm_gateway.call, DISEASE_MODEL, self.client.image_classification, image=image, model=DISEASE_MODEL
+        )
+        # A confident image never pays for the validation call; a slow classifier gets it in parallel
+        validation_future = None
+        if not wait([class_future], timeout=VALIDATION_START_DELAY).done:
+            validation_future = _vision_executor.submit(self._validate_crop, image)
         
         vision_context = ""
         max_disease_conf = 0.0
 
         # Strategy 1: Plant Disease Classification (Specialized Model)
         try:
-            class_model = "linkanjarad/mobilenet_v2_1.0_224-plant-disease-identification"
-            print(f"🔄 Strategy 1: Classification with {class_model}")
-            
-            response = self.client.image_classification(
-                image=image_path,
-                model=class_model
-            )
+            print(f"🔄 Strategy 1: Classification with {DISEASE_MODEL}")
+            response = class_future.result()
             
             # Extract top labels
             labels = []
@@ -191,10 +210,19 @@ class HuggingFaceService:
             
             # FINAL VALIDATION CHECK
             # If generic validation failed AND specialized model is also unsure (< 0.2), then it's not a crop.
-            if not is_val_passed and max_disease_conf < 0.2:
-                 return f"NOT_A_CROP_ERROR: The image does not appear to be a crop. {validation_warning}. Specialized model confidence low ({max_disease_conf:.2f})."
+            if max_disease_conf >= MIN_DISEASE_CONFIDENCE:
+                if validation_future is not None:
+                    validation_future.cancel()  # Obviously a crop: stop waiting for validation
+            else:
+                if validation_future is None:
+                    validation_future = _vision_executor.submit(self._validate_crop, image)
+                is_val_passed, validation_warning = validation_future.result()
+                if not is_val_passed:
+                    return f"NOT_A_CROP_ERROR: The image does not appear to be a crop. {validation_warning}. Specialized model confidence low ({max_disease_conf:.2f})."
             
         except Exception as e:
+            if validation_future is not None:
+                validation_future.cancel()
             print(f"❌ Classification failed: {e}")
             vision_context = f"Visual analysis failed. Assume standard visual symptoms for {question}."
 
@@ -0,0 +1,119 @@
+"""
+Upload Image Pipeline
+Decodes an uploaded photo once and stores the copies the rest of the app
+needs, so no later stage has to re-read or re-send the camera original.
+
+- <sha256>.jpg: the upload with EXIF orientation applied and all metadata
+  (GPS, camera serials) stripped, capped at IMAGE_MAX_DIMENSION
+- <sha256>_model.jpg: MODEL_INPUT_SIZE (224x224 RGB) copy handed to the
+  vision models, the local classifier and the LLM vision prompts
+- <sha256>_thumb.jpg: web thumbnail (longest side IMAGE_THUMBNAIL_SIZE)
+
+Files are named by the SHA-256 of the uploaded bytes, so uploading the same
+photo again reuses the stored copies without decoding it.
+"""
+import hashlib
+import os
+import uuid
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+MODEL_INPUT_SIZE: Tuple[int, int] = (224, 224)  # Input resolution of the vision models
+
+
+def _encode(image: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)  # No exif= argument: metadata is dropped
+    return buffer.getvalue()
+
+
+def _write(path: str, data: bytes):
+    """Atomic write: concurrent uploads of the same photo never see a half-written file"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def model_input(image: Image.Image) -> bytes:
+    """MODEL_INPUT_SIZE RGB JPEG of a decoded image"""
+    return _encode(image.convert("RGB").resize(MODEL_INPUT_SIZE, Image.BILINEAR), 90)
+
+
+def normalize(data: bytes) -> Dict[str, bytes]:
+    """Decode once; returns the stripped original, the model copy and the thumbnail as JPEG bytes"""
+    max_side = settings.IMAGE_MAX_DIMENSION
+    with Image.open(BytesIO(data)) as img:
+        img.draft("RGB", (max_side, max_side))  # JPEG: decode large photos at reduced scale
+        image = ImageOps.exif_transpose(img).convert("RGB")
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    thumbnail = image.copy()
+    thumbnail.thumbnail((settings.IMAGE_THUMBNAIL_SIZE, settings.IMAGE_THUMBNAIL_SIZE), Image.LANCZOS)
+    return {
+        "original": _encode(image, settings.IMAGE_JPEG_QUALITY),
+        "model": model_input(image),
+        "thumbnail": _encode(thumbnail, settings.IMAGE_JPEG_QUALITY),
+    }
+
+
+class ImageStore:
+    """Content-addressed image storage under one static/ directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.url_prefix = "/" + directory.strip("/")
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, digest: str) -> Dict[str, str]:
+        base = os.path.join(self.directory, digest)
+        return {"original": f"{base}.jpg", "model": f"{base}_model.jpg", "thumbnail": f"{base}_thumb.jpg"}
+
+    def save(self, data: bytes) -> Dict[str, Any]:
+        """
+        Store an upload; returns {"sha256", "image_url", "model_url", "thumbnail_url", "model"}
+        where "model" is the model copy's bytes. Raises ValueError for unreadable images.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        paths = self._paths(digest)
+        if all(os.path.exists(path) for path in paths.values()):
+            with open(paths["model"], "rb") as f:
+                model = f.read()
+        else:
+            try:
+                copies = normalize(data)
+            except Exception as e:
+                raise ValueError(f"Unreadable image: {e}")
+            for key, path in paths.items():
+                _write(path, copies[key])
+            model = copies["model"]
+        return {
+            "sha256": digest,
+            "image_url": f"{self.url_prefix}/{digest}.jpg",
+            "model_url": f"{self.url_prefix}/{digest}_model.jpg",
+            "thumbnail_url": f"{self.url_prefix}/{digest}_thumb.jpg",
+            "model": model,
+        }
+
+    @staticmethod
+    def model_copy(image_url: str) -> Optional[bytes]:
+        """
+        Model-sized bytes for a stored image URL: the pipeline's _model.jpg when it
+        exists, otherwise the file decoded and resized (older uploads). None if unreadable.
+        """
+        local_path = image_url.lstrip("/") if image_url.startswith("/static/") else image_url
+        root, _ = os.path.splitext(local_path)
+        try:
+            with open(f"{root}_model.jpg", "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+        try:
+            with Image.open(local_path) as img:
+                img.draft("RGB", MODEL_INPUT_SIZE)
+                return model_input(ImageOps.exif_transpose(img))
+        except Exception:
+            return None
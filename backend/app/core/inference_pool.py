@@ -0,0 +1,330 @@
+"""
+Inference Worker Pool
+Runs local model inference (Whisper, Flan-T5) in dedicated worker processes
+instead of inside the request handler.
+
+Each pool owns N spawned processes that share one request queue. A worker
+takes the next request, then keeps collecting for up to batch_wait seconds
+(or until max_batch requests) and runs them through the model as one batch.
+The model is loaded once per worker process through the model_manager, so
+web threads never hold it and never block on CPU inference; they wait on a
+Future instead (or await it from async code).
+
+Handlers are referenced as "module:function" so the spawned processes can
+import them; a handler takes a list of payloads and returns one result per
+payload. Per-request timings (queue wait, inference, batch size) are kept
+for get_stats().
+
+With INFERENCE_POOL_ENABLED=false the handler runs in-process (one request
+per batch), which is handy for development and debugging.
+"""
+import asyncio
+import importlib
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.model_manager import model_manager
+
+
+class InferenceError(Exception):
+    pass
+
+
+class InferenceBusy(InferenceError):
+    """Raised when max_pending requests are already waiting"""
+
+
+def _resolve(handler_path: str) -> Callable[[List[Any]], List[Any]]:
+    module_name, func_name = handler_path.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _worker_main(handler_path: str, model_name: Optional[str], max_batch: int, batch_wait: float,
+                 warm: bool, request_q, result_q):
+    """Worker process loop: collect a batch, run it, report each result"""
+    handler = _resolve(handler_path)
+    if warm and model_name:
+        model_manager.get(model_name)
+    model_manager.start()  # Idle unload applies inside the worker too
+
+    stopping = False
+    while not stopping:
+        item = request_q.get()
+        if item is None:
+            break
+        batch = [item]
+        deadline = time.time() + batch_wait
+        while len(batch) < max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = request_q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        started = time.time()
+        try:
+            outputs = handler([payload for _, payload, _ in batch])
+            errors = [None] * len(batch)
+        except Exception as e:
+            outputs = [None] * len(batch)
+            errors = [f"{type(e).__name__}: {e}"] * len(batch)
+        finished = time.time()
+        for (request_id, _, submitted_at), output, error in zip(batch, outputs, errors):
+            result_q.put((request_id, output, error, {
+                "queue_ms": (started - submitted_at) * 1000,
+                "inference_ms": (finished - started) * 1000,
+                "batch_size": len(batch),
+            }))
+
+
+class InferencePool:
+    def __init__(
+        self,
+        name: str,
+        handler_path: str,
+        model_name: Optional[str] = None,
+        workers: int = 1,
+        max_batch: int = 8,
+        batch_wait: float = 0.02,
+        max_pending: int = 64,
+        timeout: float = 60.0,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.handler_path = handler_path
+        self.model_name = model_name
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.enabled = enabled
+
+        self._ctx = multiprocessing.get_context("spawn")  # fork is unsafe once torch has threads
+        self._request_q = None
+        self._result_q = None
+        self._processes: List[Any] = []
+        self._futures: Dict[int, Future] = {}
+        self._submitted_at: Dict[int, float] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+        self._running = False
+        self._local_handler: Optional[Callable] = None
+
+        self._timings: Deque[Dict[str, float]] = deque(maxlen=500)
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timeouts": 0, "restarts": 0}
+
+    # ============ Lifecycle ============
+
+    def start(self, warm: bool = False):
+        with self._lock:
+            if self._running or not self.enabled:
+                return
+            self._request_q = self._ctx.Queue()
+            self._result_q = self._ctx.Queue()
+            self._processes = [self._spawn(warm) for _ in range(self.workers)]
+            self._running = True
+        self._collector = threading.Thread(target=self._collect, name=f"inference-{self.name}", daemon=True)
+        self._collector.start()
+        print(f"[OK] Inference pool '{self.name}' started with {self.workers} worker(s)")
+
+    def _spawn(self, warm: bool):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.handler_path, self.model_name, self.max_batch, self.batch_wait, warm, self._request_q, self._result_q),
+            name=f"inference-{self.name}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            processes, self._processes = self._processes, []
+        for _ in processes:
+            self._request_q.put(None)
+        for process in processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            futures, self._futures = self._futures, {}
+            self._submitted_at.clear()
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(InferenceError(f"Inference pool '{self.name}' stopped"))
+
+    def _collect(self):
+        """Resolve futures from worker results; restart workers that died"""
+        while self._running:
+            try:
+                request_id, output, error, timing = self._result_q.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._futures.pop(request_id, None)
+                submitted_at = self._submitted_at.pop(request_id, None)
+                if submitted_at is not None:
+                    timing["total_ms"] = (time.time() - submitted_at) * 1000
+                    self._timings.append(timing)
+                self._stats["failed" if error else "completed"] += 1
+            if future is None or future.done():
+                continue  # Caller already timed out
+            if error:
+                future.set_exception(InferenceError(error))
+            else:
+                future.set_result(output)
+
+    def _check_workers(self):
+        with self._lock:
+            if not self._running:
+                return
+            for i, process in enumerate(self._processes):
+                if not process.is_alive():
+                    print(f"[WARNING] Inference worker '{self.name}' exited ({process.exitcode}); restarting")
+                    self._processes[i] = self._spawn(warm=False)
+                    self._stats["restarts"] += 1
+
+    # ============ Requests ============
+
+    def submit(self, payload: Any) -> Future:
+        """Queue one request; the Future resolves to the handler's result for it"""
+        if not self.enabled:
+            future: Future = Future()
+            try:
+                if self._local_handler is None:
+                    self._local_handler = _resolve(self.handler_path)
+                future.set_result(self._local_handler([payload])[0])
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if not self._running:
+            self.start()
+        future = Future()
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise InferenceBusy(f"Inference pool '{self.name}' has {self.max_pending} requests pending")
+            request_id = next(self._ids)
+            self._futures[request_id] = future
+            self._submitted_at[request_id] = time.time()
+            self._stats["submitted"] += 1
+        self._request_q.put((request_id, payload, time.time()))
+        return future
+
+    def run(self, payload: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking submit; raises InferenceError / TimeoutError"""
+        future = self.submit(payload)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            self._abandon(future)
+            raise
+
+    async def arun(self, payload: Any, timeout: Optional[float] = None) -> Any:
+        """Await a result without blocking the event loop"""
+        future = self.submit(payload)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            raise
+
+    def _abandon(self, future: Future):
+        with self._lock:
+            self._stats["timeouts"] += 1
+            for request_id, pending in list(self._futures.items()):
+                if pending is future:
+                    del self._futures[request_id]
+                    self._submitted_at.pop(request_id, None)
+                    break
+
+    # ============ Metrics ============
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> Optional[float]:
+        if not values:
+            return None
+        values = sorted(values)
+        return round(values[min(int(len(values) * pct), len(values) - 1)], 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            timings = list(self._timings)
+            stats["pending"] = len(self._futures)
+            stats["workers_alive"] = sum(1 for p in self._processes if p.is_alive())
+        stats.update({
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "max_batch": self.max_batch,
+            "avg_batch_size": round(sum(t["batch_size"] for t in timings) / len(timings), 2) if timings else None,
+        })
+        for key in ("queue_ms", "inference_ms", "total_ms"):
+            values = [t[key] for t in timings if key in t]
+            stats[f"{key}_p50"] = self._percentile(values, 0.5)
+            stats[f"{key}_p95"] = self._percentile(values, 0.95)
+        return stats
+
+
+_pools: Dict[str, InferencePool] = {}
+
+
+def create_pool(name: str, handler_path: str, model_name: Optional[str] = None, workers: int = 1) -> InferencePool:
+    """Create (or return) a named pool configured from the INFERENCE_* settings"""
+    pool = _pools.get(name)
+    if pool is None:
+        pool = _pools[name] = InferencePool(
+            name,
+            handler_path,
+            model_name=model_name,
+            workers=workers,
+            max_batch=settings.INFERENCE_MAX_BATCH,
+            batch_wait=settings.INFERENCE_BATCH_WAIT_MS / 1000,
+            max_pending=settings.INFERENCE_MAX_PENDING,
+            timeout=settings.INFERENCE_TIMEOUT,
+            enabled=settings.INFERENCE_POOL_ENABLED,
+        )
+    return pool
+
+
+def warm_up(model_names: List[str]) -> List[str]:
+    """Start the pools serving these models with a preloaded model; returns the names no pool serves"""
+    remaining = []
+    for name in model_names:
+        pools = [p for p in _pools.values() if p.enabled and p.model_name == name]
+        for pool in pools:
+            pool.start(warm=True)
+        if not pools:
+            remaining.append(name)
+    return remaining
+
+
+def get_inference_stats() -> Dict[str, Any]:
+    return {name: pool.get_stats() for name, pool in _pools.items()}
+
+
+def stop_all():
+    for pool in _pools.values():
+        pool.stop()
@@ -0,0 +1,355 @@
+"""
+LLM Gateway
+Process-wide admission control and health tracking for remote LLM calls.
+
+Every provider call (LiteLLM, the local Flan-T5 pool, Ollama) goes through
+one gateway instance so a slow or broken model costs one timeout, not one
+per request:
+
+- circuit breaker per model: LLM_BREAKER_FAILURES consecutive failures open
+  it for LLM_BREAKER_COOLDOWN seconds (calls are skipped instantly), then a
+  single probe call decides whether it closes again
+- concurrency limit: at most LLM_MAX_CONCURRENCY calls in flight; callers
+  wait up to LLM_QUEUE_TIMEOUT for a slot, then get LLMBusy
+- latency/error histogram per model, used by rank() to put healthy, fast
+  models first in a fallback chain
+- hedged requests: for latency-sensitive calls, if the first model has not
+  answered after its p95 latency (LLM_HEDGE_DELAY until known) the next
+  model is started in parallel and the first answer wins
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class LLMError(Exception):
+    pass
+
+
+class CircuitOpen(LLMError):
+    """Raised instead of calling a model whose breaker is open"""
+
+
+class LLMBusy(LLMError):
+    """Raised when no concurrency slot frees up within LLM_QUEUE_TIMEOUT"""
+
+
+class LLMUnavailable(LLMError):
+    """Every model in a chain failed or was skipped"""
+
+    def __init__(self, errors: Dict[str, str]):
+        self.errors = errors
+        detail = "; ".join(f"{model}: {error[:200]}" for model, error in errors.items())
+        super().__init__(f"All models failed ({detail or 'empty chain'})")
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = 3, cooldown: float = 60.0):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def is_open(self) -> bool:
+        """True while calls would be skipped (half-open with a probe already out counts as open)"""
+        state = self.state
+        return state == "open" or (state == "half_open" and self._probing)
+
+    def allow(self) -> bool:
+        """Claim permission for one call; in half-open state only one probe is let through"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a probe claimed by allow() that never ran"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.consecutive_failures = 0
+                self.opened_at = None
+                return
+            self.consecutive_failures += 1
+            if self.opened_at is not None or self.consecutive_failures >= self.failures:
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.time()  # A failed probe restarts the cooldown
+
+
+class _ModelStats:
+    def __init__(self, window: int):
+        self.recent: Deque[Tuple[float, bool]] = deque(maxlen=window)  # (latency_ms, ok)
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.calls = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def add(self, latency_ms: float, ok: bool, error: Optional[str] = None):
+        self.recent.append((latency_ms, ok))
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.calls += 1
+        if not ok:
+            self.failures += 1
+            self.last_error = error
+
+    def error_rate(self) -> float:
+        if not self.recent:
+            return 0.0
+        return sum(1 for _, ok in self.recent if not ok) / len(self.recent)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        latencies = sorted(ms for ms, ok in self.recent if ok)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * pct), len(latencies) - 1)]
+
+    def score(self) -> Optional[float]:
+        """Expected milliseconds until an answer (median latency / success rate); None if unmeasured"""
+        p50 = self.percentile(0.5)
+        if p50 is None:
+            return None if not self.recent else float("inf")
+        return p50 / max(1.0 - self.error_rate(), 0.05)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        queue_timeout: float = 10.0,
+        breaker_failures: int = 3,
+        breaker_cooldown: float = 60.0,
+        hedge_delay: float = 2.0,
+        window: int = 200,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.hedge_delay = hedge_delay  # Seconds before hedging while a model has no p95 yet
+        self.window = window
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._models: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"calls": 0, "busy": 0, "short_circuited": 0, "hedged": 0, "hedge_wins": 0}
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(model, CircuitBreaker(self.breaker_failures, self.breaker_cooldown))
+        return breaker
+
+    def _model_stats(self, model: str) -> _ModelStats:
+        stats = self._models.get(model)
+        if stats is None:
+            with self._lock:
+                stats = self._models.setdefault(model, _ModelStats(self.window))
+        return stats
+
+    # ============ Single call ============
+
+    def call(self, model: str, fn: Callable[..., Any], /, *args, **kwargs) -> Any:
+        """Run fn for one model under its breaker and the concurrency limit, recording the outcome"""
+        breaker = self._breaker(model)
+        if not breaker.allow():
+            with self._lock:
+                self._stats["short_circuited"] += 1
+            raise CircuitOpen(f"{model} skipped: circuit open after {breaker.consecutive_failures} failures")
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            breaker.release()
+            with self._lock:
+                self._stats["busy"] += 1
+            raise LLMBusy(f"{self.max_concurrency} LLM calls already in flight")
+
+        with self._lock:
+            self._in_flight += 1
+            self._stats["calls"] += 1
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._finish(model, breaker, started, e)
+            raise
+        self._finish(model, breaker, started, None)
+        return result
+
+    def _finish(self, model: str, breaker: CircuitBreaker, started: float, error: Optional[Exception]):
+        latency_ms = (time.perf_counter() - started) * 1000
+        self._slots.release()
+        breaker.record(error is None)
+        stats = self._model_stats(model)
+        with self._lock:
+            self._in_flight -= 1
+            stats.add(latency_ms, error is None, str(error) if error else None)
+        if error is not None and breaker.state == "open" and breaker.consecutive_failures == self.breaker_failures:
+            print(f"[WARNING] LLM circuit opened for {model} ({self.breaker_cooldown:.0f}s): {str(error)[:100]}")
+
+    # ============ Fallback chains ============
+
+    def rank(self, models: List[str]) -> List[str]:
+        """
+        Order a fallback chain: closed breakers first, then by expected time to
+        an answer; unmeasured models keep their configured order after measured ones
+        """
+        def key(item):
+            index, model = item
+            stats, breaker = self._models.get(model), self._breakers.get(model)
+            score = stats.score() if stats else None
+            return (bool(breaker and breaker.is_open()), score is None, score or 0.0, index)
+
+        return [model for _, model in sorted(enumerate(models), key=key)]
+
+    def first_success(
+        self,
+        models: List[str],
+        fn: Callable[[str], Any],
+        hedge: bool = False,
+        rank: bool = True,
+    ) -> Any:
+        """
+        Call fn(model) down the chain until one succeeds. With hedge=True a slow
+        first attempt is raced against the next model (only if a slot is free).
+        """
+        chain = self.rank(models) if rank else list(dict.fromkeys(models))
+        errors: Dict[str, str] = {}
+        if not hedge:
+            for model in chain:
+                try:
+                    return self.call(model, fn, model)
+                except LLMBusy:
+                    raise
+                except Exception as e:
+                    errors[model] = str(e)
+            raise LLMUnavailable(errors)
+        return self._hedged(chain, fn, errors)
+
+    def _hedged(self, chain: List[str], fn: Callable[[str], Any], errors: Dict[str, str]) -> Any:
+        executor = self._get_executor()
+        remaining = iter(chain)
+        pending: Dict[Any, str] = {}
+
+        def launch() -> Optional[str]:
+            for model in remaining:
+                breaker = self._breakers.get(model)
+                if breaker is not None and breaker.is_open():
+                    errors[model] = "circuit open"
+                    continue
+                pending[executor.submit(self.call, model, fn, model)] = model
+                return model
+            return None
+
+        first = launch()
+        hedge_at = time.monotonic() + self._hedge_delay(first) if first else None
+        while pending:
+            timeout = None if hedge_at is None else max(hedge_at - time.monotonic(), 0.0)
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedge_at = None  # One hedge per request
+                with self._lock:
+                    has_capacity = self._in_flight < self.max_concurrency
+                if has_capacity and launch():
+                    with self._lock:
+                        self._stats["hedged"] += 1
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except LLMBusy:
+                    if not pending:
+                        raise
+                    continue
+                except Exception as e:
+                    errors[model] = str(e)
+                    continue
+                if model != first:
+                    with self._lock:
+                        self._stats["hedge_wins"] += 1
+                return result  # Losing attempts finish in the background and still feed the stats
+            if not pending:
+                launch()
+        raise LLMUnavailable(errors)
+
+    def _hedge_delay(self, model: str) -> float:
+        stats = self._models.get(model)
+        p95 = stats.percentile(0.95) if stats else None
+        return p95 / 1000 if p95 is not None else self.hedge_delay
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2, thread_name_prefix="llm-hedge")
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # ============ Metrics ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+            models = list(self._models.items())
+        stats["max_concurrency"] = self.max_concurrency
+        labels = [f"<={ms}ms" for ms in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        stats["models"] = {}
+        for model, model_stats in models:
+            breaker = self._breaker(model)
+            p50, p95 = model_stats.percentile(0.5), model_stats.percentile(0.95)
+            stats["models"][model] = {
+                "calls": model_stats.calls,
+                "failures": model_stats.failures,
+                "error_rate": round(model_stats.error_rate() * 100, 1),
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "histogram": dict(zip(labels, model_stats.histogram)),
+                "breaker": breaker.state,
+                "breaker_trips": breaker.trips,
+                "last_error": (model_stats.last_error or "")[:200] or None,
+            }
+        stats["ranking"] = self.rank([model for model, _ in models])
+        return stats
+
+
+llm_gateway = LLMGateway(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+    breaker_failures=settings.LLM_BREAKER_FAILURES,
+    breaker_cooldown=settings.LLM_BREAKER_COOLDOWN,
+    hedge_delay=settings.LLM_HEDGE_DELAY,
+)
@@ -1,61 +1,113 @@
 # DOCUMENTATION_SOURCE: README.md
 import os
+import httpx
 import litellm
 
 from typing import Optional, Dict, Any, List, Union
 from .config import settings
+from .model_manager import model_manager, module_available
+from .inference_pool import create_pool
+from .llm_gateway import LLMError, llm_gateway
 
 # Configure litellm
 # litellm.set_verbose = True # Uncomment for debugging
 
-# Hugging Face Transformers for local LLM
-try:
-    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
-    import torch
-    HF_AVAILABLE = True
+# Hugging Face Transformers for local LLM (imported on first use, see model_manager)
+HF_AVAILABLE = module_available("transformers", "torch")
+if HF_AVAILABLE:
     print("[OK] Hugging Face Transformers available")
-except ImportError:
-    HF_AVAILABLE = False
+else:
     print("[WARNING] Hugging Face Transformers not available. Install with: pip install transformers torch accelerate")
 
-# Lazy-load HF model
-_hf_pipeline = None
+HF_MODEL_NAME = "flan-t5-small"
+LOCAL_MODEL = f"local/{HF_MODEL_NAME}"  # Name of the Flan-T5 pool in fallback chains
+OLLAMA_FALLBACK_MODEL = "ollama/gemma3:1b"
 
-def get_hf_pipeline():
+
+def _load_flan_t5():
     """
     Load Hugging Face model for text generation (Flan-T5 Small - lightweight and effective)
     """
-    global _hf_pipeline
-    if _hf_pipeline is None and HF_AVAILABLE:
-        try:
-            print("[INFO] Loading Hugging Face model (google/flan-t5-small)... This may take a moment.")
-            device = "cuda:0" if torch.cuda.is_available() else "cpu"
-            
-            # Using Flan-T5 Small - good balance of size and capability
-            model_name = "google/flan-t5-small"
-            
-            # Flan-T5 is a seq2seq model, load it directly instead of using pipeline
-            tokenizer = AutoTokenizer.from_pretrained(model_name)
-            model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-            model.to(device)
-            
-            # Store both tokenizer and model
-            _hf_pipeline = {
-                "tokenizer": tokenizer,
-                "model": model,
-                "device": device
-            }
-            print(f"[OK] Flan-T5 loaded on {device}")
-        except Exception as e:
-            print(f"[ERROR] Failed to load HF model: {e}")
-            return None
-    return _hf_pipeline
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+    import torch
+
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+
+    # Using Flan-T5 Small - good balance of size and capability
+    model_name = "google/flan-t5-small"
+
+    # Flan-T5 is a seq2seq model, load it directly instead of using pipeline
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    model.to(device)
+
+    # Store both tokenizer and model
+    return {
+        "tokenizer": tokenizer,
+        "model": model,
+        "device": device
+    }
+
+
+model_manager.register(HF_MODEL_NAME, _load_flan_t5)
+
+
+def get_hf_pipeline():
+    """Flan-T5 tokenizer/model/device, loaded on first call; None if unavailable"""
+    if not HF_AVAILABLE:
+        return None
+    return model_manager.get(HF_MODEL_NAME)
+
+
+def generate_batch(requests: List[Dict[str, Any]]) -> List[str]:
+    """
+    Inference pool handler: run Flan-T5 over a batch of
+    {"prompt", "max_tokens", "temperature"} requests (padded, one generate() per setting)
+    """
+    hf_model = get_hf_pipeline()
+    if not hf_model:
+        raise Exception("HF pipeline not available")
+    tokenizer = hf_model["tokenizer"]
+    model = hf_model["model"]
+    device = hf_model["device"]
+
+    groups: Dict[tuple, List[int]] = {}
+    for i, req in enumerate(requests):
+        groups.setdefault((req["max_tokens"], req["temperature"]), []).append(i)
+
+    results: List[str] = [""] * len(requests)
+    for (max_tokens, temperature), indexes in groups.items():
+        inputs = tokenizer(
+            [requests[i]["prompt"] for i in indexes],
+            return_tensors="pt", max_length=512, truncation=True, padding=True,
+        ).to(device)
+        outputs = model.generate(
+            **inputs,
+            max_length=max_tokens,
+            temperature=temperature,
+            do_sample=True,
+            top_p=0.95,
+            num_return_sequences=1
+        )
+        for i, text in zip(indexes, tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+            results[i] = text
+    return results
+
+
+# Flan-T5 runs in its own worker process(es), so requests never block on CPU inference
+hf_pool = create_pool(
+    HF_MODEL_NAME, "app.core.llm_service:generate_batch", model_name=HF_MODEL_NAME,
+    workers=settings.INFERENCE_T5_WORKERS,
+)
 
 class LLMService:
     """
     Unified LLM Service using LiteLLM with Hugging Face fallback.
     Supports OpenAI, Azure, Anthropic, Gemini, HuggingFace, Ollama, etc.
     Falls back to local Hugging Face models when API calls fail.
+
+    Every call goes through the process-wide llm_gateway (circuit breakers,
+    concurrency limit, hedging); use get_llm_service() for the shared instance.
     """
     
     def __init__(self):
@@ -73,84 +125,79 @@ class LLMService:
                 os.environ["GOOGLE_API_KEY"] = settings.VERTEX_API_KEY
             
         # Add other keys as needed
-        
+
+        # One pooled HTTP client for providers that honour it (OpenAI-compatible APIs, Ollama)
+        if litellm.client_session is None:
+            litellm.client_session = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONCURRENCY,
+                    max_keepalive_connections=settings.LLM_MAX_CONCURRENCY,
+                ),
+                timeout=settings.LLM_TIMEOUT,
+            )
+
+    def fallback_models(self) -> List[str]:
+        """Local fallbacks, healthiest first"""
+        models = [LOCAL_MODEL] if HF_AVAILABLE else []
+        return llm_gateway.rank(models + [OLLAMA_FALLBACK_MODEL])
+
     def completion(
         self, 
         model: str, 
         messages: List[Dict[str, str]], 
         temperature: float = 0.7, 
         max_tokens: int = 1000,
+        hedge: bool = False,
         **kwargs
     ) -> Any:
-        try:
-            response = litellm.completion(
-                model=model,
+        """
+        Call `model`, falling back to the local Hugging Face model and Ollama.
+        hedge=True (latency-sensitive callers) races a fallback against a slow primary.
+        """
+        if model == "local":
+            model = LOCAL_MODEL
+        chain = [model] + [m for m in self.fallback_models() if m != model]
+        return self.complete_any(chain, messages, temperature, max_tokens, hedge=hedge, rank=False, **kwargs)
+
+    def complete_any(
+        self,
+        models: List[str],
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        hedge: bool = False,
+        rank: bool = True,
+        **kwargs
+    ) -> Any:
+        """First successful completion from a chain of models (ranked by recent health unless rank=False)"""
+        kwargs.setdefault("timeout", settings.LLM_TIMEOUT)
+
+        def _call(model_name: str) -> Any:
+            if model_name == LOCAL_MODEL:
+                return self._hf_completion(messages, temperature, max_tokens)
+            return litellm.completion(
+                model=model_name,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 **kwargs
             )
-            return response
-        except Exception as e:
-            print(f"Error calling LLM ({model}): {str(e)}")
-            
-            # Try Hugging Face local model first (no API needed)
-            if HF_AVAILABLE:
-                try:
-                    print(f"Attempting fallback to local Hugging Face model")
-                    return self._hf_completion(messages, temperature, max_tokens)
-                except Exception as hf_error:
-                    print(f"Hugging Face fallback failed: {hf_error}")
-            
-            # Fallback to local Ollama
-            fallback_model = "ollama/gemma3:1b"
-            if model != fallback_model:
-                try:
-                    print(f"Attempting fallback to local Ollama: {fallback_model}")
-                    response = litellm.completion(
-                        model=fallback_model,
-                        messages=messages,
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        **kwargs
-                    )
-                    return response
-                except Exception as fallback_error:
-                    print(f"Fallback to {fallback_model} also failed: {fallback_error}")
-                    # Raise the original error to show what went wrong initially
-                    raise e
-            else:
-                raise e
+
+        try:
+            return llm_gateway.first_success(models, _call, hedge=hedge, rank=rank)
+        except LLMError as e:
+            print(f"Error calling LLM ({', '.join(models)}): {e}")
+            raise
 
     def _hf_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Any:
         """
         Use Hugging Face model for completion (local inference)
         """
-        hf_model = get_hf_pipeline()
-        if not hf_model:
-            raise Exception("HF pipeline not available")
-        
         # Convert messages to single prompt
         prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
         
-        # Tokenize and generate
-        tokenizer = hf_model["tokenizer"]
-        model = hf_model["model"]
-        device = hf_model["device"]
-        
-        inputs = tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True).to(device)
-        
-        # Generate response
-        outputs = model.generate(
-            **inputs,
-            max_length=max_tokens,
-            temperature=temperature,
-            do_sample=True,
-            top_p=0.95,
-            num_return_sequences=1
-        )
-        
-        response_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # Generate in the inference pool (batched with other requests)
+        response_text = hf_pool.run({"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature})
         
         # Mock LiteLLM response structure
         class MockChoice:
@@ -163,53 +210,21 @@ class LLMService:
         
         return MockResponse(response_text)
 
-    def generate_text(self, prompt: str, model: str = "gpt-3.5-turbo", **kwargs) -> str:
+    def generate_text(self, prompt: str, model: str = "gpt-3.5-turbo", hedge: bool = False, **kwargs) -> str:
         """
         Simple text generation helper with Hugging Face fallback.
         """
-        # Try API models first
-        try:
-            messages = [{"role": "user", "content": prompt}]
-            response = self.completion(model=model, messages=messages, **kwargs)
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"API generation failed: {e}")
-            
-            # Fallback to local HF model
-            if HF_AVAILABLE:
-                try:
-                    print("Using local Hugging Face model for text generation")
-                    hf_model = get_hf_pipeline()
-                    if hf_model:
-                        tokenizer = hf_model["tokenizer"]
-                        model_obj = hf_model["model"]
-                        device = hf_model["device"]
-                        
-                        inputs = tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True).to(device)
-                        outputs = model_obj.generate(
-                            **inputs,
-                            max_length=kwargs.get('max_tokens', 512),
-                            do_sample=True,
-                            temperature=0.7,
-                            top_p=0.95
-                        )
-                        return tokenizer.decode(outputs[0], skip_special_tokens=True)
-                except Exception as hf_error:
-                    print(f"HF generation failed: {hf_error}")
-            
-            # If all fails, raise original error
-            raise e
+        messages = [{"role": "user", "content": prompt}]
+        response = self.completion(model=model, messages=messages, hedge=hedge, **kwargs)
+        return response.choices[0].message.content
 
     def embedding(self, model: str, input: Union[str, List[str]], **kwargs) -> Any:
         """
         Generate embeddings.
         """
         try:
-            response = litellm.embedding(
-                model=model,
-                input=input,
-                **kwargs
-            )
+            kwargs.setdefault("timeout", settings.LLM_TIMEOUT)
+            response = llm_gateway.call(model, litellm.embedding, model=model, input=input, **kwargs)
             return response
         except Exception as e:
              print(f"Error generating embedding ({model}): {str(e)}")
@@ -218,5 +233,11 @@ class LLMService:
 # specific providers for easier access
 # You can customize defaults here
 
+_llm_service = None
+
 def get_llm_service() -> LLMService:
-    return LLMService()
+    """Get or create the shared LLM service instance"""
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
@@ -0,0 +1,313 @@
+"""
+Versioned Schema Migrations
+Replaces the import-time create_all and the ALTER-everything-on-every-boot
+routine that used to live in main.py.
+
+- Applied steps are recorded in the schema_migrations table. Startup reads
+  that table once and skips every recorded version with a set lookup, so a
+  fully migrated database costs a single SELECT.
+- create_all only runs when the set of mapped tables changes (keyed by a
+  fingerprint of Base.metadata), not on every import.
+- Column additions inspect the table once and only ALTER what is missing,
+  which works the same on PostgreSQL and SQLite.
+- Unique-ID backfills walk the NULL rows in id order, CHUNK rows at a time,
+  and assign each chunk with one set-based UPDATE (UPDATE ... FROM VALUES on
+  PostgreSQL, executemany elsewhere), committing per chunk so an interrupted
+  backfill resumes where it stopped.
+- On PostgreSQL an advisory lock serialises concurrent workers; the ones that
+  wait find everything already applied.
+
+Run out-of-band (e.g. before a deploy, with RUN_MIGRATIONS_ON_STARTUP=false):
+    python -m app.core.migrations
+"""
+import hashlib
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, bindparam, column, inspect, select, table, text, update, values,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.core import database
+from app.core.config import settings
+from app.core.id_generator import generate_alphanumeric_id, generate_numeric_id
+
+# Arbitrary constant for pg_advisory_lock so only one worker migrates at a time
+_MIGRATION_LOCK_KEY = 7_460_232
+
+_migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", String, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+    Column("duration_ms", Integer),
+)
+
+
+class Migration:
+    def __init__(self, version: str, description: str, apply: Callable[[Connection], None]):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: str, description: str):
+    """Register a step. Versions are applied in registration order and never re-run."""
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+    return decorator
+
+
+# ============ Helpers ============
+
+def add_columns(conn: Connection, table_name: str, column_defs: List[str]):
+    """ALTER TABLE ... ADD COLUMN for each definition whose column is missing"""
+    inspector = inspect(conn)
+    if not inspector.has_table(table_name):
+        return  # create_all builds new tables with every column already
+    existing = {col["name"] for col in inspector.get_columns(table_name)}
+    for col_def in column_defs:
+        if col_def.split()[0] not in existing:
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {col_def}"))
+
+
+def _unique_batch(generate: Callable[[int], str], count: int) -> List[str]:
+    ids = set()
+    while len(ids) < count:
+        ids.add(generate(12))
+    return list(ids)
+
+
+def _assign(conn: Connection, target, id_col: str, pairs: List[Tuple[int, str]]):
+    """Set id_col for every (row id, value) pair with a single statement"""
+    if conn.dialect.name == "postgresql":
+        data = values(column("rid", Integer), column("uid", String), name="v").data(pairs)
+        conn.execute(update(target).values({id_col: data.c.uid}).where(target.c.id == data.c.rid))
+    else:
+        conn.execute(
+            update(target).where(target.c.id == bindparam("rid")).values({id_col: bindparam("uid")}),
+            [{"rid": rid, "uid": uid} for rid, uid in pairs],
+        )
+
+
+def backfill_unique_ids(conn: Connection, table_name: str, id_col: str, numeric: bool, chunk_size: Optional[int] = None) -> int:
+    """Fill NULL unique IDs in chunks of set-based UPDATEs; returns rows updated"""
+    if not inspect(conn).has_table(table_name):
+        return 0
+    chunk_size = chunk_size or settings.MIGRATION_BACKFILL_CHUNK_SIZE
+    generate = generate_numeric_id if numeric else generate_alphanumeric_id
+    target = table(table_name, column("id", Integer), column(id_col, String))
+    conn.commit()
+
+    total, last_id = 0, None
+    while True:
+        query = select(target.c.id).where(target.c[id_col].is_(None)).order_by(target.c.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(target.c.id > last_id)
+        row_ids = conn.execute(query).scalars().all()
+        if not row_ids:
+            break
+        for attempt in range(3):
+            try:
+                with conn.begin_nested():
+                    _assign(conn, target, id_col, list(zip(row_ids, _unique_batch(generate, len(row_ids)))))
+                break
+            except IntegrityError:
+                if attempt == 2:  # Collided with an existing ID three times running
+                    raise
+        conn.commit()
+        total += len(row_ids)
+        last_id = row_ids[-1]
+    return total
+
+
+def _schema_fingerprint() -> str:
+    names = ",".join(sorted(database.Base.metadata.tables))
+    return hashlib.sha1(names.encode()).hexdigest()[:12]
+
+
+# ============ Steps ============
+
+@migration("0001_labor_jobs_filled_count", "labor_jobs.filled_count")
+def _labor_jobs(conn):
+    add_columns(conn, "labor_jobs", ["filled_count INTEGER DEFAULT 0"])
+
+
+@migration("0002_diagnosis_detail_columns", "Diagnosis cause/prevention/treatment columns")
+def _diagnosis_details(conn):
+    add_columns(conn, "diagnosis_logs", ["cause TEXT", "prevention TEXT", "treatment_organic TEXT", "treatment_chemical TEXT", "identified_crop VARCHAR"])
+
+
+@migration("0003_commercial_products", "commercial_products category/image_url")
+def _commercial_products(conn):
+    add_columns(conn, "commercial_products", ["category VARCHAR", "image_url VARCHAR"])
+
+
+@migration("0004_product_listings", "product_listings listing type, description, image, category, created_at")
+def _product_listings(conn):
+    add_columns(conn, "product_listings", [
+        "listing_type VARCHAR DEFAULT 'SELL'", "description TEXT", "image_url VARCHAR", "category VARCHAR",
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    ])
+
+
+@migration("0005_users_land_records", "users.survey_number/boundary")
+def _users(conn):
+    add_columns(conn, "users", ["survey_number VARCHAR", "boundary JSON"])
+
+
+@migration("0006_livestock_profile", "Livestock QR + profile columns")
+def _livestock(conn):
+    add_columns(conn, "livestock", [
+        "qr_code VARCHAR", "qr_created_at TIMESTAMP", "name VARCHAR", "gender VARCHAR DEFAULT 'Female'",
+        "purpose VARCHAR DEFAULT 'Dairy'", "origin VARCHAR DEFAULT 'BORN'", "source_details TEXT", "parent_id INTEGER",
+    ])
+
+
+@migration("0007_multi_user_isolation", "user_id on diagnosis_logs and supply_chain_batches")
+def _multi_user(conn):
+    add_columns(conn, "diagnosis_logs", ["user_id INTEGER"])
+    add_columns(conn, "supply_chain_batches", ["user_id INTEGER"])
+
+
+@migration("0009_iot_smart_logic", "IoT device hierarchy and runtime tracking")
+def _iot_smart_logic(conn):
+    add_columns(conn, "iot_devices", [
+        "parent_device_id INTEGER", "last_active_at TIMESTAMP", "total_runtime_minutes FLOAT DEFAULT 0.0",
+        "current_run_start_time TIMESTAMP", "target_turn_off_at TIMESTAMP", "asset_type VARCHAR DEFAULT 'Device'",
+    ])
+
+
+@migration("0010_chat_attachments", "chat_messages message_type/attachment_url")
+def _chat(conn):
+    add_columns(conn, "chat_messages", ["message_type VARCHAR DEFAULT 'text'", "attachment_url VARCHAR"])
+
+
+@migration("0011_lora_downlink_outbox", "LoRaWAN downlink outbox retry columns and index")
+def _lora_downlinks(conn):
+    add_columns(conn, "lora_downlinks", ["attempts INTEGER DEFAULT 0", "next_attempt_at TIMESTAMP", "last_error VARCHAR"])
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_lora_downlinks_status_next_attempt ON lora_downlinks (status, next_attempt_at)"))
+
+
+# (table, unique ID column, numeric?)
+UNIQUE_ID_COLUMNS = [
+    ("users", "user_unique_id", True),
+    ("farms", "farm_unique_id", False),
+    ("zones", "zone_unique_id", False),
+    ("machines", "machine_unique_id", False),
+    ("crop_cycles", "crop_unique_id", False),
+    ("iot_devices", "device_unique_id", False),
+    ("livestock", "animal_unique_id", False),
+    ("labor_jobs", "job_unique_id", False),
+    ("field_workers", "worker_unique_id", False),
+    ("inventory_items", "item_unique_id", False),
+]
+
+
+@migration("0012_unique_id_columns", "Unique ID + owner user_unique_id columns")
+def _unique_id_columns(conn):
+    for table_name, id_col, _ in UNIQUE_ID_COLUMNS:
+        add_columns(conn, table_name, [f"{id_col} VARCHAR"] + (["user_unique_id VARCHAR"] if table_name != "users" else []))
+
+
+@migration("0013_unique_id_backfill", "Backfill missing unique IDs")
+def _unique_id_backfill(conn):
+    for table_name, id_col, numeric in UNIQUE_ID_COLUMNS:
+        filled = backfill_unique_ids(conn, table_name, id_col, numeric)
+        if filled:
+            print(f"Backfilled {filled} {table_name}.{id_col}")
+
+
+@migration("0014_diagnosis_thumbnails", "diagnosis_logs.thumbnail_url")
+def _diagnosis_thumbnails(conn):
+    add_columns(conn, "diagnosis_logs", ["thumbnail_url VARCHAR"])
+
+
+@migration("0015_lorawan_eui_separators", "Strip ':'/'-' from stored LoRaWAN EUIs")
+def _lorawan_eui_separators(conn):
+    # Rows provisioned one at a time kept their separators, so uplinks never matched them
+    from app.modules.iot.lorawan_cache import normalize_eui
+    for table_name, col in (("lora_nodes", "dev_eui"), ("lora_gateways", "gateway_id"), ("lora_nodes", "app_eui")):
+        if not inspect(conn).has_table(table_name):
+            continue
+        target = table(table_name, column("id"), column(col))
+        rows = conn.execute(select(target.c.id, target.c[col]).where(target.c[col].isnot(None))).all()
+        taken = {value for _, value in rows}
+        pairs = []
+        for row_id, value in rows:
+            canonical = normalize_eui(value)
+            # app_eui is not unique; for the unique columns an existing canonical row wins and the duplicate is left alone
+            if canonical != value and (col == "app_eui" or canonical not in taken):
+                taken.add(canonical)
+                pairs.append({"row_id": row_id, "value": canonical})
+        if pairs:
+            conn.execute(update(target).where(target.c.id == bindparam("row_id")).values({col: bindparam("value")}), pairs)
+            print(f"Normalized {len(pairs)} {table_name}.{col} values")
+
+
+# ============ Runner ============
+
+def _apply(conn: Connection, version: str, description: str, apply: Callable[[Connection], None]):
+    started = time.perf_counter()
+    apply(conn)
+    conn.execute(schema_migrations.insert().values(
+        version=version,
+        description=description,
+        duration_ms=int((time.perf_counter() - started) * 1000),
+    ))
+    conn.commit()
+
+
+def run_migrations(engine: Optional[Engine] = None) -> Dict[str, List[str]]:
+    """Apply pending steps in order; returns the versions applied and skipped"""
+    engine = engine or database.engine
+    result: Dict[str, List[str]] = {"applied": [], "skipped": []}
+    with engine.connect() as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _MIGRATION_LOCK_KEY})
+            conn.commit()
+        try:
+            _migration_metadata.create_all(bind=conn)
+            conn.commit()
+            applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+            # New models only need create_all once, when the table set changes
+            steps = [(f"create_all_{_schema_fingerprint()}", "Create tables for all mapped models",
+                      lambda c: database.Base.metadata.create_all(bind=c))]
+            steps += [(m.version, m.description, m.apply) for m in MIGRATIONS]
+
+            for version, description, apply in steps:
+                if version in applied:
+                    result["skipped"].append(version)
+                    continue
+                try:
+                    _apply(conn, version, description, apply)
+                except Exception as e:
+                    conn.rollback()
+                    # Later steps may depend on this one; retry everything next start
+                    print(f"❌ Migration {version} failed: {e}")
+                    break
+                result["applied"].append(version)
+        finally:
+            if is_postgres:
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _MIGRATION_LOCK_KEY})
+                conn.commit()
+    return result
+
+
+if __name__ == "__main__":
+    import main  # noqa: F401  (registers every model on Base.metadata)
+
+    outcome = run_migrations()
+    print(f"Applied {len(outcome['applied'])} migration(s): {', '.join(outcome['applied']) or 'none'}")
@@ -0,0 +1,179 @@
+"""
+ML Model Manager
+Lazy, thread-safe loading of the heavy local models (Whisper, Flan-T5, ...).
+
+Nothing is imported or loaded at module import time: a worker that never
+serves voice traffic never pays for torch/transformers. Modules register a
+loader under a name; the first get() loads it (one loader per model even
+under concurrent requests, other models keep loading/serving in parallel).
+
+- warm_up(): load ML_WARMUP_MODELS on a background thread after startup
+- idle unload: models unused for ML_MODEL_IDLE_TIMEOUT seconds are dropped
+  by a reaper thread (requests already holding the model keep their
+  reference; the memory is released when they finish)
+- report(): which models are resident, load time and idle time
+"""
+import gc
+import importlib.util
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.core.config import settings
+
+
+def module_available(*names: str) -> bool:
+    """True if every module can be imported, without importing it"""
+    return all(importlib.util.find_spec(name) is not None for name in names)
+
+
+class _ManagedModel:
+    def __init__(self, name: str, loader: Callable[[], Any], idle_timeout: Optional[float]):
+        self.name = name
+        self.loader = loader
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.instance: Any = None
+        self.loaded_at: Optional[float] = None
+        self.last_used: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.loads = 0
+        self.error: Optional[str] = None
+        self.failed_at: Optional[float] = None
+
+
+class ModelManager:
+    def __init__(self, idle_timeout: float = 1800.0, retry_after: float = 60.0):
+        self.idle_timeout = idle_timeout  # 0 disables idle unloading
+        self.retry_after = retry_after  # Seconds before a failed load is attempted again
+        self._models: Dict[str, _ManagedModel] = {}
+        self._registry_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+    # ============ Registry ============
+
+    def register(self, name: str, loader: Callable[[], Any], idle_timeout: Optional[float] = None):
+        """Register a loader (idempotent: the first registration of a name wins)"""
+        with self._registry_lock:
+            if name not in self._models:
+                self._models[name] = _ManagedModel(name, loader, idle_timeout)
+
+    def get(self, name: str) -> Any:
+        """Return the loaded model, loading it on first use; None if loading failed"""
+        entry = self._models.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown model '{name}'")
+        instance = entry.instance
+        if instance is None:
+            with entry.lock:
+                instance = entry.instance
+                if instance is None:
+                    if entry.failed_at and time.time() - entry.failed_at < self.retry_after:
+                        return None  # Do not retry a broken load on every request
+                    instance = self._load(entry)
+        entry.last_used = time.time()
+        return instance
+
+    def _load(self, entry: _ManagedModel) -> Any:
+        print(f"[INFO] Loading model '{entry.name}'...")
+        started = time.perf_counter()
+        try:
+            instance = entry.loader()
+        except Exception as e:
+            entry.error = str(e)
+            entry.failed_at = time.time()
+            print(f"[ERROR] Failed to load model '{entry.name}': {e}")
+            return None
+        entry.load_seconds = round(time.perf_counter() - started, 2)
+        entry.instance = instance
+        entry.loaded_at = time.time()
+        entry.loads += 1
+        entry.error = None
+        entry.failed_at = None
+        print(f"[OK] Model '{entry.name}' loaded in {entry.load_seconds}s")
+        return instance
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._models.get(name)
+        return bool(entry and entry.instance is not None)
+
+    def unload(self, name: str) -> bool:
+        entry = self._models.get(name)
+        if entry is None or entry.instance is None:
+            return False
+        with entry.lock:
+            entry.instance = None
+            entry.loaded_at = None
+        gc.collect()
+        if "torch" in sys.modules:  # Only if something already imported it
+            torch = sys.modules["torch"]
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        print(f"[INFO] Model '{name}' unloaded")
+        return True
+
+    # ============ Warm-up / idle reaper ============
+
+    def warm_up(self, names: Iterable[str]) -> Optional[threading.Thread]:
+        """Load the given models on a background thread so startup is not blocked"""
+        names = [n for n in names if n in self._models]
+        if not names:
+            return None
+
+        def _warm():
+            for name in names:
+                if self._stop.is_set():
+                    return
+                self.get(name)
+
+        thread = threading.Thread(target=_warm, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def start(self, warm: Iterable[str] = ()):
+        self._stop.clear()
+        if self.idle_timeout and not (self._reaper and self._reaper.is_alive()):
+            self._reaper = threading.Thread(target=self._reap, name="model-reaper", daemon=True)
+            self._reaper.start()
+        self.warm_up(warm)
+
+    def stop(self):
+        self._stop.set()
+
+    def _reap(self):
+        interval = max(min(self.idle_timeout / 2, 60.0), 1.0)
+        while not self._stop.wait(interval):
+            now = time.time()
+            for entry in list(self._models.values()):
+                timeout = entry.idle_timeout if entry.idle_timeout is not None else self.idle_timeout
+                if timeout and entry.instance is not None and entry.last_used and now - entry.last_used > timeout:
+                    self.unload(entry.name)
+
+    # ============ Metrics ============
+
+    def report(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [
+            {
+                "name": entry.name,
+                "resident": entry.instance is not None,
+                "loads": entry.loads,
+                "load_seconds": entry.load_seconds,
+                "idle_seconds": round(now - entry.last_used, 1) if entry.last_used else None,
+                "error": entry.error,
+            }
+            for entry in self._models.values()
+        ]
+
+    def print_report(self):
+        rows = self.report()
+        if not rows:
+            return
+        resident = [r["name"] for r in rows if r["resident"]]
+        lazy = [r["name"] for r in rows if not r["resident"]]
+        print(f"ML models resident: {', '.join(resident) or 'none'}; lazy: {', '.join(lazy) or 'none'}")
+
+
+model_manager = ModelManager(idle_timeout=settings.ML_MODEL_IDLE_TIMEOUT)
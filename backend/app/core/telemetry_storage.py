@@ -0,0 +1,352 @@
+"""
+Telemetry Storage Management
+Indexes, partitioning and retention for the high-volume time-series tables
+(lora_telemetry, livestock_telemetry, iot_commands).
+
+- ensure_indexes(): creates the composite (device, time) indexes on databases
+  whose tables predate them (create_all only indexes brand-new tables).
+- PostgreSQL, with LORAWAN_PARTITIONING=true: lora_telemetry is converted once
+  into a table RANGE-partitioned by received_at with one partition per day.
+  Existing rows stay in place as the "legacy" partition. SQLite (dev) keeps a
+  plain table and relies on the indexes and chunked deletes instead.
+- TelemetryRetentionJob: raw lora_telemetry older than LORAWAN_RAW_RETENTION_DAYS
+  is compacted into lora_telemetry_rollups (recomputed per day from the raw
+  rows, so it is exact and idempotent), then dropped (whole partition) or deleted.
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import IngestSessionLocal, ingest_engine as default_engine
+from app.modules.iot.lorawan_models import LoRaTelemetry, LoRaTelemetryRollup
+from app.modules.iot.lorawan_rollups import ROLLUP_METRICS, aggregate_rows
+from app.modules.iot.models import IoTCommand
+from app.modules.livestock.smart_models import TelemetryReading
+
+TIME_SERIES_TABLES = [LoRaTelemetry.__table__, TelemetryReading.__table__, IoTCommand.__table__]
+
+PARTITIONED_TABLE = "lora_telemetry"
+LEGACY_PARTITION = "lora_telemetry_legacy"
+DEFAULT_PARTITION = "lora_telemetry_default"
+
+# Arbitrary constant for pg_try_advisory_lock so only one worker runs maintenance
+_MAINTENANCE_LOCK_KEY = 7_460_231
+
+
+def _day(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _partition_name(day: datetime) -> str:
+    return f"lora_telemetry_p{day:%Y%m%d}"
+
+
+# ============ Indexes ============
+
+def ensure_indexes(engine: Engine = default_engine):
+    """Create any missing time-series indexes (no-op when they already exist)"""
+    for table in TIME_SERIES_TABLES:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"⚠️ Could not create index {index.name}: {e}")
+
+
+# ============ Partitioning (PostgreSQL) ============
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :name"
+    ), {"name": PARTITIONED_TABLE}).scalar())
+
+
+def _table_exists(conn: Connection, name: str) -> bool:
+    return bool(conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar())
+
+
+def convert_to_partitioned(engine: Engine = default_engine) -> bool:
+    """
+    One-time conversion of lora_telemetry into a RANGE(received_at) partitioned table.
+    The existing table is attached unchanged as the partition covering everything
+    before tomorrow, so no rows are copied. Returns True if a conversion happened.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+
+    with engine.begin() as conn:
+        if is_partitioned(conn) or not _table_exists(conn, PARTITIONED_TABLE):
+            return False
+
+        boundary = _day(datetime.utcnow()) + timedelta(days=1)
+        conn.execute(text(f"LOCK TABLE {PARTITIONED_TABLE} IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text(
+            f"UPDATE {PARTITIONED_TABLE} SET received_at = (now() AT TIME ZONE 'utc') WHERE received_at IS NULL"
+        ))
+        sequence = conn.execute(text(
+            f"SELECT pg_get_serial_sequence('{PARTITIONED_TABLE}', 'id')"
+        )).scalar()
+
+        # Move the old table (and its index/constraint names) out of the way
+        conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO {LEGACY_PARTITION}"))
+        # A partition cannot keep its own primary key; ATTACH builds the (id, received_at) one
+        conn.execute(text(f"ALTER TABLE {LEGACY_PARTITION} DROP CONSTRAINT {PARTITIONED_TABLE}_pkey"))
+        legacy_indexes = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table AND indexname LIKE 'ix_lora_telemetry_%'"
+        ), {"table": LEGACY_PARTITION}).scalars().all()
+        for index_name in legacy_indexes:
+            new_name = index_name.replace("ix_lora_telemetry_", "ix_lora_telemetry_legacy_", 1)
+            conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{new_name}"'))
+
+        # Partitioned parent; the primary key must include the partition column
+        conn.execute(text(
+            f"CREATE TABLE {PARTITIONED_TABLE} (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (received_at)"
+        ))
+        conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ALTER COLUMN received_at SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} ADD PRIMARY KEY (id, received_at)"))
+        conn.execute(text(
+            f"ALTER TABLE {PARTITIONED_TABLE} ADD FOREIGN KEY (node_id) REFERENCES lora_nodes (id)"
+        ))
+        if sequence:
+            # Keep the id sequence alive when the legacy partition is eventually dropped
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {PARTITIONED_TABLE}.id"))
+
+        conn.execute(text(f"ALTER TABLE {LEGACY_PARTITION} ALTER COLUMN received_at SET NOT NULL"))
+        conn.execute(text(
+            f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {LEGACY_PARTITION} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+        ))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARTITIONED_TABLE} DEFAULT"
+        ))
+
+        for index in LoRaTelemetry.__table__.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+        _create_daily_partitions(conn, boundary, settings.LORAWAN_PARTITIONS_AHEAD)
+
+    print(f"lora_telemetry converted to daily partitions (legacy rows before {boundary:%Y-%m-%d}).")
+    return True
+
+
+def _legacy_upper_bound(conn: Connection) -> Optional[datetime]:
+    """End of the range covered by the attached legacy partition, if any"""
+    bound = conn.execute(text(
+        "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_class c "
+        "JOIN pg_inherits i ON i.inhrelid = c.oid WHERE c.relname = :name"
+    ), {"name": LEGACY_PARTITION}).scalar()
+    match = re.search(r"TO \('([^']+)'\)", bound or "")
+    return datetime.fromisoformat(match.group(1)) if match else None
+
+
+def _create_daily_partitions(conn: Connection, start: datetime, days: int) -> List[str]:
+    created = []
+    legacy_end = _legacy_upper_bound(conn)
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        name = _partition_name(day)
+        if (legacy_end and day < legacy_end) or _table_exists(conn, name):
+            continue
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARTITIONED_TABLE} "
+            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def ensure_partitions(engine: Engine = default_engine) -> List[str]:
+    """Pre-create upcoming daily partitions so inserts never land in the default partition"""
+    if engine.dialect.name != "postgresql":
+        return []
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        return _create_daily_partitions(conn, _day(datetime.utcnow()), settings.LORAWAN_PARTITIONS_AHEAD)
+
+
+# ============ Retention / Compaction ============
+
+class TelemetryRetentionJob:
+    """Compacts raw lora_telemetry older than the retention window into rollups"""
+
+    def __init__(self, raw_retention_days: int, rollup_5m_retention_days: int = 0, chunk_size: int = 5000):
+        self.raw_retention_days = raw_retention_days
+        self.rollup_5m_retention_days = rollup_5m_retention_days
+        self.chunk_size = chunk_size
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        now = now or datetime.utcnow()
+        result = {"days_compacted": 0, "raw_rows_removed": 0, "rollups_5m_removed": 0}
+
+        if self.raw_retention_days > 0:
+            cutoff = _day(now) - timedelta(days=self.raw_retention_days)
+            db = IngestSessionLocal()
+            try:
+                oldest = db.query(LoRaTelemetry.received_at).filter(
+                    LoRaTelemetry.received_at < cutoff
+                ).order_by(LoRaTelemetry.received_at.asc()).limit(1).scalar()
+                day = _day(oldest) if oldest else cutoff
+                while day < cutoff:
+                    removed = self.compact_day(db, day)
+                    if removed:
+                        result["days_compacted"] += 1
+                        result["raw_rows_removed"] += removed
+                    day += timedelta(days=1)
+                self._drop_empty_legacy_partition(db)
+            finally:
+                db.close()
+
+        if self.rollup_5m_retention_days > 0:
+            horizon = _day(now) - timedelta(days=self.rollup_5m_retention_days)
+            db = IngestSessionLocal()
+            try:
+                result["rollups_5m_removed"] = db.query(LoRaTelemetryRollup).filter(
+                    LoRaTelemetryRollup.resolution == "5m",
+                    LoRaTelemetryRollup.bucket_start < horizon,
+                ).delete(synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+
+        return result
+
+    def compact_day(self, db: Session, day: datetime) -> int:
+        """Recompute the day's rollups from raw rows, then remove those raw rows (one transaction)"""
+        day_end = day + timedelta(days=1)
+        columns = [LoRaTelemetry.node_id, LoRaTelemetry.received_at] + [
+            getattr(LoRaTelemetry, metric) for metric in ROLLUP_METRICS
+        ]
+        rows = db.query(*columns).filter(
+            LoRaTelemetry.received_at >= day,
+            LoRaTelemetry.received_at < day_end,
+        ).order_by(LoRaTelemetry.node_id, LoRaTelemetry.received_at).yield_per(self.chunk_size)
+
+        total = 0
+        pending: List[Dict[str, Any]] = []
+        current_node = None
+        try:
+            for row in rows:
+                # Flush on node boundaries so each node's buckets are written exactly once
+                if row.node_id != current_node and len(pending) >= self.chunk_size:
+                    self._replace_rollups(db, pending, day, day_end)
+                    pending = []
+                current_node = row.node_id
+                pending.append(row._asdict())
+                total += 1
+            if pending:
+                self._replace_rollups(db, pending, day, day_end)
+
+            if total:
+                self._remove_raw_day(db, day, day_end)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return total
+
+    def _replace_rollups(self, db: Session, rows: List[Dict[str, Any]], day: datetime, day_end: datetime):
+        partials = aggregate_rows(rows)
+        node_ids = {row["node_id"] for row in rows}
+        db.query(LoRaTelemetryRollup).filter(
+            LoRaTelemetryRollup.node_id.in_(node_ids),
+            LoRaTelemetryRollup.bucket_start >= day,
+            LoRaTelemetryRollup.bucket_start < day_end,
+        ).delete(synchronize_session=False)
+        now = datetime.utcnow()
+        db.bulk_insert_mappings(LoRaTelemetryRollup, [dict(agg, updated_at=now) for agg in partials.values()])
+
+    def _remove_raw_day(self, db: Session, day: datetime, day_end: datetime):
+        conn = db.connection()
+        partition = _partition_name(day)
+        if is_partitioned(conn) and _table_exists(conn, partition):
+            conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {partition}"))
+            conn.execute(text(f"DROP TABLE {partition}"))
+            return
+        db.query(LoRaTelemetry).filter(
+            LoRaTelemetry.received_at >= day,
+            LoRaTelemetry.received_at < day_end,
+        ).delete(synchronize_session=False)
+
+    def _drop_empty_legacy_partition(self, db: Session):
+        conn = db.connection()
+        if not (is_partitioned(conn) and _table_exists(conn, LEGACY_PARTITION)):
+            return
+        if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {LEGACY_PARTITION})")).scalar():
+            return
+        conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {LEGACY_PARTITION}"))
+        conn.execute(text(f"DROP TABLE {LEGACY_PARTITION}"))
+        db.commit()
+
+
+# ============ Background maintenance ============
+
+class TelemetryMaintenanceWorker:
+    """Periodically pre-creates partitions and runs the retention job"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_run_at: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Telemetry maintenance failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        with default_engine.connect() as lock_conn:
+            if lock_conn.dialect.name == "postgresql":
+                # Only one worker process performs maintenance at a time
+                if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _MAINTENANCE_LOCK_KEY}).scalar():
+                    return None
+            try:
+                ensure_partitions()
+                job = TelemetryRetentionJob(
+                    raw_retention_days=settings.LORAWAN_RAW_RETENTION_DAYS,
+                    rollup_5m_retention_days=settings.LORAWAN_ROLLUP_5M_RETENTION_DAYS,
+                )
+                self.last_result = job.run()
+                self.last_run_at = datetime.utcnow()
+                return self.last_result
+            finally:
+                if lock_conn.dialect.name == "postgresql":
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _MAINTENANCE_LOCK_KEY})
+
+
+def init_telemetry_storage():
+    """Startup hook: indexes, optional partition conversion"""
+    ensure_indexes()
+    if settings.LORAWAN_PARTITIONING:
+        try:
+            convert_to_partitioned()
+        except Exception as e:
+            print(f"⚠️ lora_telemetry partitioning skipped: {e}")
+
+
+maintenance_worker = TelemetryMaintenanceWorker(settings.TELEMETRY_MAINTENANCE_INTERVAL)
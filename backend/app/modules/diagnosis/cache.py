@@ -0,0 +1,177 @@
+"""
+Diagnosis Cache
+Reuses the parsed result of a diagnosis when the same photo (or a
+near-duplicate of it) is uploaded again for the same crop.
+
+- exact match: SHA-256 of the image bytes + normalized crop name
+- near-duplicate: 64-bit difference hash (dHash) of the image, matched by
+  Hamming distance <= DIAGNOSIS_PHASH_MAX_DISTANCE among entries for the
+  same crop (re-encoded, resized or re-compressed copies of one photo)
+- entries are tagged with a signature of the model chain (vision models,
+  text models, DIAGNOSIS_CACHE_VERSION); changing any of them makes older
+  entries miss, and invalidate() drops everything at once
+
+Only real model results are stored, never the mock fallback, so an outage
+does not get cached. LRU eviction at DIAGNOSIS_CACHE_MAX_ENTRIES, per-entry
+expiry after DIAGNOSIS_CACHE_TTL.
+"""
+import copy
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.huggingface_service import DISEASE_MODEL, HF_TEXT_MODELS, VALIDATION_MODEL
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(data: bytes) -> Optional[int]:
+    """64-bit dHash (9x8 grayscale, one bit per horizontal gradient); None if the image cannot be read"""
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("L", (64, 64))  # JPEG: decode at reduced scale, much faster than a full decode
+            pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    if max(pixels) - min(pixels) < 8:
+        return None  # Flat image: every gradient bit is noise, it would "match" any other flat image
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def chain_signature() -> str:
+    """Changes whenever a model in the diagnosis chain (or DIAGNOSIS_CACHE_VERSION) changes"""
+    chain = [VALIDATION_MODEL, DISEASE_MODEL, HF_TEXT_MODELS, settings.DIAGNOSIS_CACHE_VERSION]
+    return hashlib.sha1(json.dumps(chain).encode()).hexdigest()[:12]
+
+
+def _normalize_crop(crop: Optional[str]) -> str:
+    return " ".join((crop or "unknown").lower().split())
+
+
+class _Entry:
+    __slots__ = ("result", "phash", "crop", "signature", "expires_at")
+
+    def __init__(self, result: Dict[str, Any], phash: Optional[int], crop: str, signature: str, expires_at: float):
+        self.result = result
+        self.phash = phash
+        self.crop = crop
+        self.signature = signature
+        self.expires_at = expires_at
+
+
+class DiagnosisCache:
+    """Thread-safe LRU keyed by content hash, with a per-crop perceptual-hash index"""
+
+    def __init__(self, max_entries: int = 2000, ttl: float = 7 * 86400, max_distance: int = 6):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance  # 0 disables near-duplicate matching
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_crop: Dict[str, Dict[str, int]] = {}  # crop -> {key: phash}
+        self._lock = threading.Lock()
+        self._signature = chain_signature()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    @staticmethod
+    def fingerprint(data: bytes) -> Tuple[str, Optional[int]]:
+        return content_hash(data), perceptual_hash(data)
+
+    def get(self, digest: str, phash: Optional[int], crop: str) -> Optional[Dict[str, Any]]:
+        if self.ttl <= 0:
+            return None
+        crop = _normalize_crop(crop)
+        now = time.time()
+        with self._lock:
+            key = f"{crop}|{digest}"
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(key, entry, now):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return copy.deepcopy(entry.result)
+
+            if phash is not None and self.max_distance > 0:
+                best_key, best_distance = None, self.max_distance + 1
+                for candidate_key, candidate_phash in self._by_crop.get(crop, {}).items():
+                    distance = (candidate_phash ^ phash).bit_count()
+                    if distance < best_distance:
+                        best_key, best_distance = candidate_key, distance
+                entry = self._entries.get(best_key) if best_key else None
+                if entry is not None and self._valid(best_key, entry, now):
+                    self._entries.move_to_end(best_key)
+                    self._stats["near_hits"] += 1
+                    return copy.deepcopy(entry.result)
+
+            self._stats["misses"] += 1
+            return None
+
+    def _valid(self, key: str, entry: _Entry, now: float) -> bool:
+        """Drop expired entries and entries from an older model chain (lock held)"""
+        if entry.expires_at >= now and entry.signature == self._signature:
+            return True
+        self._remove(key)
+        return False
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            crop_index = self._by_crop.get(entry.crop)
+            if crop_index is not None:
+                crop_index.pop(key, None)
+                if not crop_index:
+                    del self._by_crop[entry.crop]
+
+    def put(self, digest: str, phash: Optional[int], crop: str, result: Dict[str, Any]):
+        if self.ttl <= 0:
+            return
+        crop = _normalize_crop(crop)
+        key = f"{crop}|{digest}"
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(copy.deepcopy(result), phash, crop, self._signature, time.time() + self.ttl)
+            if phash is not None:
+                self._by_crop.setdefault(crop, {})[key] = phash
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self) -> int:
+        """Drop every entry and re-read the model chain signature; returns the number dropped"""
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries.clear()
+            self._by_crop.clear()
+            self._signature = chain_signature()
+            self._stats["invalidations"] += 1
+        print(f"[INFO] Diagnosis cache invalidated ({dropped} entries)")
+        return dropped
+
+    # ============ Metrics ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["near_hits"]) / lookups * 100, 1) if lookups else 0.0
+        stats["model_chain"] = self._signature
+        return stats
+
+
+diagnosis_cache = DiagnosisCache(
+    max_entries=settings.DIAGNOSIS_CACHE_MAX_ENTRIES,
+    ttl=settings.DIAGNOSIS_CACHE_TTL,
+    max_distance=settings.DIAGNOSIS_PHASH_MAX_DISTANCE,
+)
@@ -8,6 +8,7 @@ class DiagnosisLog(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     image_url = Column(String)
+    thumbnail_url = Column(String, nullable=True)  # Web-sized copy from the upload pipeline
     crop_name = Column(String, index=True)
     
     # AI Results
@@ -0,0 +1,221 @@
+"""
+Local Disease Classifier
+Runs the active ONNX disease model from the edge model registry on the
+server's CPU, so a diagnosis no longer needs the remote vision endpoints.
+
+- the model is the latest active EdgeModel named DIAGNOSIS_LOCAL_MODEL with
+  model_type "onnx"; its file_url must point into /static/ and its SHA-256
+  must match file_hash
+- input_shape gives width/height/channels, plus optional "layout"
+  ("NCHW" default, or "NHWC") and per-channel "mean"/"std" for inputs
+  scaled to [0, 1]; output_classes are the labels, in output order
+- inference runs in an inference pool ("disease-onnx"): each worker process
+  holds one onnxruntime session, and requests arriving within
+  INFERENCE_BATCH_WAIT_MS are stacked into one batch
+- requests carry the registry id of the model the web process expects; a
+  worker that has any other version loaded swaps to exactly that one before
+  running the batch
+
+Registering a new ONNX version, or deactivating one to roll back, is picked
+up within MODEL_CHECK_INTERVAL seconds, and the diagnosis cache is
+invalidated when that happens.
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.inference_pool import create_pool
+from app.core.model_manager import model_manager, module_available
+from .model_registry import EdgeModel, ModelRegistryService
+
+ONNX_AVAILABLE = module_available("onnxruntime")
+MODEL_NAME = "disease-onnx"
+MODEL_CHECK_INTERVAL = 60.0  # Seconds between registry lookups in the web process
+TOP_K = 5
+
+_requested_model_id: Optional[int] = None  # Pool worker: registry id the last batch asked for
+
+
+def model_path(model: EdgeModel) -> Optional[str]:
+    """Local file for a registry entry (only models served from /static/ can run in-process)"""
+    if not model.file_url or not model.file_url.startswith("/static/"):
+        return None
+    return model.file_url.lstrip("/")
+
+
+def _active_model(db) -> Optional[EdgeModel]:
+    return ModelRegistryService(db).get_latest_model(settings.DIAGNOSIS_LOCAL_MODEL, "onnx")
+
+
+def _load_onnx_model() -> Dict[str, Any]:
+    """
+    Model loader (runs inside the pool worker): the registry entry the last
+    batch asked for (the active one at warm-up); verify the file, open an
+    onnxruntime session
+    """
+    import onnxruntime as ort
+
+    db = SessionLocal()
+    try:
+        if _requested_model_id is None:
+            model = _active_model(db)
+            missing = f"No active ONNX model '{settings.DIAGNOSIS_LOCAL_MODEL}' registered"
+        else:
+            model = db.query(EdgeModel).filter(EdgeModel.id == _requested_model_id).first()
+            missing = f"ONNX model {_requested_model_id} not found in the registry"
+        if model is None:
+            raise FileNotFoundError(missing)
+        path = model_path(model)
+        if path is None or not os.path.exists(path):
+            raise FileNotFoundError(f"Model file for {model.name} v{model.version} not found ({model.file_url})")
+        with open(path, "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != model.file_hash:
+            raise ValueError(f"Hash mismatch for {model.name} v{model.version}; refusing to load")
+        shape = dict(model.input_shape or {})
+        labels = list(model.output_classes or [])
+        model_id, version = model.id, model.version
+    finally:
+        db.close()
+
+    options = ort.SessionOptions()
+    # Workers share the CPU; one session per worker should not claim every core
+    options.intra_op_num_threads = max((os.cpu_count() or 1) // max(settings.INFERENCE_ONNX_WORKERS, 1), 1)
+    session = ort.InferenceSession(data, sess_options=options, providers=["CPUExecutionProvider"])
+    channels = int(shape.get("channels", 3))
+    return {
+        "id": model_id,
+        "version": version,
+        "session": session,
+        "input_name": session.get_inputs()[0].name,
+        "labels": labels,
+        "size": (int(shape.get("width", 224)), int(shape.get("height", 224))),
+        "channels": channels,
+        "layout": shape.get("layout", "NCHW").upper(),
+        "mean": np.asarray(shape.get("mean", [0.0] * channels), dtype=np.float32),
+        "std": np.asarray(shape.get("std", [1.0] * channels), dtype=np.float32),
+    }
+
+
+model_manager.register(MODEL_NAME, _load_onnx_model)
+
+
+def _preprocess(image: bytes, loaded: Dict[str, Any]) -> np.ndarray:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image)) as img:
+        img.draft("RGB", loaded["size"])  # JPEG: decode at reduced scale
+        img = img.convert("L" if loaded["channels"] == 1 else "RGB").resize(loaded["size"], Image.BILINEAR)
+        pixels = np.asarray(img, dtype=np.float32) / 255.0
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    return (pixels - loaded["mean"]) / loaded["std"]  # HWC
+
+
+def _probabilities(outputs: np.ndarray) -> np.ndarray:
+    """Softmax unless the model already outputs probabilities"""
+    if outputs.min() >= 0 and np.allclose(outputs.sum(axis=1), 1.0, atol=1e-3):
+        return outputs
+    shifted = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def classify_batch(requests: List[Dict[str, Any]]) -> List[List[Tuple[str, float]]]:
+    """
+    Inference pool handler: classify a batch of {"model_id", "image"} requests
+    in one session.run; returns the top labels with scores per image
+    """
+    global _requested_model_id
+    _requested_model_id = requests[-1]["model_id"]  # Most recent view of the web process
+    loaded = model_manager.get(MODEL_NAME)
+    if loaded is not None and loaded["id"] != _requested_model_id:
+        model_manager.unload(MODEL_NAME)  # A new version was registered or the active one rolled back
+        loaded = model_manager.get(MODEL_NAME)
+    if loaded is None:
+        raise RuntimeError("Local disease model not available")
+
+    results: List[Optional[List[Tuple[str, float]]]] = [None] * len(requests)
+    tensors, indexes = [], []
+    for i, req in enumerate(requests):
+        try:
+            tensors.append(_preprocess(req["image"], loaded))
+            indexes.append(i)
+        except Exception:
+            results[i] = []  # Unreadable image: no prediction rather than failing the whole batch
+    if tensors:
+        batch = np.stack(tensors)
+        if loaded["layout"] == "NCHW":
+            batch = batch.transpose(0, 3, 1, 2)
+        outputs = loaded["session"].run(None, {loaded["input_name"]: np.ascontiguousarray(batch)})[0]
+        probabilities = _probabilities(np.asarray(outputs, dtype=np.float32).reshape(len(tensors), -1))
+        labels = loaded["labels"]
+        for i, row in zip(indexes, probabilities):
+            top = np.argsort(row)[::-1][:TOP_K]
+            results[i] = [(labels[k] if k < len(labels) else f"class_{k}", float(row[k])) for k in top]
+    return results
+
+
+onnx_pool = create_pool(
+    MODEL_NAME, "app.modules.diagnosis.onnx_engine:classify_batch", model_name=MODEL_NAME,
+    workers=settings.INFERENCE_ONNX_WORKERS,
+)
+
+
+class LocalDiseaseClassifier:
+    """Web-process side: knows which registry model is active and submits images to the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model_id: Optional[int] = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+
+    def active_model_id(self, db) -> Optional[int]:
+        """Registry id of the active, locally runnable ONNX model (re-checked every MODEL_CHECK_INTERVAL)"""
+        if not (ONNX_AVAILABLE and settings.DIAGNOSIS_LOCAL_ENABLED):
+            return None
+        now = time.time()
+        if now - self._checked_at < MODEL_CHECK_INTERVAL:
+            return self._model_id
+        with self._lock:
+            if now - self._checked_at < MODEL_CHECK_INTERVAL:
+                return self._model_id
+            model = _active_model(db)
+            path = model_path(model) if model else None
+            model_id = model.id if path and os.path.exists(path) else None
+            if model_id != self._model_id:
+                from .cache import diagnosis_cache
+                print(f"[INFO] Local disease model: {f'{model.name} v{model.version}' if model_id else 'none'}")
+                self._version = model.version if model_id else None
+                if self._model_id is not None:
+                    diagnosis_cache.invalidate()  # Cached results came from the previous model
+            self._model_id = model_id
+            self._checked_at = now
+        return model_id
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def classify(self, db, image: bytes) -> Optional[List[Tuple[str, float]]]:
+        """Top labels for one image; None when no local model is available"""
+        results = self.classify_many(db, [image])
+        return results[0] if results else None
+
+    def classify_many(self, db, images: List[bytes]) -> Optional[List[List[Tuple[str, float]]]]:
+        """Submit all images at once so the pool can batch them; None when no local model is available"""
+        model_id = self.active_model_id(db)
+        if model_id is None:
+            return None
+        futures = [onnx_pool.submit({"model_id": model_id, "image": image}) for image in images]
+        return [future.result(timeout=onnx_pool.timeout) for future in futures]
+
+
+local_classifier = LocalDiseaseClassifier()
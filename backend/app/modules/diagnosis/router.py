@@ -1,20 +1,37 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from typing import List
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.image_pipeline import ImageStore
+from app.core.ownership import require_admin
 from app.modules.auth.dependencies import get_current_user
 from app.modules.auth.models import User
 from . import service, schemas
-import shutil
-import os
-import uuid
+from .cache import diagnosis_cache
+import asyncio
 
 router = APIRouter()
 
 UPLOAD_DIR = "static/uploads/diagnosis"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+image_store = ImageStore(UPLOAD_DIR)
 
+def _store_upload(filename: str, data: bytes) -> dict:
+    """Normalize and store one photo (decode once, strip EXIF, model copy + thumbnail) and fingerprint it"""
+    try:
+        image = image_store.save(data)
+    except ValueError as e:
+        print(f"⚠️ Rejected upload {filename}: {e}")
+        raise HTTPException(status_code=400, detail="Not a readable image")
+    image["filename"] = filename
+    image["digest"], image["phash"] = diagnosis_cache.fingerprint(image["model"])  # Cache key, as for /predict
+    return image
+
+# Plain def: the image processing, the vision call and the DB writes are all blocking,
+# so FastAPI runs this in its threadpool instead of on the event loop
 @router.post("/predict", response_model=schemas.DiagnosisResponse)
-async def predict_disease(
+def predict_disease(
     file: UploadFile = File(...),
     crop_name: str = Form("Unknown"),
     lat: float = Form(None),
@@ -25,26 +42,72 @@ async def predict_disease(
     """
     Upload a leaf image for disease diagnosis (Crop Doctor).
     """
-    safe_filename = f"{uuid.uuid4()}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, safe_filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    image_url = f"/static/uploads/diagnosis/{safe_filename}"
+    image = _store_upload(file.filename, file.file.read())
 
     svc = service.DiagnosisService(db)
-    result = svc.perform_diagnosis(image_url, crop_name, user_id=current_user.id)
+    result = svc.perform_diagnosis(image["image_url"], crop_name, user_id=current_user.id, model_image=image["model"])
 
+    result.thumbnail_url = image["thumbnail_url"]
     if lat and lng:
         result.location_lat = lat
         result.location_lng = lng
-        db.commit()
-        db.refresh(result)
+    db.commit()
+    db.refresh(result)
 
     return result
 
+@router.post("/predict/batch", response_model=schemas.BatchDiagnosisResponse)
+async def predict_disease_batch(
+    files: List[UploadFile] = File(...),
+    crop_name: str = Form("Unknown"),
+    field_name: str = Form(None),
+    lat: float = Form(None),
+    lng: float = Form(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload the photos of one field walk (scouting) in a single request.
+    Returns a diagnosis per photo, in upload order, plus a disease summary for the field.
+    """
+    if len(files) > settings.DIAGNOSIS_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.DIAGNOSIS_BATCH_MAX_FILES} images per batch")
+
+    io_slots = asyncio.Semaphore(settings.DIAGNOSIS_BATCH_IO_CONCURRENCY)
+
+    async def store(file: UploadFile) -> dict:
+        # A bad photo is reported as unusable; it must not fail the rest of the field walk
+        async with io_slots:
+            data = await file.read()
+            if not data:
+                return {"filename": file.filename, "error": "Empty file"}
+            try:
+                return await run_in_threadpool(_store_upload, file.filename, data)
+            except HTTPException as e:
+                return {"filename": file.filename, "error": e.detail}
+
+    images = await asyncio.gather(*(store(file) for file in files))
+
+    svc = service.DiagnosisService(db)
+    return await run_in_threadpool(
+        svc.perform_batch_diagnosis, list(images), crop_name,
+        user_id=current_user.id, lat=lat, lng=lng, field_name=field_name,
+    )
+
 @router.get("/history", response_model=list[schemas.DiagnosisResponse])
 def get_diagnosis_history(limit: int = 10, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     svc = service.DiagnosisService(db)
     return svc.get_history(limit, user_id=current_user.id)
+
+
+@router.get("/cache/stats")
+def diagnosis_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit rate and size of the diagnosis cache"""
+    return diagnosis_cache.get_stats()
+
+
+@router.delete("/cache")
+def invalidate_diagnosis_cache(current_user: User = Depends(get_current_user)):
+    """Drop all cached diagnoses (e.g. after changing prompts or models). Admin only."""
+    require_admin(current_user)
+    return {"invalidated": diagnosis_cache.invalidate()}
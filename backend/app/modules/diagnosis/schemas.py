@@ -13,6 +13,7 @@ class DiagnosisCreate(DiagnosisBase):
 
 class DiagnosisResponse(DiagnosisBase):
     id: int
+    thumbnail_url: Optional[str] = None
     disease_detected: str
     confidence_score: float
     recommendation: Optional[str]
@@ -25,3 +26,32 @@ class DiagnosisResponse(DiagnosisBase):
 
     class Config:
         from_attributes = True
+
+
+class BatchDiagnosisItem(BaseModel):
+    filename: str
+    duplicate_of: Optional[int] = None  # Index of the first identical photo in the upload
+    diagnosis: Optional[DiagnosisResponse] = None  # None when the photo could not be read
+    error: Optional[str] = None
+
+class DiseaseShare(BaseModel):
+    disease: str
+    count: int
+    share: float  # Fraction of usable photos
+    avg_confidence: float
+
+class FieldDiseaseSummary(BaseModel):
+    field_name: Optional[str] = None
+    crop_name: str
+    images: int
+    unique_images: int
+    healthy: int
+    diseased: int
+    unusable: int  # Unreadable files, "Not a Crop" / failed analyses
+    flagged_for_review: int
+    incidence: float  # Diseased share of usable photos
+    diseases: List[DiseaseShare]  # Most frequent first
+
+class BatchDiagnosisResponse(BaseModel):
+    results: List[BatchDiagnosisItem]
+    summary: FieldDiseaseSummary
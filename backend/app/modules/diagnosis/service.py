@@ -1,10 +1,17 @@
 # DOCUMENTATION_SOURCE: README.md
-import os
+import copy
 import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from sqlalchemy.orm import Session
 from . import models, schemas
 from app.modules.knowledge_graph.service import KnowledgeGraphService
+from app.core.config import settings
 from app.core.huggingface_service import get_huggingface_service
+from app.core.image_pipeline import ImageStore
+from .cache import diagnosis_cache
+from .model_registry import DISEASE_TREATMENTS, ModelRegistryService
+from .onnx_engine import local_classifier
 import json
 
 class DiagnosisService:
@@ -12,16 +19,21 @@ class DiagnosisService:
         self.db = db
         self.kg_service = KnowledgeGraphService(db)
         self.hf_service = get_huggingface_service()
+        self._kg_memo = {}
+        self._explanations = {}
 
-    def perform_diagnosis(self, image_url: str, crop: str = "Unknown", user_id: int = None) -> models.DiagnosisLog:
+    def perform_diagnosis(self, image_url: str, crop: str = "Unknown", user_id: int = None,
+                          model_image: bytes = None) -> models.DiagnosisLog:
         """
-        Perform AI-powered image diagnosis using Hugging Face (FREE)
-        Falls back to mock if unavailable.
+        Perform AI-powered image diagnosis: the local ONNX classifier from the
+        model registry first, Hugging Face (FREE) when it is missing or unsure.
+        Falls back to mock if neither is available.
+        `model_image` is the upload pipeline's 224x224 copy, when the caller has it.
         """
         
-        if self.hf_service.is_available():
+        if self.hf_service.is_available() or local_classifier.active_model_id(self.db) is not None:
             try:
-                return self._huggingface_diagnosis(image_url, crop, user_id)
+                return self._huggingface_diagnosis(image_url, crop, user_id, model_image)
             except Exception as e:
                 print(f"⚠️ Hugging Face diagnosis failed: {e}. Using mock.")
                 return self._mock_diagnosis(image_url, crop, user_id)
@@ -29,24 +41,282 @@ class DiagnosisService:
             print("ℹ️ Hugging Face not configured. Using mock diagnosis.")
             return self._mock_diagnosis(image_url, crop, user_id)
 
-    def _huggingface_diagnosis(self, image_url: str, crop: str, user_id: int = None) -> models.DiagnosisLog:
+    def perform_batch_diagnosis(self, images: List[dict], crop: str = "Unknown", user_id: int = None,
+                                lat: float = None, lng: float = None, field_name: str = None) -> dict:
+        """
+        Diagnose a field walk's photos in one pass. `images` are stored uploads
+        ({"filename", "image_url", "thumbnail_url", "sha256", "digest", "phash", "model"}),
+        or {"filename", "error"} for a photo that could not be read; those are
+        reported back as unusable without a log row.
+
+        Identical photos are analysed once; cached results are reused; the rest go
+        through the local classifier as one batch, and only the images it cannot
+        settle are sent to the remote pipeline (a few at a time). All log rows are
+        inserted in a single flush.
+        """
+        stored = [(i, image) for i, image in enumerate(images) if "error" not in image]
+        first_index: Dict[str, int] = {}
+        for i, image in stored:
+            first_index.setdefault(image["sha256"], i)
+        unique = [images[i] for i in first_index.values()]
+
+        analyses: Dict[str, tuple] = {}
+        for image in unique:
+            cached = diagnosis_cache.get(image["digest"], image["phash"], crop)
+            if cached is not None:
+                analyses[image["sha256"]] = (cached["disease"], cached["confidence"], cached["result"])
+        pending = [image for image in unique if image["sha256"] not in analyses]
+        print(f"🔬 Batch diagnosis: {len(images)} images ({len(images) - len(stored)} unreadable), "
+              f"{len(unique)} unique, {len(unique) - len(pending)} cached")
+
+        if pending:
+            try:
+                predictions = local_classifier.classify_many(self.db, [image["model"] for image in pending])
+            except Exception as e:
+                print(f"⚠️ Local classifier failed: {e}. Using remote vision.")
+                predictions = None
+            for image, prediction in zip(pending, predictions or []):
+                analysis = self._interpret_predictions(prediction, crop)
+                if analysis is not None:
+                    analyses[image["sha256"]] = analysis
+
+        remaining = [image for image in pending if image["sha256"] not in analyses]
+        if remaining and self.hf_service.is_available():
+            with ThreadPoolExecutor(max_workers=settings.DIAGNOSIS_BATCH_REMOTE_CONCURRENCY) as executor:
+                remote = executor.map(lambda image: self._analyze_image(image["model"], crop), remaining)
+                for image, analysis in zip(remaining, remote):
+                    analyses[image["sha256"]] = analysis
+        for image in remaining:
+            if image["sha256"] not in analyses:
+                analyses[image["sha256"]] = ("Analysis Failed", 0.0, {})
+
+        for image in pending:
+            disease_name, confidence, result = analyses[image["sha256"]]
+            if disease_name != "Analysis Failed":
+                diagnosis_cache.put(image["digest"], image["phash"], crop,
+                                    {"disease": disease_name, "confidence": confidence, "result": result})
+
+        entries = []
+        for _, image in stored:
+            disease_name, confidence, result = analyses[image["sha256"]]
+            entry = self._build_entry(image["image_url"], crop, user_id, disease_name, confidence, copy.deepcopy(result))
+            entry.thumbnail_url = image["thumbnail_url"]
+            entry.location_lat = lat
+            entry.location_lng = lng
+            entries.append(entry)
+
+        # One multi-row INSERT ... RETURNING for the whole batch; serialize before commit expires the rows
+        self.db.add_all(entries)
+        self.db.flush()
+        diagnoses = [schemas.DiagnosisResponse.model_validate(entry) for entry in entries]
+        flagged = sum(1 for entry in entries if entry.is_flagged_for_review)
+        self.db.commit()
+
+        results = [{"filename": image["filename"], "error": image.get("error")} for image in images]
+        for (i, image), diagnosis in zip(stored, diagnoses):
+            first = first_index[image["sha256"]]
+            results[i]["duplicate_of"] = first if first != i else None
+            results[i]["diagnosis"] = diagnosis
+        return {
+            "results": results,
+            "summary": self._field_summary(diagnoses, crop, field_name, len(unique), flagged,
+                                           rejected=len(images) - len(stored)),
+        }
+
+    @staticmethod
+    def _field_summary(diagnoses: List[schemas.DiagnosisResponse], crop: str, field_name: str,
+                       unique_images: int, flagged: int, rejected: int = 0) -> dict:
+        """Disease incidence across one batch of photos (`rejected`: unreadable uploads)"""
+        unusable = {"Analysis Failed", "Not a Crop"}
+        by_disease: Dict[str, List[float]] = {}
+        healthy = diseased = 0
+        for diagnosis in diagnoses:
+            if diagnosis.disease_detected in unusable:
+                continue
+            if diagnosis.disease_detected == "Healthy / Fresh":
+                healthy += 1
+                continue
+            diseased += 1
+            by_disease.setdefault(diagnosis.disease_detected, []).append(diagnosis.confidence_score or 0.0)
+        usable = healthy + diseased
+        diseases = sorted(
+            (
+                {
+                    "disease": disease,
+                    "count": len(scores),
+                    "share": round(len(scores) / usable, 3),
+                    "avg_confidence": round(sum(scores) / len(scores), 3),
+                }
+                for disease, scores in by_disease.items()
+            ),
+            key=lambda row: (-row["count"], row["disease"]),
+        )
+        return {
+            "field_name": field_name,
+            "crop_name": crop,
+            "images": len(diagnoses) + rejected,
+            "unique_images": unique_images,
+            "healthy": healthy,
+            "diseased": diseased,
+            "unusable": len(diagnoses) - usable + rejected,
+            "flagged_for_review": flagged,
+            "incidence": round(diseased / usable, 3) if usable else 0.0,
+            "diseases": diseases,
+        }
+
+    def _huggingface_diagnosis(self, image_url: str, crop: str, user_id: int = None,
+                               model_image: bytes = None) -> models.DiagnosisLog:
         """
         Use Hugging Face Vision AI (Hybrid Strategy) for diagnosis
         """
-        print(f"🔬 Analyzing image with Hugging Face Hybrid Vision: {image_url}")
+        print(f"🔬 Analyzing image (local classifier / Hugging Face Hybrid Vision): {image_url}")
         
-        # Handle local image paths
-        if image_url.startswith('/static/'):
-            local_path = os.path.join('static', image_url.replace('/static/', ''))
+        # Every stage works on the 224x224 model copy, never the camera original
+        image_bytes = model_image or ImageStore.model_copy(image_url)
+        
+        # Same photo (or a near-duplicate) for the same crop: reuse the parsed model output
+        fingerprint = diagnosis_cache.fingerprint(image_bytes) if image_bytes else None
+        cached = diagnosis_cache.get(*fingerprint, crop) if fingerprint else None
+        if cached is not None:
+            print("⚡ Diagnosis cache hit")
+            disease_name, confidence, result = cached["disease"], cached["confidence"], cached["result"]
         else:
-            local_path = image_url
-            
+            analysis = self._local_analysis(image_bytes, crop) if image_bytes else None
+            if analysis is None:
+                analysis = self._analyze_image(image_bytes or image_url, crop)
+            disease_name, confidence, result = analysis
+            if fingerprint and disease_name != "Analysis Failed":
+                diagnosis_cache.put(*fingerprint, crop, {"disease": disease_name, "confidence": confidence, "result": result})
+        
+        diagnosis_entry = self._build_entry(image_url, crop, user_id, disease_name, confidence, result)
+        
+        self.db.add(diagnosis_entry)
+        self.db.commit()
+        self.db.refresh(diagnosis_entry)
+        
+        return diagnosis_entry
+
+    def _build_entry(self, image_url: str, crop: str, user_id: int, disease_name: str,
+                     confidence: float, result: dict) -> models.DiagnosisLog:
+        """Turn a parsed analysis into an (unsaved) log entry with its recommendation"""
+        # Get treatment recommendation from KG
+        kg_recommendation = self._kg_recommendation(disease_name)
+        
+        # Determine final recommendation (Prefer LLM detailed info if KG is empty)
+        final_recommendation = kg_recommendation
+        
+        # Check for Healthy/Fresh status
+        is_healthy = False
+        if "healthy" in disease_name.lower() or "fresh" in disease_name.lower():
+            is_healthy = True
+            disease_name = "Healthy / Fresh"
+            final_recommendation = "✅ The crop appears to be fresh and healthy. No diseases detected."
+            # Clear detailed fields for healthy crops
+            result['cause'] = None
+            result['prevention'] = "Maintain current good practices."
+            result['treatment_organic'] = None
+            result['treatment_chemical'] = None
+        
+        elif "No specific data" in kg_recommendation and result and "treatment_organic" in result:
+             final_recommendation = f"Organic: {result.get('treatment_organic')}\nChemical: {result.get('treatment_chemical')}"
+
+        print(f"✅ Diagnosis complete! Disease: {disease_name}")
+        
+        # Create Log Entry
+        diagnosis_entry = models.DiagnosisLog(
+            user_id=user_id,
+            image_url=image_url,
+            crop_name=crop,
+            disease_detected=disease_name,
+            confidence_score=confidence,
+            recommendation=final_recommendation,
+            cause=result.get("cause"),
+            prevention=result.get("prevention"),
+            treatment_organic=result.get("treatment_organic"),
+            treatment_chemical=result.get("treatment_chemical"),
+            identified_crop=result.get("identified_crop")
+        )
+
+        # Drift Monitoring Logic
+        if confidence < 0.85:
+            diagnosis_entry.is_flagged_for_review = True
+        
+        return diagnosis_entry
+
+    def _kg_recommendation(self, disease_name: str) -> str:
+        """Treatment text from the Knowledge Graph (memoized per service instance)"""
+        if disease_name not in self._kg_memo:
+            if disease_name.lower() == "healthy":
+                recommendation = "No action needed. Crop looks healthy."
+            else:
+                recommendation = self.kg_service.get_treatment_for_pest(disease_name)
+            self._kg_memo[disease_name] = recommendation
+        return self._kg_memo[disease_name]
+
+    def _local_analysis(self, image_bytes: bytes, crop: str):
+        """
+        Classify with the registry's ONNX model on this server; the LLM is only
+        asked for the explanation of labels missing from DISEASE_TREATMENTS.
+        Returns None to fall back to the remote pipeline.
+        """
+        try:
+            predictions = local_classifier.classify(self.db, image_bytes)
+        except Exception as e:
+            print(f"⚠️ Local classifier failed: {e}. Using remote vision.")
+            return None
+        return self._interpret_predictions(predictions, crop)
+
+    def _interpret_predictions(self, predictions, crop: str):
+        """Top local prediction as (disease_name, confidence, result); None if missing or unsure"""
+        if not predictions:
+            return None
+        label, score = predictions[0]
+        disease_name = " ".join(label.replace("_", " ").split())  # "Tomato___Late_blight" -> "Tomato Late blight"
+        if score < settings.DIAGNOSIS_LOCAL_MIN_CONFIDENCE:
+            print(f"ℹ️ Local classifier unsure ({disease_name} {score:.2f}). Using remote vision.")
+            return None
+        print(f"✅ Local classifier v{local_classifier.version}: {disease_name} ({score:.2f})")
+        return disease_name, score, self._explain(disease_name, crop)
+
+    def _explain(self, disease_name: str, crop: str) -> dict:
+        """Cause/prevention/treatments for a classified disease (memoized per service instance)"""
+        if (disease_name, crop) in self._explanations:
+            return copy.deepcopy(self._explanations[disease_name, crop])
+        info = ModelRegistryService(self.db).get_treatment_for_disease(disease_name)
+        result = {"identified_crop": crop}
+        if any(info is known for known in DISEASE_TREATMENTS.values()):
+            result.update(info)
+            self._explanations[disease_name, crop] = result
+            return copy.deepcopy(result)
+
+        prompt = f"""You are an expert Plant Pathologist. A classifier detected "{disease_name}" on a {crop} plant.
+
+Return ONLY valid JSON (no markdown):
+{{
+    "symptoms": "Detailed visual description",
+    "cause": "Fungal infection caused by...",
+    "prevention": "Crop rotation, avoid overhead watering...",
+    "treatment_organic": "Neem oil...",
+    "treatment_chemical": "Mancozeb..."
+}}"""
+        try:
+            text = self.hf_service.generate_text(prompt).replace("```json", "").replace("```", "").strip()
+            explanation, _ = json.JSONDecoder().raw_decode(text[text.find('{'):])
+            result.update({key: explanation.get(key) for key in info})
+        except Exception as e:
+            print(f"⚠️ Explanation failed: {e}. Using generic advice.")
+            result.update(info)
+        self._explanations[disease_name, crop] = result
+        return copy.deepcopy(result)
+
+    def _analyze_image(self, image, crop: str):
+        """Run the hybrid vision pipeline and parse its JSON; returns (disease_name, confidence, result)"""
         try:
             # Initialize result to empty dict to prevent scope errors
             result = {}
             
             # This now returns a JSON string from the Hybrid Vision system
-            json_response = self.hf_service.analyze_image(local_path, crop)
+            json_response = self.hf_service.analyze_image(image, crop)
             
             # Clean and parse JSON
             clean_response = json_response.replace("```json", "").replace("```", "").strip()
@@ -111,60 +381,7 @@ class DiagnosisService:
             confidence = 0.0
             result = {}
         
-        # Get treatment recommendation from KG
-        kg_recommendation = ""
-        if disease_name.lower() == "healthy":
-            kg_recommendation = "No action needed. Crop looks healthy."
-        else:
-            kg_recommendation = self.kg_service.get_treatment_for_pest(disease_name)
-            if "No specific data" in kg_recommendation:
-                self.kg_service.seed_initial_data()
-                kg_recommendation = self.kg_service.get_treatment_for_pest(disease_name)
-        
-        # Determine final recommendation (Prefer LLM detailed info if KG is empty)
-        final_recommendation = kg_recommendation
-        
-        # Check for Healthy/Fresh status
-        is_healthy = False
-        if "healthy" in disease_name.lower() or "fresh" in disease_name.lower():
-            is_healthy = True
-            disease_name = "Healthy / Fresh"
-            final_recommendation = "✅ The crop appears to be fresh and healthy. No diseases detected."
-            # Clear detailed fields for healthy crops
-            result['cause'] = None
-            result['prevention'] = "Maintain current good practices."
-            result['treatment_organic'] = None
-            result['treatment_chemical'] = None
-        
-        elif "No specific data" in kg_recommendation and result and "treatment_organic" in result:
-             final_recommendation = f"Organic: {result.get('treatment_organic')}\nChemical: {result.get('treatment_chemical')}"
-
-        print(f"✅ Success with Hugging Face! Disease: {disease_name}")
-        
-        # Create Log Entry
-        diagnosis_entry = models.DiagnosisLog(
-            user_id=user_id,
-            image_url=image_url,
-            crop_name=crop,
-            disease_detected=disease_name,
-            confidence_score=confidence,
-            recommendation=final_recommendation,
-            cause=result.get("cause"),
-            prevention=result.get("prevention"),
-            treatment_organic=result.get("treatment_organic"),
-            treatment_chemical=result.get("treatment_chemical"),
-            identified_crop=result.get("identified_crop")
-        )
-
-        # Drift Monitoring Logic
-        if confidence < 0.85:
-            diagnosis_entry.is_flagged_for_review = True
-        
-        self.db.add(diagnosis_entry)
-        self.db.commit()
-        self.db.refresh(diagnosis_entry)
-        
-        return diagnosis_entry
+        return disease_name, confidence, result
 
     def _gemini_api_diagnosis(self, image_url: str, crop: str, api_key: str, genai) -> models.DiagnosisLog:
         """
@@ -184,17 +401,14 @@ class DiagnosisService:
             response = requests.get(image_url)
             image = PIL.Image.open(BytesIO(response.content))
         else:
-            # Local image
+            # Local image: the 224x224 model copy
             import PIL.Image
-            if image_url.startswith('/static/'):
-                local_path = os.path.join('static', image_url.replace('/static/', ''))
-            else:
-                local_path = image_url
-            
-            if not os.path.exists(local_path):
-                raise FileNotFoundError(f"Image file not found: {local_path}")
+            from io import BytesIO
+            model_image = ImageStore.model_copy(image_url)
+            if model_image is None:
+                raise FileNotFoundError(f"Image file not found: {image_url}")
             
-            image = PIL.Image.open(local_path)
+            image = PIL.Image.open(BytesIO(model_image))
         
         prompt = f"""
         You are an expert plant pathologist. Analyze this {crop} plant image.
@@ -236,10 +450,6 @@ class DiagnosisService:
             recommendation = "No action needed. Crop looks healthy."
         else:
             recommendation = self.kg_service.get_treatment_for_pest(disease_name)
-            
-            if "No specific data" in recommendation:
-                self.kg_service.seed_initial_data()
-                recommendation = self.kg_service.get_treatment_for_pest(disease_name)
         
         print(f"✅ Success with Gemini API!")
         
@@ -312,19 +522,13 @@ class DiagnosisService:
                         {"type": "image_url", "image_url": {"url": image_url}}
                     ]
                 else: 
-                     # Handle local file
-                     # Convert relative path to absolute
-                    if image_url.startswith('/static/'):
-                        local_path = os.path.join('static', image_url.replace('/static/', ''))
-                    else:
-                        local_path = image_url
-                    
-                    if not os.path.exists(local_path):
-                        raise FileNotFoundError(f"Image file not found: {local_path}")
+                    # Handle local file: send the 224x224 model copy, not the camera original
+                    model_image = ImageStore.model_copy(image_url)
+                    if model_image is None:
+                        raise FileNotFoundError(f"Image file not found: {image_url}")
                         
                     import base64
-                    with open(local_path, "rb") as image_file:
-                        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+                    encoded_string = base64.b64encode(model_image).decode('utf-8')
                         
                     message_content = [
                         {"type": "text", "text": prompt},
@@ -360,10 +564,6 @@ class DiagnosisService:
                     recommendation = "No action needed. Crop looks healthy."
                 else:
                     recommendation = self.kg_service.get_treatment_for_pest(disease_name)
-                    
-                    if "No specific data" in recommendation:
-                        self.kg_service.seed_initial_data()
-                        recommendation = self.kg_service.get_treatment_for_pest(disease_name)
                 
                 print(f"✅ Success with model: {model_name}")
                 
@@ -404,10 +604,6 @@ class DiagnosisService:
             recommendation = "No action needed. Crop looks healthy."
         else:
             recommendation = self.kg_service.get_treatment_for_pest(disease_name)
-            
-            if "No specific data" in recommendation:
-                self.kg_service.seed_initial_data()
-                recommendation = self.kg_service.get_treatment_for_pest(disease_name)
         
         diagnosis_entry = models.DiagnosisLog(
             user_id=user_id,
@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 from typing import List
 
-from app.core.database import get_db
+from app.core.database import get_db, get_reporting_db
 from app.modules.farm_management import models, schemas, services
 from app.modules.iot import service as iot_service
 from app.modules.iot import schemas as iot_schemas
@@ -322,14 +322,20 @@ def get_timeline(crop_cycle_id: int, db: Session = Depends(get_db), current_user
 
 # --- Financials ---
 @router.get("/financials/{farm_id}")
-def get_financials(farm_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Verify ownership
+def get_financials(
+    farm_id: int,
+    db: Session = Depends(get_db),
+    reporting_db: Session = Depends(get_reporting_db),
+    current_user: User = Depends(get_current_user),
+):
+    # Verify ownership (primary, so a just-created farm is visible)
     if not verify_farm_ownership(db, farm_id, current_user.id, raise_error=False):
         # Return empty/zero structure to avoid frontend crash if it expects data
         return {"revenue": 0, "expenses": 0, "profit": 0, "history": []}
     
     try:
-        svc = services.FarmManagementService(db)
+        # Aggregation runs on the reporting pool / read replica
+        svc = services.FarmManagementService(reporting_db)
         return svc.get_financial_summary(farm_id)
     except Exception as e:
         import traceback
@@ -0,0 +1,103 @@
+"""
+LoRaWAN Node Resolution Cache
+In-process DevEUI -> node metadata cache for the uplink hot path.
+
+Known devices resolve without touching lora_nodes; unknown DevEUIs are
+remembered in a short-lived negative cache so floods from unprovisioned
+devices do not turn into one query per uplink. Entries are invalidated
+explicitly on provisioning/updates; the TTL bounds staleness across workers.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+
+# Sentinel stored for DevEUIs known not to exist
+_MISSING = object()
+
+
+def normalize_eui(eui: str) -> str:
+    """
+    Canonical form used for lora_nodes.dev_eui, lora_gateways.gateway_id and cache keys:
+    upper-case hex without ':'/'-' separators ("70:b3:d5-..." -> "70B3D5...")
+    """
+    return eui.strip().upper().replace(":", "").replace("-", "")
+
+
+class NodeMetadataCache:
+    """Thread-safe TTL cache of {id, sensor_type, user_id, gateway_id} keyed by DevEUI"""
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 60.0, max_entries: int = 100000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0}
+
+    def lookup(self, dev_eui: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Returns (found, metadata). found=False means the caller must query the DB;
+        found=True with metadata=None is a cached "unknown device" answer.
+        """
+        key = normalize_eui(dev_eui)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return False, None
+            if entry[0] is _MISSING:
+                self._stats["negative_hits"] += 1
+                return True, None
+            self._stats["hits"] += 1
+            return True, entry[0]
+
+    def put(self, dev_eui: str, metadata: Optional[Dict[str, Any]]):
+        """Cache metadata for a DevEUI, or a negative entry when metadata is None"""
+        key = normalize_eui(dev_eui)
+        if metadata is None:
+            value, ttl = _MISSING, self.negative_ttl
+        else:
+            value, ttl = metadata, self.ttl
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                self._evict_expired()
+                if len(self._entries) >= self.max_entries:
+                    # Still full: drop the oldest inserted entry
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def invalidate(self, dev_euis: Iterable[str]):
+        """Drop cached entries (positive or negative) for the given DevEUIs"""
+        with self._lock:
+            for eui in dev_euis:
+                if self._entries.pop(normalize_eui(eui), None) is not None:
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [k for k, (_, expires_at) in self._entries.items() if expires_at < now]
+        for key in expired:
+            del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["negative_hits"]) / lookups * 100, 1) if lookups else 0.0
+        return stats
+
+
+node_cache = NodeMetadataCache(
+    ttl=settings.LORAWAN_NODE_CACHE_TTL,
+    negative_ttl=settings.LORAWAN_NODE_CACHE_NEGATIVE_TTL,
+)
@@ -0,0 +1,359 @@
+"""
+LoRaWAN Downlink Outbox
+Delivers queued lora_downlinks rows to ChirpStack/TTN off the request path.
+
+send_downlink only inserts a PENDING row and wakes the dispatcher. A
+background thread runs an asyncio loop that:
+  1. claims a batch of due PENDING rows (node + gateway resolved in one join,
+     FOR UPDATE SKIP LOCKED, with a lease that outlasts the whole batch so a
+     crashed worker's claims become due again but live ones are never re-sent),
+  2. posts them concurrently over one pooled httpx.AsyncClient per network
+     server endpoint, at most LORAWAN_DOWNLINK_GATEWAY_CONCURRENCY per gateway,
+  3. writes every outcome back with one bulk UPDATE, skipping rows whose
+     lease no longer belongs to this claim.
+
+Transport errors, 408/429 and 5xx responses are retried with exponential
+backoff; other 4xx responses fail immediately.
+"""
+import asyncio
+import math
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+from sqlalchemy import bindparam, or_
+
+from app.core.config import settings
+from app.core.database import IngestSessionLocal
+from .lorawan_models import LoRaDownlink, LoRaGateway, LoRaNode
+
+RETRYABLE_STATUS = {408, 425, 429}
+LEASE_MARGIN = 30.0  # Seconds on top of the worst-case batch time (claim + write-back)
+
+
+class DownlinkError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class DownlinkDispatcher:
+    """Outbox worker with pooled async HTTP clients and per-gateway concurrency limits"""
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        poll_interval: float = 5.0,
+        gateway_concurrency: int = 4,
+        max_attempts: int = 5,
+        retry_base: float = 2.0,
+        retry_max: float = 300.0,
+        timeout: float = 10.0,
+        lease_seconds: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.gateway_concurrency = gateway_concurrency
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+        # Worst case: the whole batch behind one gateway, each request taking the full timeout
+        rounds = math.ceil(batch_size / max(gateway_concurrency, 1))
+        self.lease_seconds = lease_seconds if lease_seconds is not None else rounds * timeout + LEASE_MARGIN
+        self.transport = transport  # Injectable for a fake network server
+
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._gateway_slots: Dict[int, asyncio.Semaphore] = {}
+        self._senders = {
+            "chirpstack": self._send_chirpstack,
+            "ttn": self._send_ttn,
+        }
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._stats = {
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "cycles": 0,
+            "last_batch_size": 0,
+        }
+
+    # ============ Lifecycle ============
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="lorawan-downlinks", daemon=True)
+        self._thread.start()
+        ready.wait(timeout=5)
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        self.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def notify(self):
+        """Wake the dispatcher (thread-safe; called after a downlink is queued)"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def _run(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._main(ready))
+        finally:
+            self._loop = None
+            loop.close()
+
+    async def _main(self, ready: threading.Event):
+        self._wakeup = asyncio.Event()
+        ready.set()
+        try:
+            while not self._stopping:
+                self._wakeup.clear()
+                try:
+                    claimed, next_retry = await self._cycle()
+                except Exception as e:
+                    print(f"❌ Downlink dispatch cycle failed: {e}")
+                    claimed, next_retry = 0, None
+                if claimed >= self.batch_size:
+                    continue  # Backlog: go straight to the next batch
+                delay = self.poll_interval if next_retry is None else min(self.poll_interval, next_retry)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        self._gateway_slots.clear()
+
+    # ============ Outbox ============
+
+    async def _cycle(self):
+        jobs = await asyncio.to_thread(self._claim)
+        if not jobs:
+            return 0, None
+        results = await self.dispatch(jobs)
+        await asyncio.to_thread(self._record, results, jobs[0]["lease_until"])
+
+        retries = [r["next_attempt_at"] for r in results if r["status"] == "PENDING"]
+        next_retry = (min(retries) - datetime.utcnow()).total_seconds() if retries else None
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["last_batch_size"] = len(jobs)
+        return len(jobs), next_retry
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        """Lock a batch of due downlinks and lease them to this worker"""
+        db = IngestSessionLocal()
+        try:
+            now = datetime.utcnow()
+            rows = db.query(
+                LoRaDownlink.id,
+                LoRaDownlink.payload,
+                LoRaDownlink.port,
+                LoRaDownlink.confirmed,
+                LoRaDownlink.attempts,
+                LoRaNode.dev_eui,
+                LoRaGateway.id.label("gateway_id"),
+                LoRaGateway.network_server,
+                LoRaGateway.api_endpoint,
+                LoRaGateway.api_key,
+            ).outerjoin(
+                LoRaNode, LoRaNode.id == LoRaDownlink.node_id
+            ).outerjoin(
+                LoRaGateway, LoRaGateway.id == LoRaNode.gateway_id
+            ).filter(
+                LoRaDownlink.status == "PENDING",
+                or_(LoRaDownlink.next_attempt_at.is_(None), LoRaDownlink.next_attempt_at <= now),
+            ).order_by(
+                LoRaDownlink.id
+            ).limit(self.batch_size).with_for_update(of=LoRaDownlink, skip_locked=True).all()
+
+            if not rows:
+                db.rollback()
+                return []
+
+            lease_until = now + timedelta(seconds=self.lease_seconds)
+            db.bulk_update_mappings(LoRaDownlink, [{"id": row.id, "next_attempt_at": lease_until} for row in rows])
+            db.commit()
+            return [{**row._mapping, "lease_until": lease_until} for row in rows]
+        finally:
+            db.close()
+
+    def _record(self, results: List[Dict[str, Any]], lease_until: datetime):
+        """
+        Write back all outcomes of a cycle in one transaction. A row is only
+        updated while it still carries this claim's lease, so a late write-back
+        never clobbers a row another worker has re-claimed since.
+        """
+        table = LoRaDownlink.__table__
+        stmt = table.update().where(
+            table.c.id == bindparam("b_id"),
+            table.c.status == "PENDING",
+            table.c.next_attempt_at == bindparam("b_lease"),
+        )
+        params = [
+            {
+                "b_id": r["id"],
+                "b_lease": lease_until,
+                "status": r["status"],
+                "attempts": r["attempts"],
+                "next_attempt_at": r["next_attempt_at"],
+                "last_error": r["last_error"],
+                "sent_at": r.get("sent_at"),
+            }
+            for r in results
+        ]
+        db = IngestSessionLocal()
+        try:
+            updated = db.execute(stmt, params).rowcount
+            db.commit()
+            if updated is not None and 0 <= updated < len(params):
+                print(f"[WARNING] {len(params) - updated} downlink(s) lost their lease before write-back")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # ============ Delivery ============
+
+    async def dispatch(self, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Deliver claimed jobs concurrently; returns one status mapping per job"""
+        return await asyncio.gather(*(self._deliver(job) for job in jobs))
+
+    async def _deliver(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        attempts = (job.get("attempts") or 0) + 1
+        try:
+            if not job.get("api_endpoint"):
+                raise DownlinkError("Node has no gateway with a network server endpoint", retryable=False)
+            sender = self._senders.get(job.get("network_server"))
+            if sender is None:
+                raise DownlinkError(f"Unsupported network server: {job.get('network_server')}", retryable=False)
+
+            slots = self._gateway_slots.get(job["gateway_id"])
+            if slots is None:
+                slots = self._gateway_slots[job["gateway_id"]] = asyncio.Semaphore(self.gateway_concurrency)
+            async with slots:
+                await asyncio.wait_for(sender(job), timeout=self.timeout)  # Bounds the request so the lease holds
+        except Exception as e:
+            return self._failure(job, attempts, e)
+
+        with self._lock:
+            self._stats["sent"] += 1
+        return {
+            "id": job["id"],
+            "status": "QUEUED",
+            "sent_at": datetime.utcnow(),
+            "attempts": attempts,
+            "next_attempt_at": None,
+            "last_error": None,
+        }
+
+    def _failure(self, job: Dict[str, Any], attempts: int, error: Exception) -> Dict[str, Any]:
+        if isinstance(error, DownlinkError):
+            retryable = error.retryable
+        elif isinstance(error, httpx.HTTPStatusError):
+            code = error.response.status_code
+            retryable = code >= 500 or code in RETRYABLE_STATUS
+        else:
+            retryable = isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+        message = f"{type(error).__name__}: {error}"[:500]
+        if retryable and attempts < self.max_attempts:
+            delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+            delay *= random.uniform(0.8, 1.2)  # Jitter so a recovering server is not hit in lockstep
+            with self._lock:
+                self._stats["retried"] += 1
+            return {
+                "id": job["id"],
+                "status": "PENDING",
+                "attempts": attempts,
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay),
+                "last_error": message,
+            }
+
+        print(f"❌ Downlink {job['id']} failed after {attempts} attempt(s): {message}")
+        with self._lock:
+            self._stats["failed"] += 1
+        return {
+            "id": job["id"],
+            "status": "FAILED",
+            "attempts": attempts,
+            "next_attempt_at": None,
+            "last_error": message,
+        }
+
+    def _client(self, endpoint: str) -> httpx.AsyncClient:
+        """One keep-alive connection pool per network server endpoint"""
+        client = self._clients.get(endpoint)
+        if client is None:
+            client = self._clients[endpoint] = httpx.AsyncClient(
+                base_url=endpoint,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                transport=self.transport,
+            )
+        return client
+
+    async def _send_chirpstack(self, job: Dict[str, Any]):
+        """Enqueue the downlink via the ChirpStack REST API"""
+        client = self._client(job["api_endpoint"])
+        response = await client.post(
+            f"/api/devices/{job['dev_eui']}/queue",
+            json={
+                "deviceQueueItem": {
+                    "devEui": job["dev_eui"],
+                    "confirmed": bool(job["confirmed"]),
+                    "fPort": job["port"],
+                    "data": job["payload"],
+                }
+            },
+            headers={"Authorization": f"Bearer {job['api_key']}"},
+        )
+        response.raise_for_status()
+
+    async def _send_ttn(self, job: Dict[str, Any]):
+        # TTN v3 needs application/device IDs that lora_gateways does not store yet
+        raise DownlinkError("TTN downlinks are not supported yet", retryable=False)
+
+    # ============ Metrics ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["endpoints"] = len(self._clients)
+        stats["running"] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+
+downlink_dispatcher = DownlinkDispatcher(
+    batch_size=settings.LORAWAN_DOWNLINK_BATCH_SIZE,
+    poll_interval=settings.LORAWAN_DOWNLINK_POLL_INTERVAL,
+    gateway_concurrency=settings.LORAWAN_DOWNLINK_GATEWAY_CONCURRENCY,
+    max_attempts=settings.LORAWAN_DOWNLINK_MAX_ATTEMPTS,
+    retry_base=settings.LORAWAN_DOWNLINK_RETRY_BASE,
+    retry_max=settings.LORAWAN_DOWNLINK_RETRY_MAX,
+    timeout=settings.LORAWAN_DOWNLINK_TIMEOUT,
+)
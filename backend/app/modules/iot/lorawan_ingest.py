@@ -0,0 +1,230 @@
+"""
+LoRaWAN Uplink Ingestion Queue
+Decouples the ChirpStack/TTN webhook from database writes.
+
+The webhook only validates and enqueues; a background writer thread drains
+the queue in micro-batches and hands them to LoRaWANService.process_uplink_batch
+(one bulk INSERT into lora_telemetry + one coalesced UPDATE per node).
+
+Uplinks are already acknowledged when they reach the writer, so a failed
+batch is never dropped: it is retried with backoff (transient DB errors),
+then bisected so a bad uplink only fails itself. Uplinks that still fail
+on their own go to lora_ingest_dead_letters, or to LORAWAN_DEAD_LETTER_FILE
+when the table cannot be written either.
+"""
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import IngestSessionLocal
+from .lorawan_models import LoRaIngestDeadLetter
+from .lorawan_service import LoRaWANService
+
+
+class UplinkIngestQueue:
+    """Bounded uplink queue with a single batching writer thread"""
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 20000,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Back-pressure / throughput metrics
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "written": 0,
+            "unknown_devices": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "retries": 0,
+            "split_batches": 0,
+            "dead_lettered": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "last_flush_at": None,
+        }
+
+    # ============ Producer side (webhook) ============
+
+    def submit(
+        self,
+        dev_eui: str,
+        payload_raw: str,
+        rssi: float = None,
+        snr: float = None,
+        spreading_factor: int = None,
+        frame_count: int = None,
+    ) -> bool:
+        """Enqueue an uplink without blocking. Returns False when the queue is full."""
+        uplink = {
+            "dev_eui": dev_eui,
+            "payload_raw": payload_raw,
+            "rssi": rssi,
+            "snr": snr,
+            "spreading_factor": spreading_factor,
+            "frame_count": frame_count,
+            "received_at": datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(uplink)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            return False
+        with self._lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    # ============ Consumer side (writer thread) ============
+
+    def start(self):
+        """Start the background writer (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="lorawan-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the writer after flushing everything already queued"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Block for the first uplink, then gather more until batch_size or flush_interval"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+        """One transaction for the batch; rolls back and re-raises on failure"""
+        db = IngestSessionLocal()
+        try:
+            return LoRaWANService(db).process_uplink_batch(batch)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _flush(self, batch: List[Dict[str, Any]]):
+        started = time.perf_counter()
+        delay = settings.LORAWAN_INGEST_RETRY_BASE
+        for attempt in range(settings.LORAWAN_INGEST_MAX_RETRIES + 1):
+            try:
+                result = self._write(batch)
+                break
+            except Exception as e:
+                error = e
+                with self._lock:
+                    self._stats["failed_batches"] += 1
+                print(f"❌ LoRaWAN ingest batch of {len(batch)} failed (attempt {attempt + 1}): {e}")
+            if attempt < settings.LORAWAN_INGEST_MAX_RETRIES:
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+        else:
+            # Still failing: most likely one bad uplink, so split until it is isolated
+            result = self._bisect(batch, error)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["written"] += result["written"]
+            self._stats["unknown_devices"] += result["unknown"]
+            self._stats["batches"] += 1
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self._stats["last_flush_at"] = datetime.utcnow().isoformat()
+
+    def _bisect(self, batch: List[Dict[str, Any]], error: Exception) -> Dict[str, int]:
+        """Write each half on its own; a single uplink that still fails is dead-lettered"""
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return {"written": 0, "unknown": 0}
+        with self._lock:
+            self._stats["split_batches"] += 1
+        totals = {"written": 0, "unknown": 0}
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                result = self._write(half)
+            except Exception as e:
+                result = self._bisect(half, e)
+            totals["written"] += result["written"]
+            totals["unknown"] += result["unknown"]
+        return totals
+
+    def _dead_letter(self, uplink: Dict[str, Any], error: Exception):
+        """Keep a rejected uplink for inspection/replay instead of dropping it"""
+        with self._lock:
+            self._stats["dead_lettered"] += 1
+        print(f"❌ LoRaWAN uplink from {uplink['dev_eui']} dead-lettered: {error}")
+        db = IngestSessionLocal()
+        try:
+            db.add(LoRaIngestDeadLetter(error=str(error)[:1000], **uplink))
+            db.commit()
+            return
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Dead-letter table unavailable ({e}); appending to {settings.LORAWAN_DEAD_LETTER_FILE}")
+        finally:
+            db.close()
+        record = dict(uplink, error=str(error), failed_at=datetime.utcnow().isoformat())
+        with open(settings.LORAWAN_DEAD_LETTER_FILE, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    # ============ Metrics ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth and writer throughput"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["queue_utilization"] = round(stats["queue_depth"] / max(self._queue.maxsize, 1) * 100, 1)
+        stats["batch_size"] = self.batch_size
+        stats["flush_interval"] = self.flush_interval
+        stats["running"] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+
+ingest_queue = UplinkIngestQueue(
+    batch_size=settings.LORAWAN_INGEST_BATCH_SIZE,
+    flush_interval=settings.LORAWAN_INGEST_FLUSH_INTERVAL,
+    max_queue_size=settings.LORAWAN_INGEST_QUEUE_SIZE,
+)
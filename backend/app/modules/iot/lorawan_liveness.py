@@ -0,0 +1,213 @@
+"""
+LoRaWAN Liveness Scheduler
+Flips nodes and gateways offline when their expected uplink does not arrive.
+
+Every observed uplink (or gateway status report) schedules a deadline in a
+min-heap: last_seen + LORAWAN_OFFLINE_GRACE_FACTOR * telemetry_interval for
+nodes, last_seen + LORAWAN_GATEWAY_TIMEOUT for gateways. The scheduler thread
+sleeps until the earliest deadline, so each event costs O(log n) and there is
+no periodic full-table scan. Superseded heap entries are skipped lazily.
+
+Expired entries are re-checked against the database (another worker may have
+seen a newer uplink) before being marked offline; each state change is
+recorded as a "device_offline" notification for the owner's dashboard.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import IngestSessionLocal
+from app.modules.feed.models import Notification
+from .lorawan_models import LoRaGateway, LoRaNode
+
+NODE = "node"
+GATEWAY = "gateway"
+
+
+class LivenessScheduler:
+    """Min-heap of (deadline, kind, id) with lazy invalidation"""
+
+    def __init__(self, grace_factor: float = 3.0, gateway_timeout: float = 1800.0, batch_size: int = 500):
+        self.grace_factor = grace_factor
+        self.gateway_timeout = gateway_timeout
+        self.batch_size = batch_size
+        self._heap: List[Tuple[float, str, int]] = []
+        self._deadlines: Dict[Tuple[str, int], float] = {}
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"nodes_offline": 0, "gateways_offline": 0, "rescheduled": 0}
+
+    # ============ Observations ============
+
+    def _schedule(self, kind: str, entity_id: int, deadline: float):
+        with self._cond:
+            key = (kind, entity_id)
+            if self._deadlines.get(key) == deadline:
+                return
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, kind, entity_id))
+            # Only wake the thread if this became the earliest deadline
+            if self._heap[0] == (deadline, kind, entity_id):
+                self._cond.notify()
+
+    @staticmethod
+    def _to_epoch(ts: datetime) -> float:
+        return (ts - datetime(1970, 1, 1)).total_seconds()
+
+    def observe_node(self, node_id: int, last_seen: datetime, telemetry_interval: Optional[int]):
+        interval = telemetry_interval or 900
+        self._schedule(NODE, node_id, self._to_epoch(last_seen) + self.grace_factor * interval)
+
+    def observe_gateway(self, gateway_id: int, last_seen: datetime):
+        self._schedule(GATEWAY, gateway_id, self._to_epoch(last_seen) + self.gateway_timeout)
+
+    def forget(self, kind: str, entity_id: int):
+        with self._cond:
+            self._deadlines.pop((kind, entity_id), None)
+
+    def seed(self):
+        """Schedule everything currently marked online (once, at startup)"""
+        db = IngestSessionLocal()
+        try:
+            now = datetime.utcnow()
+            for node_id, last_seen, interval in db.query(
+                LoRaNode.id, LoRaNode.last_seen, LoRaNode.telemetry_interval
+            ).filter(LoRaNode.is_online.is_(True)):
+                self.observe_node(node_id, last_seen or now, interval)
+            for gateway_id, last_seen in db.query(
+                LoRaGateway.id, LoRaGateway.last_seen
+            ).filter(LoRaGateway.is_online.is_(True)):
+                self.observe_gateway(gateway_id, last_seen or now)
+        finally:
+            db.close()
+
+    # ============ Scheduler thread ============
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop = False
+        try:
+            self.seed()
+        except Exception as e:
+            print(f"⚠️ Liveness seed failed: {e}")
+        self._thread = threading.Thread(target=self._run, name="lorawan-liveness", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def _pop_expired(self) -> Dict[str, List[int]]:
+        """Wait for the earliest deadline, then pop every live entry that has expired"""
+        with self._cond:
+            while not self._stop:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+            expired: Dict[str, List[int]] = {NODE: [], GATEWAY: []}
+            now = time.time()
+            count = 0
+            while self._heap and self._heap[0][0] <= now and count < self.batch_size:
+                deadline, kind, entity_id = heapq.heappop(self._heap)
+                if self._deadlines.get((kind, entity_id)) != deadline:
+                    continue  # Superseded by a newer observation
+                del self._deadlines[(kind, entity_id)]
+                expired[kind].append(entity_id)
+                count += 1
+            return expired
+
+    def _run(self):
+        while not self._stop:
+            expired = self._pop_expired()
+            if not (expired[NODE] or expired[GATEWAY]):
+                continue
+            try:
+                self._mark_offline(expired)
+            except Exception as e:
+                print(f"❌ Liveness update failed: {e}")
+
+    def _mark_offline(self, expired: Dict[str, List[int]]):
+        db = IngestSessionLocal()
+        try:
+            now = datetime.utcnow()
+            notifications = []
+
+            if expired[NODE]:
+                nodes = db.query(LoRaNode).filter(
+                    LoRaNode.id.in_(expired[NODE]),
+                    LoRaNode.is_online.is_(True),
+                ).with_for_update(skip_locked=True).all()
+                for node in nodes:
+                    grace = timedelta(seconds=self.grace_factor * (node.telemetry_interval or 900))
+                    if node.last_seen and node.last_seen + grace > now:
+                        # A newer uplink was written by another worker
+                        self.observe_node(node.id, node.last_seen, node.telemetry_interval)
+                        self._stats["rescheduled"] += 1
+                        continue
+                    node.is_online = False
+                    self._stats["nodes_offline"] += 1
+                    notifications.append(self._notification(node.user_id, node.id, f"LoRa node '{node.name}' went offline", node.last_seen))
+
+            if expired[GATEWAY]:
+                gateways = db.query(LoRaGateway).filter(
+                    LoRaGateway.id.in_(expired[GATEWAY]),
+                    LoRaGateway.is_online.is_(True),
+                ).with_for_update(skip_locked=True).all()
+                grace = timedelta(seconds=self.gateway_timeout)
+                for gateway in gateways:
+                    if gateway.last_seen and gateway.last_seen + grace > now:
+                        self.observe_gateway(gateway.id, gateway.last_seen)
+                        self._stats["rescheduled"] += 1
+                        continue
+                    gateway.is_online = False
+                    self._stats["gateways_offline"] += 1
+                    notifications.append(self._notification(gateway.user_id, gateway.id, f"LoRa gateway '{gateway.name}' went offline", gateway.last_seen))
+
+            if notifications:
+                db.bulk_insert_mappings(Notification, notifications)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _notification(user_id: int, entity_id: int, message: str, last_seen: Optional[datetime]) -> Dict[str, Any]:
+        if last_seen:
+            message += f" (last seen {last_seen:%Y-%m-%d %H:%M} UTC)"
+        return {
+            "user_id": user_id,
+            "actor_id": user_id,  # System event on the owner's own device
+            "type": "device_offline",
+            "message": message,
+            "related_id": entity_id,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            tracked = len(self._deadlines)
+            heap_size = len(self._heap)
+            next_deadline = self._heap[0][0] if self._heap else None
+        stats = dict(self._stats)
+        stats.update({
+            "tracked": tracked,
+            "heap_size": heap_size,
+            "next_check_in_seconds": round(max(next_deadline - time.time(), 0), 1) if next_deadline else None,
+            "running": bool(self._thread and self._thread.is_alive()),
+        })
+        return stats
+
+
+liveness = LivenessScheduler(
+    grace_factor=settings.LORAWAN_OFFLINE_GRACE_FACTOR,
+    gateway_timeout=settings.LORAWAN_GATEWAY_TIMEOUT,
+)
@@ -3,7 +3,7 @@ LoRaWAN Gateway Models
 Database models for LoRaWAN gateway and node management.
 Supports ChirpStack/TTN integration for farm-wide IoT coverage.
 """
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, JSON, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -109,6 +109,11 @@ class LoRaNode(Base):
 class LoRaTelemetry(Base):
     """Telemetry data received from LoRaWAN nodes"""
     __tablename__ = "lora_telemetry"
+    __table_args__ = (
+        # History queries filter by node and order by time (newest first)
+        Index("ix_lora_telemetry_node_received", "node_id", "received_at"),
+        Index("ix_lora_telemetry_received_at", "received_at"),  # Retention sweeps
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     node_id = Column(Integer, ForeignKey("lora_nodes.id"), nullable=False, index=True)
@@ -136,9 +141,69 @@ class LoRaTelemetry(Base):
     node = relationship("LoRaNode", back_populates="telemetry_logs")
 
 
+class LoRaTelemetryRollup(Base):
+    """
+    Pre-aggregated telemetry per node and time bucket (5m, 1h, 1d).
+    Maintained incrementally on ingest; avg = sum / count.
+    """
+    __tablename__ = "lora_telemetry_rollups"
+    __table_args__ = (
+        UniqueConstraint("node_id", "resolution", "bucket_start", name="uq_lora_rollup_bucket"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    node_id = Column(Integer, ForeignKey("lora_nodes.id"), nullable=False)
+    resolution = Column(String, nullable=False)  # 5m, 1h, 1d
+    bucket_start = Column(DateTime, nullable=False)
+    
+    temperature_count = Column(Integer, default=0)
+    temperature_sum = Column(Float, nullable=True)
+    temperature_min = Column(Float, nullable=True)
+    temperature_max = Column(Float, nullable=True)
+    
+    humidity_count = Column(Integer, default=0)
+    humidity_sum = Column(Float, nullable=True)
+    humidity_min = Column(Float, nullable=True)
+    humidity_max = Column(Float, nullable=True)
+    
+    soil_moisture_count = Column(Integer, default=0)
+    soil_moisture_sum = Column(Float, nullable=True)
+    soil_moisture_min = Column(Float, nullable=True)
+    soil_moisture_max = Column(Float, nullable=True)
+    
+    battery_voltage_count = Column(Integer, default=0)
+    battery_voltage_sum = Column(Float, nullable=True)
+    battery_voltage_min = Column(Float, nullable=True)
+    battery_voltage_max = Column(Float, nullable=True)
+    
+    # Uplinks folded into this bucket (including ones without any of the metrics above)
+    sample_count = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class LoRaIngestDeadLetter(Base):
+    """Acknowledged uplinks the ingest worker could not write, even one at a time"""
+    __tablename__ = "lora_ingest_dead_letters"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dev_eui = Column(String, index=True)
+    payload_raw = Column(String, nullable=True)
+    rssi = Column(Float, nullable=True)
+    snr = Column(Float, nullable=True)
+    spreading_factor = Column(Integer, nullable=True)
+    frame_count = Column(Integer, nullable=True)
+    received_at = Column(DateTime, nullable=True)  # When the webhook accepted it
+    error = Column(String, nullable=True)
+    failed_at = Column(DateTime, default=datetime.utcnow)
+
+
 class LoRaDownlink(Base):
     """Downlink commands sent to LoRaWAN nodes"""
     __tablename__ = "lora_downlinks"
+    __table_args__ = (
+        # Outbox scan: due PENDING rows
+        Index("ix_lora_downlinks_status_next_attempt", "status", "next_attempt_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     node_id = Column(Integer, ForeignKey("lora_nodes.id"), nullable=False, index=True)
@@ -152,6 +217,11 @@ class LoRaDownlink(Base):
     # Status
     status = Column(String, default="PENDING")  # PENDING, QUEUED, SENT, DELIVERED, FAILED
     
+    # Outbox delivery (see lorawan_downlinks.py)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, nullable=True)  # Retry backoff / claim lease
+    last_error = Column(String, nullable=True)
+    
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
     sent_at = Column(DateTime, nullable=True)
@@ -0,0 +1,325 @@
+"""
+LoRaWAN Bulk Provisioning
+Onboards hundreds or thousands of nodes/gateways from CSV or JSON in a few round-trips.
+
+Rows are validated in one pass up front (EUI format, enums, numbers), checked
+for duplicates against an in-memory set built from the file itself plus one
+IN-query per chunk of existing DevEUIs/gateway EUIs, and the survivors are
+inserted with chunked executemany INSERT ... RETURNING. Every input row gets
+a result: created (with its id), duplicate or invalid (with the reasons).
+"""
+import csv
+import io
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .lorawan_cache import node_cache, normalize_eui
+from .lorawan_models import LoRaGateway, LoRaNode
+from .lorawan_service import _health_cache
+
+EUI_RE = re.compile(r"[0-9A-F]{16}")
+KEY_RE = re.compile(r"[0-9A-F]{32}")
+
+NODE_TYPES = {"SENSOR", "ACTUATOR", "HYBRID"}
+ACTIVATION_MODES = {"OTAA", "ABP"}
+NETWORK_SERVERS = {"chirpstack", "ttn", "custom"}
+
+NODE_FIELDS = (
+    "dev_eui", "name", "description", "node_type", "sensor_type", "activation_mode",
+    "app_eui", "app_key", "gateway_id", "gateway_eui", "telemetry_interval",
+    "latitude", "longitude", "zone",
+)
+GATEWAY_FIELDS = (
+    "gateway_id", "name", "description", "hardware_type", "frequency_plan",
+    "latitude", "longitude", "altitude", "network_server", "api_endpoint", "api_key", "farm_id",
+)
+
+
+def parse_csv(content: str, fields: Iterable[str]) -> List[Dict[str, Any]]:
+    """CSV with a header row -> list of dicts; unknown columns are dropped, blanks become None"""
+    allowed = set(fields)
+    reader = csv.DictReader(io.StringIO(content.lstrip("\ufeff")))
+    if reader.fieldnames is None:
+        return []
+    header = [(name or "").strip().lower() for name in reader.fieldnames]
+    reader.fieldnames = header
+    rows = []
+    for record in reader:
+        rows.append({
+            key: (value.strip() or None) if isinstance(value, str) else value
+            for key, value in record.items()
+            if key in allowed
+        })
+    return rows
+
+
+def _chunks(items: List[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _normalize_euis(values: List[Any]) -> List[str]:
+    """Normalize a whole column at once (same canonical form as single-node provisioning and uplinks)"""
+    return [normalize_eui(str(v)) if v is not None else "" for v in values]
+
+
+def _coerce_number(row: Dict[str, Any], field: str, cast, errors: List[str]):
+    value = row.get(field)
+    if value is None or value == "":
+        row[field] = None
+        return
+    try:
+        row[field] = cast(value)
+    except (TypeError, ValueError):
+        errors.append(f"{field} must be a number")
+
+
+class BulkProvisioningService:
+    """Validate-then-insert provisioning for lora_nodes and lora_gateways"""
+
+    def __init__(self, db: Session, chunk_size: int = 1000):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    # ============ Nodes ============
+
+    def provision_nodes(self, user_id: int, rows: List[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+        results: List[Dict[str, Any]] = [{"row": i, "status": "invalid", "errors": []} for i in range(len(rows))]
+        euis = _normalize_euis([row.get("dev_eui") for row in rows])
+        app_euis = _normalize_euis([row.get("app_eui") for row in rows])
+        gateways = self._resolve_gateways(user_id, rows)
+
+        candidates: List[Tuple[int, Dict[str, Any]]] = []
+        seen: Set[str] = set()
+        for i, (row, eui, app_eui) in enumerate(zip(rows, euis, app_euis)):
+            errors = results[i]["errors"]
+            results[i]["dev_eui"] = eui or None
+            if not EUI_RE.fullmatch(eui):
+                errors.append("dev_eui must be 16 hex characters")
+            elif eui in seen:
+                results[i].update(status="duplicate")
+                errors.append("dev_eui repeated in this upload")
+                continue
+            seen.add(eui)
+
+            if not row.get("name"):
+                errors.append("name is required")
+            if app_eui and not EUI_RE.fullmatch(app_eui):
+                errors.append("app_eui must be 16 hex characters")
+            app_key = (row.get("app_key") or "").strip().upper()
+            if app_key and not KEY_RE.fullmatch(app_key):
+                errors.append("app_key must be 32 hex characters")
+            node_type = (row.get("node_type") or "SENSOR").upper()
+            if node_type not in NODE_TYPES:
+                errors.append(f"node_type must be one of {sorted(NODE_TYPES)}")
+            activation_mode = (row.get("activation_mode") or "OTAA").upper()
+            if activation_mode not in ACTIVATION_MODES:
+                errors.append(f"activation_mode must be one of {sorted(ACTIVATION_MODES)}")
+            for field, cast in (("latitude", float), ("longitude", float), ("telemetry_interval", int)):
+                _coerce_number(row, field, cast, errors)
+
+            gateway_pk, gateway_error = self._gateway_for_row(row, gateways)
+            if gateway_error:
+                errors.append(gateway_error)
+            if errors:
+                continue
+
+            candidates.append((i, {
+                "user_id": user_id,
+                "gateway_id": gateway_pk,
+                "dev_eui": eui,
+                "app_eui": app_eui or None,
+                "name": row["name"],
+                "description": row.get("description"),
+                "node_type": node_type,
+                "sensor_type": row.get("sensor_type"),
+                "activation_mode": activation_mode,
+                "app_key": app_key or None,
+                "telemetry_interval": row.get("telemetry_interval") or 900,
+                "latitude": row.get("latitude"),
+                "longitude": row.get("longitude"),
+                "zone": row.get("zone"),
+            }))
+
+        created = self._insert(LoRaNode, LoRaNode.dev_eui, "dev_eui", candidates, results, dry_run)
+        if created and not dry_run:
+            # Uplinks that arrived before provisioning left negative cache entries
+            node_cache.invalidate(eui for _, eui in created)
+            _health_cache.pop(user_id, None)
+        return self._summary(results, dry_run)
+
+    def _resolve_gateways(self, user_id: int, rows: List[Dict[str, Any]]) -> Dict[str, Dict[Any, int]]:
+        """One query for every gateway referenced by id or EUI, restricted to the caller's gateways"""
+        ids: Set[int] = set()
+        for row in rows:
+            try:
+                if row.get("gateway_id") not in (None, ""):
+                    ids.add(int(row["gateway_id"]))
+            except (TypeError, ValueError):
+                pass
+        gateway_euis = {eui for eui in _normalize_euis([row.get("gateway_eui") for row in rows]) if eui}
+        if not ids and not gateway_euis:
+            return {"by_id": {}, "by_eui": {}}
+
+        owned = self.db.query(LoRaGateway.id, LoRaGateway.gateway_id).filter(
+            LoRaGateway.user_id == user_id
+        ).all()
+        owned_euis = _normalize_euis([eui for _, eui in owned])
+        return {
+            "by_id": {pk: pk for pk, _ in owned if pk in ids},
+            "by_eui": {eui: pk for (pk, _), eui in zip(owned, owned_euis) if eui in gateway_euis},
+        }
+
+    @staticmethod
+    def _gateway_for_row(row: Dict[str, Any], gateways: Dict[str, Dict[Any, int]]) -> Tuple[Optional[int], Optional[str]]:
+        if row.get("gateway_id") not in (None, ""):
+            try:
+                pk = int(row["gateway_id"])
+            except (TypeError, ValueError):
+                return None, "gateway_id must be an integer"
+            if pk not in gateways["by_id"]:
+                return None, f"gateway {pk} not found"
+            return pk, None
+        if row.get("gateway_eui"):
+            eui = _normalize_euis([row["gateway_eui"]])[0]
+            if eui not in gateways["by_eui"]:
+                return None, f"gateway {eui} not found"
+            return gateways["by_eui"][eui], None
+        return None, None
+
+    # ============ Gateways ============
+
+    def provision_gateways(self, user_id: int, rows: List[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+        results: List[Dict[str, Any]] = [{"row": i, "status": "invalid", "errors": []} for i in range(len(rows))]
+        euis = _normalize_euis([row.get("gateway_id") for row in rows])
+
+        candidates: List[Tuple[int, Dict[str, Any]]] = []
+        seen: Set[str] = set()
+        for i, (row, eui) in enumerate(zip(rows, euis)):
+            errors = results[i]["errors"]
+            results[i]["gateway_id"] = eui or None
+            if not EUI_RE.fullmatch(eui):
+                errors.append("gateway_id must be 16 hex characters")
+            elif eui in seen:
+                results[i].update(status="duplicate")
+                errors.append("gateway_id repeated in this upload")
+                continue
+            seen.add(eui)
+
+            if not row.get("name"):
+                errors.append("name is required")
+            network_server = (row.get("network_server") or "chirpstack").lower()
+            if network_server not in NETWORK_SERVERS:
+                errors.append(f"network_server must be one of {sorted(NETWORK_SERVERS)}")
+            for field, cast in (("latitude", float), ("longitude", float), ("altitude", float), ("farm_id", int)):
+                _coerce_number(row, field, cast, errors)
+            if errors:
+                continue
+
+            candidates.append((i, {
+                "user_id": user_id,
+                "farm_id": row.get("farm_id"),
+                "gateway_id": eui,
+                "name": row["name"],
+                "description": row.get("description"),
+                "hardware_type": row.get("hardware_type") or "RAK2287",
+                "frequency_plan": (row.get("frequency_plan") or "IN865").upper(),
+                "latitude": row.get("latitude"),
+                "longitude": row.get("longitude"),
+                "altitude": row.get("altitude") or 0,
+                "network_server": network_server,
+                "api_endpoint": row.get("api_endpoint"),
+                "api_key": row.get("api_key"),
+            }))
+
+        created = self._insert(LoRaGateway, LoRaGateway.gateway_id, "gateway_id", candidates, results, dry_run)
+        if created and not dry_run:
+            _health_cache.pop(user_id, None)
+        return self._summary(results, dry_run)
+
+    # ============ Shared insert path ============
+
+    def _existing(self, column, values: List[str]) -> Set[str]:
+        return {value for (value,) in self.db.query(column).filter(column.in_(values))}
+
+    def _insert(
+        self,
+        model,
+        unique_column,
+        key: str,
+        candidates: List[Tuple[int, Dict[str, Any]]],
+        results: List[Dict[str, Any]],
+        dry_run: bool,
+    ) -> List[Tuple[int, str]]:
+        """Chunked executemany INSERT ... RETURNING id; already-registered keys become duplicates"""
+        created: List[Tuple[int, str]] = []
+        for chunk in _chunks(candidates, self.chunk_size):
+            existing = self._existing(unique_column, [values[key] for _, values in chunk])
+            fresh = []
+            for i, values in chunk:
+                if values[key] in existing:
+                    results[i].update(status="duplicate")
+                    results[i]["errors"].append(f"{key} already registered")
+                else:
+                    fresh.append((i, values))
+            if not fresh:
+                continue
+            if dry_run:
+                for i, values in fresh:
+                    results[i]["status"] = "valid"
+                continue
+
+            try:
+                with self.db.begin_nested():
+                    ids = self.db.scalars(
+                        insert(model).returning(model.id, sort_by_parameter_order=True),
+                        [values for _, values in fresh],
+                    ).all()
+                inserted = list(zip(fresh, ids))
+            except IntegrityError:
+                # A concurrent registration or a bad reference: isolate the offending rows
+                inserted = self._insert_rows(model, key, fresh, results)
+            for (i, values), pk in inserted:
+                results[i].update(status="created", id=pk)
+                created.append((pk, values[key]))
+
+        if not dry_run:
+            self.db.commit()
+        return created
+
+    def _insert_rows(self, model, key: str, rows: List[Tuple[int, Dict[str, Any]]], results: List[Dict[str, Any]]):
+        """Row-at-a-time fallback for a chunk the database rejected as a whole"""
+        inserted = []
+        for i, values in rows:
+            try:
+                with self.db.begin_nested():
+                    pk = self.db.scalar(insert(model).returning(model.id), values)
+                inserted.append(((i, values), pk))
+            except IntegrityError as e:
+                if self._existing(getattr(model, key), [values[key]]):
+                    results[i].update(status="duplicate")
+                    results[i]["errors"].append(f"{key} already registered")
+                else:
+                    results[i]["errors"].append(f"rejected by database: {str(e.orig).splitlines()[0]}")
+        return inserted
+
+    @staticmethod
+    def _summary(results: List[Dict[str, Any]], dry_run: bool) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if not result["errors"]:
+                del result["errors"]
+        return {
+            "dry_run": dry_run,
+            "total": len(results),
+            "created": counts.get("created", 0),
+            "valid": counts.get("valid", 0),
+            "duplicate": counts.get("duplicate", 0),
+            "invalid": counts.get("invalid", 0),
+            "results": results,
+        }
@@ -0,0 +1,261 @@
+"""
+LoRaWAN Telemetry Rollups
+Continuous 5-minute / hourly / daily min-max-avg-count aggregates of lora_telemetry.
+
+Rollups are folded in on ingest with one INSERT ... ON CONFLICT DO UPDATE per
+micro-batch, so dashboards can read long windows from a handful of buckets
+instead of scanning raw telemetry.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case
+from sqlalchemy.orm import Session
+
+from .lorawan_models import LoRaTelemetry, LoRaTelemetryRollup
+
+ROLLUP_METRICS = ("temperature", "humidity", "soil_moisture", "battery_voltage")
+
+# Finest -> coarsest
+RESOLUTIONS: "OrderedDict[str, timedelta]" = OrderedDict([
+    ("5m", timedelta(minutes=5)),
+    ("1h", timedelta(hours=1)),
+    ("1d", timedelta(days=1)),
+])
+
+
+def bucket_start(ts: datetime, resolution: str) -> datetime:
+    """Floor a timestamp to the start of its rollup bucket"""
+    if resolution == "5m":
+        return ts.replace(minute=ts.minute - ts.minute % 5, second=0, microsecond=0)
+    if resolution == "1h":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if resolution == "1d":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def aggregate_rows(rows: Iterable[Dict[str, Any]]) -> Dict[Tuple[int, str, datetime], Dict[str, Any]]:
+    """
+    Fold telemetry rows (dicts with node_id, received_at and metric values)
+    into partial aggregates keyed by (node_id, resolution, bucket_start).
+    """
+    partials: Dict[Tuple[int, str, datetime], Dict[str, Any]] = {}
+    for row in rows:
+        for resolution in RESOLUTIONS:
+            key = (row["node_id"], resolution, bucket_start(row["received_at"], resolution))
+            agg = partials.get(key)
+            if agg is None:
+                agg = partials[key] = _empty_aggregate(*key)
+            agg["sample_count"] += 1
+            for metric in ROLLUP_METRICS:
+                value = row.get(metric)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                agg[f"{metric}_count"] += 1
+                agg[f"{metric}_sum"] = (agg[f"{metric}_sum"] or 0.0) + value
+                current_min = agg[f"{metric}_min"]
+                current_max = agg[f"{metric}_max"]
+                agg[f"{metric}_min"] = value if current_min is None or value < current_min else current_min
+                agg[f"{metric}_max"] = value if current_max is None or value > current_max else current_max
+    return partials
+
+
+def _empty_aggregate(node_id: int, resolution: str, start: datetime) -> Dict[str, Any]:
+    agg = {"node_id": node_id, "resolution": resolution, "bucket_start": start, "sample_count": 0}
+    for metric in ROLLUP_METRICS:
+        agg[f"{metric}_count"] = 0
+        agg[f"{metric}_sum"] = None
+        agg[f"{metric}_min"] = None
+        agg[f"{metric}_max"] = None
+    return agg
+
+
+def _coalesce_sum(existing, incoming):
+    return case(
+        (existing.is_(None), incoming),
+        (incoming.is_(None), existing),
+        else_=existing + incoming,
+    )
+
+
+def _coalesce_extreme(existing, incoming, pick_incoming):
+    # LEAST/GREATEST differ between PostgreSQL and SQLite in NULL handling; CASE is portable
+    return case(
+        (existing.is_(None), incoming),
+        (incoming.is_(None), existing),
+        (pick_incoming, incoming),
+        else_=existing,
+    )
+
+
+class TelemetryRollupService:
+    """Maintains and queries lora_telemetry_rollups"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def apply(self, telemetry_rows: List[Dict[str, Any]]):
+        """Merge a batch of telemetry rows into the rollups (caller commits)"""
+        partials = aggregate_rows(telemetry_rows)
+        if not partials:
+            return
+
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            self._apply_orm(partials)
+            return
+
+        table = LoRaTelemetryRollup.__table__
+        stmt = insert(table)
+        excluded = stmt.excluded
+        updates = {
+            "sample_count": table.c.sample_count + excluded.sample_count,
+            "updated_at": datetime.utcnow(),
+        }
+        for metric in ROLLUP_METRICS:
+            updates[f"{metric}_count"] = table.c[f"{metric}_count"] + excluded[f"{metric}_count"]
+            updates[f"{metric}_sum"] = _coalesce_sum(table.c[f"{metric}_sum"], excluded[f"{metric}_sum"])
+            updates[f"{metric}_min"] = _coalesce_extreme(
+                table.c[f"{metric}_min"], excluded[f"{metric}_min"],
+                excluded[f"{metric}_min"] < table.c[f"{metric}_min"],
+            )
+            updates[f"{metric}_max"] = _coalesce_extreme(
+                table.c[f"{metric}_max"], excluded[f"{metric}_max"],
+                excluded[f"{metric}_max"] > table.c[f"{metric}_max"],
+            )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["node_id", "resolution", "bucket_start"],
+            set_=updates,
+        )
+        now = datetime.utcnow()
+        self.db.execute(stmt, [dict(agg, updated_at=now) for agg in partials.values()])
+
+    def _apply_orm(self, partials: Dict[Tuple[int, str, datetime], Dict[str, Any]]):
+        """Fallback for databases without ON CONFLICT (read-merge-write)"""
+        for (node_id, resolution, start), agg in partials.items():
+            rollup = self.db.query(LoRaTelemetryRollup).filter(
+                LoRaTelemetryRollup.node_id == node_id,
+                LoRaTelemetryRollup.resolution == resolution,
+                LoRaTelemetryRollup.bucket_start == start,
+            ).first()
+            if rollup is None:
+                self.db.add(LoRaTelemetryRollup(**agg))
+                continue
+            rollup.sample_count += agg["sample_count"]
+            for metric in ROLLUP_METRICS:
+                if not agg[f"{metric}_count"]:
+                    continue
+                setattr(rollup, f"{metric}_count", (getattr(rollup, f"{metric}_count") or 0) + agg[f"{metric}_count"])
+                setattr(rollup, f"{metric}_sum", (getattr(rollup, f"{metric}_sum") or 0.0) + agg[f"{metric}_sum"])
+                current_min = getattr(rollup, f"{metric}_min")
+                current_max = getattr(rollup, f"{metric}_max")
+                setattr(rollup, f"{metric}_min", agg[f"{metric}_min"] if current_min is None else min(current_min, agg[f"{metric}_min"]))
+                setattr(rollup, f"{metric}_max", agg[f"{metric}_max"] if current_max is None else max(current_max, agg[f"{metric}_max"]))
+
+    # ============ Query API ============
+
+    @staticmethod
+    def pick_resolution(window: timedelta, max_points: int, raw_interval_seconds: int = 900) -> str:
+        """
+        Choose the finest resolution whose point count fits the budget:
+        raw rows if the window is short enough, otherwise the first rollup
+        level that needs at most max_points buckets (daily as the last resort).
+        """
+        if window.total_seconds() / max(raw_interval_seconds, 1) <= max_points:
+            return "raw"
+        for resolution, step in RESOLUTIONS.items():
+            if window / step <= max_points:
+                return resolution
+        return "1d"
+
+    def get_series(
+        self,
+        node_id: int,
+        start: datetime,
+        end: datetime,
+        max_points: int = 500,
+        resolution: Optional[str] = None,
+        raw_interval_seconds: int = 900,
+    ) -> Dict[str, Any]:
+        """
+        Telemetry for a window, downsampled to fit max_points. When the points still
+        do not fit (a node reporting faster than raw_interval_seconds, or an explicit
+        resolution that is too fine for the window) the newest max_points are kept
+        and "truncated" is set; an automatically chosen raw series moves up to the
+        first rollup level that fits instead.
+        """
+        auto = resolution is None
+        resolution = resolution or self.pick_resolution(end - start, max_points, raw_interval_seconds)
+        truncated = False
+
+        if resolution == "raw":
+            # Newest first, so a limit drops the oldest rows rather than the latest ones
+            rows = self.db.query(LoRaTelemetry).filter(
+                LoRaTelemetry.node_id == node_id,
+                LoRaTelemetry.received_at >= start,
+                LoRaTelemetry.received_at < end,
+            ).order_by(LoRaTelemetry.received_at.desc()).limit(max_points + 1).all()
+            if len(rows) > max_points and auto:
+                # More rows than the interval suggested: the first rollup level that fits
+                resolution = next((r for r, step in RESOLUTIONS.items() if (end - start) / step <= max_points), "1d")
+            else:
+                truncated = len(rows) > max_points
+                points = [
+                    {
+                        "timestamp": row.received_at,
+                        **{
+                            metric: _raw_point(getattr(row, metric))
+                            for metric in ROLLUP_METRICS
+                        },
+                    }
+                    for row in reversed(rows[:max_points])
+                ]
+
+        if resolution != "raw":
+            rollups = self.db.query(LoRaTelemetryRollup).filter(
+                LoRaTelemetryRollup.node_id == node_id,
+                LoRaTelemetryRollup.resolution == resolution,
+                LoRaTelemetryRollup.bucket_start >= bucket_start(start, resolution),
+                LoRaTelemetryRollup.bucket_start < end,
+            ).order_by(LoRaTelemetryRollup.bucket_start.desc()).limit(max_points + 1).all()
+            truncated = len(rollups) > max_points
+            points = [
+                {
+                    "timestamp": rollup.bucket_start,
+                    **{metric: _rollup_point(rollup, metric) for metric in ROLLUP_METRICS},
+                }
+                for rollup in reversed(rollups[:max_points])
+            ]
+
+        return {
+            "node_id": node_id,
+            "resolution": resolution,
+            "start": start,
+            "end": end,
+            "points": points,
+            "truncated": truncated,
+        }
+
+
+def _raw_point(value) -> Optional[Dict[str, Any]]:
+    if value is None:
+        return None
+    return {"min": value, "max": value, "avg": value, "count": 1}
+
+
+def _rollup_point(rollup: LoRaTelemetryRollup, metric: str) -> Optional[Dict[str, Any]]:
+    count = getattr(rollup, f"{metric}_count")
+    if not count:
+        return None
+    return {
+        "min": getattr(rollup, f"{metric}_min"),
+        "max": getattr(rollup, f"{metric}_max"),
+        "avg": round(getattr(rollup, f"{metric}_sum") / count, 3),
+        "count": count,
+    }
@@ -2,14 +2,23 @@
 LoRaWAN Gateway API Router
 Endpoints for gateway/node management and telemetry.
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List, Optional
-from app.core.database import get_db
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from app.core.config import settings
+from app.core.database import get_async_db, get_async_reporting_db, get_pool_stats
 from app.modules.auth.dependencies import get_current_user_id
 from .lorawan_service import LoRaWANService
-from .lorawan_models import LoRaGateway, LoRaNode
+from .lorawan_ingest import ingest_queue
+from .lorawan_cache import node_cache
+from .lorawan_liveness import liveness
+from .lorawan_downlinks import downlink_dispatcher
+from .lorawan_provisioning import BulkProvisioningService, parse_csv, NODE_FIELDS, GATEWAY_FIELDS
+from .lorawan_codecs import codec_registry
+from .lorawan_models import LoRaGateway, LoRaNode, LoRaDownlink
 
 
 router = APIRouter(prefix="/lorawan", tags=["LoRaWAN"])
@@ -39,7 +48,7 @@ class GatewayResponse(BaseModel):
     latitude: Optional[float]
     longitude: Optional[float]
     is_online: bool
-    last_seen: Optional[str]
+    last_seen: Optional[datetime]
     rx_packets_total: int
     tx_packets_total: int
     
@@ -61,6 +70,16 @@ class NodeCreate(BaseModel):
     zone: Optional[str] = None
 
 
+class NodeUpdate(BaseModel):
+    name: Optional[str] = None
+    sensor_type: Optional[str] = None
+    gateway_id: Optional[int] = None
+    telemetry_interval: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    zone: Optional[str] = None
+
+
 class NodeResponse(BaseModel):
     id: int
     dev_eui: str
@@ -71,7 +90,7 @@ class NodeResponse(BaseModel):
     battery_level: Optional[float]
     rssi: Optional[float]
     snr: Optional[float]
-    last_seen: Optional[str]
+    last_seen: Optional[datetime]
     last_telemetry: dict
     zone: Optional[str]
     latitude: Optional[float]
@@ -90,12 +109,66 @@ class TelemetryResponse(BaseModel):
     temperature: Optional[float]
     humidity: Optional[float]
     soil_moisture: Optional[float]
-    received_at: str
+    received_at: datetime
     
     class Config:
         from_attributes = True
 
 
+class MetricPoint(BaseModel):
+    min: Optional[float]
+    max: Optional[float]
+    avg: Optional[float]
+    count: int
+
+
+class SeriesPoint(BaseModel):
+    timestamp: datetime
+    temperature: Optional[MetricPoint] = None
+    humidity: Optional[MetricPoint] = None
+    soil_moisture: Optional[MetricPoint] = None
+    battery_voltage: Optional[MetricPoint] = None
+
+
+class TelemetrySeriesResponse(BaseModel):
+    node_id: int
+    resolution: str  # raw, 5m, 1h, 1d
+    start: datetime
+    end: datetime
+    points: List[SeriesPoint]
+    truncated: bool = False  # Only the newest max_points were returned
+
+
+class NodeBulkCreate(BaseModel):
+    # Rows are validated individually so one bad row does not reject the upload
+    nodes: List[Dict[str, Any]]
+    dry_run: bool = False
+
+
+class GatewayBulkCreate(BaseModel):
+    gateways: List[Dict[str, Any]]
+    dry_run: bool = False
+
+
+class BulkRowResult(BaseModel):
+    row: int
+    status: str  # created, valid (dry run), duplicate, invalid
+    id: Optional[int] = None
+    dev_eui: Optional[str] = None
+    gateway_id: Optional[str] = None
+    errors: Optional[List[str]] = None
+
+
+class BulkProvisionResponse(BaseModel):
+    dry_run: bool
+    total: int
+    created: int
+    valid: int
+    duplicate: int
+    invalid: int
+    results: List[BulkRowResult]
+
+
 class DownlinkCreate(BaseModel):
     payload: str
     port: int = 1
@@ -118,6 +191,8 @@ class NetworkHealthResponse(BaseModel):
     average_rssi: float
     average_snr: float
     network_coverage: float
+    last_uplink_at: Optional[datetime] = None  # Most recent uplink from any node
+    computed_at: datetime  # When these figures were computed (may be up to LORAWAN_HEALTH_CACHE_TTL old)
 
 
 # ============ Gateway Endpoints ============
@@ -125,12 +200,11 @@ class NetworkHealthResponse(BaseModel):
 @router.post("/gateways", response_model=GatewayResponse)
 async def create_gateway(
     data: GatewayCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Register a new LoRaWAN gateway"""
-    service = LoRaWANService(db)
-    gateway = service.create_gateway(
+    return await db.run_sync(lambda session: LoRaWANService(session).create_gateway(
         user_id=user_id,
         gateway_id=data.gateway_id,
         name=data.name,
@@ -141,45 +215,113 @@ async def create_gateway(
         network_server=data.network_server,
         api_endpoint=data.api_endpoint,
         farm_id=data.farm_id,
-    )
-    return gateway
+    ))
 
 
 @router.get("/gateways", response_model=List[GatewayResponse])
 async def get_gateways(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get all gateways for the current user"""
-    service = LoRaWANService(db)
-    return service.get_gateways(user_id)
+    return await db.run_sync(lambda session: LoRaWANService(session).get_gateways(user_id))
 
 
 @router.get("/gateways/{gateway_id}", response_model=GatewayResponse)
 async def get_gateway(
     gateway_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get a specific gateway"""
-    service = LoRaWANService(db)
-    gateway = service.get_gateway(gateway_id, user_id)
+    gateway = await db.run_sync(lambda session: LoRaWANService(session).get_gateway(gateway_id, user_id))
     if not gateway:
         raise HTTPException(status_code=404, detail="Gateway not found")
     return gateway
 
 
+def _bulk_rows(rows: List[Dict[str, Any]], fields) -> List[Dict[str, Any]]:
+    if len(rows) > settings.LORAWAN_BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.LORAWAN_BULK_MAX_ROWS} rows per request")
+    allowed = set(fields)
+    return [{k: v for k, v in row.items() if k in allowed} for row in rows]
+
+
+async def _read_csv(file: UploadFile, fields) -> List[Dict[str, Any]]:
+    try:
+        content = (await file.read()).decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+    return _bulk_rows(parse_csv(content, fields), fields)
+
+
+@router.post("/gateways/bulk", response_model=BulkProvisionResponse)
+async def bulk_create_gateways(
+    data: GatewayBulkCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Register many gateways from JSON rows; returns a result per row"""
+    rows = _bulk_rows(data.gateways, GATEWAY_FIELDS)
+    return await db.run_sync(lambda session: BulkProvisioningService(
+        session, chunk_size=settings.LORAWAN_BULK_CHUNK_SIZE
+    ).provision_gateways(user_id, rows, dry_run=data.dry_run))
+
+
+@router.post("/gateways/bulk/csv", response_model=BulkProvisionResponse)
+async def bulk_create_gateways_csv(
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    db: AsyncSession = Depends(get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Register many gateways from a CSV with a header row (gateway_id,name,...)"""
+    rows = await _read_csv(file, GATEWAY_FIELDS)
+    return await db.run_sync(lambda session: BulkProvisioningService(
+        session, chunk_size=settings.LORAWAN_BULK_CHUNK_SIZE
+    ).provision_gateways(user_id, rows, dry_run=dry_run))
+
+
 # ============ Node Endpoints ============
 
+@router.post("/nodes/bulk", response_model=BulkProvisionResponse)
+async def bulk_create_nodes(
+    data: NodeBulkCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Register many nodes from JSON rows; returns a result per row"""
+    rows = _bulk_rows(data.nodes, NODE_FIELDS)
+    return await db.run_sync(lambda session: BulkProvisioningService(
+        session, chunk_size=settings.LORAWAN_BULK_CHUNK_SIZE
+    ).provision_nodes(user_id, rows, dry_run=data.dry_run))
+
+
+@router.post("/nodes/bulk/csv", response_model=BulkProvisionResponse)
+async def bulk_create_nodes_csv(
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    db: AsyncSession = Depends(get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Register many nodes from a CSV with a header row
+    (dev_eui,name,sensor_type,gateway_id or gateway_eui,...)
+    """
+    rows = await _read_csv(file, NODE_FIELDS)
+    return await db.run_sync(lambda session: BulkProvisioningService(
+        session, chunk_size=settings.LORAWAN_BULK_CHUNK_SIZE
+    ).provision_nodes(user_id, rows, dry_run=dry_run))
+
+
 @router.post("/nodes", response_model=NodeResponse)
 async def create_node(
     data: NodeCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Register a new LoRaWAN sensor node"""
-    service = LoRaWANService(db)
-    node = service.create_node(
+    return await db.run_sync(lambda session: LoRaWANService(session).create_node(
         user_id=user_id,
         dev_eui=data.dev_eui,
         name=data.name,
@@ -192,19 +334,32 @@ async def create_node(
         latitude=data.latitude,
         longitude=data.longitude,
         zone=data.zone,
-    )
-    return node
+    ))
 
 
 @router.get("/nodes", response_model=List[NodeResponse])
 async def get_nodes(
     gateway_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get all nodes for the current user"""
-    service = LoRaWANService(db)
-    return service.get_nodes(user_id, gateway_id)
+    return await db.run_sync(lambda session: LoRaWANService(session).get_nodes(user_id, gateway_id))
+
+
+@router.put("/nodes/{node_id}", response_model=NodeResponse)
+async def update_node(
+    node_id: int,
+    data: NodeUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Update a LoRaWAN node's settings"""
+    fields = data.model_dump(exclude_unset=True)
+    node = await db.run_sync(lambda session: LoRaWANService(session).update_node(node_id, user_id, **fields))
+    if not node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return node
 
 
 @router.get("/nodes/{node_id}/telemetry", response_model=List[TelemetryResponse])
@@ -212,42 +367,91 @@ async def get_node_telemetry(
     node_id: int,
     hours: int = 24,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Get recent telemetry for a node"""
-    service = LoRaWANService(db)
-    return service.get_node_telemetry(node_id, hours, limit)
+    return await db.run_sync(lambda session: LoRaWANService(session).get_node_telemetry(node_id, hours, limit))
+
+
+@router.get("/nodes/{node_id}/telemetry/series", response_model=TelemetrySeriesResponse)
+async def get_node_telemetry_series(
+    node_id: int,
+    hours: int = Query(24, ge=1, le=24 * 366),
+    max_points: int = Query(500, ge=10, le=5000),
+    resolution: Optional[str] = Query(None, pattern="^(raw|5m|1h|1d)$"),
+    db: AsyncSession = Depends(get_async_reporting_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Downsampled telemetry (min/max/avg/count) sized to the requested point budget"""
+    def series(session):
+        service = LoRaWANService(session)
+        node = service.get_node(node_id, user_id)
+        return service.get_node_telemetry_series(node, hours, max_points, resolution) if node else None
+
+    result = await db.run_sync(series)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return result
 
 
 @router.post("/nodes/{node_id}/downlink")
 async def send_downlink(
     node_id: int,
     data: DownlinkCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Queue a downlink command to a node"""
-    service = LoRaWANService(db)
-    downlink = service.send_downlink(
+    downlink = await db.run_sync(lambda session: LoRaWANService(session).send_downlink(
         node_id=node_id,
         payload=data.payload,
         port=data.port,
         confirmed=data.confirmed,
         user_id=user_id,
-    )
+    ))
     return {"status": downlink.status, "id": downlink.id}
 
 
+@router.get("/downlinks/{downlink_id}")
+async def get_downlink_status(
+    downlink_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """Delivery status of a queued downlink"""
+    downlink = await db.scalar(select(LoRaDownlink).where(
+        LoRaDownlink.id == downlink_id,
+        LoRaDownlink.user_id == user_id,
+    ))
+    if not downlink:
+        raise HTTPException(status_code=404, detail="Downlink not found")
+    return {
+        "id": downlink.id,
+        "node_id": downlink.node_id,
+        "status": downlink.status,
+        "attempts": downlink.attempts or 0,
+        "next_attempt_at": downlink.next_attempt_at,
+        "last_error": downlink.last_error,
+        "created_at": downlink.created_at,
+        "sent_at": downlink.sent_at,
+    }
+
+
+@router.get("/codecs")
+async def get_codecs(user_id: int = Depends(get_current_user_id)):
+    """List the payload layouts available for sensor_type decoding"""
+    return codec_registry.describe()
+
+
 # ============ Webhook Endpoints ============
 
-@router.post("/webhooks/uplink")
-async def receive_uplink(
-    data: UplinkWebhook,
-    db: Session = Depends(get_db),
-):
-    """Receive uplink data from ChirpStack/TTN (webhook)"""
-    service = LoRaWANService(db)
-    
+@router.post("/webhooks/uplink", status_code=202)
+async def receive_uplink(data: UplinkWebhook):
+    """
+    Receive uplink data from ChirpStack/TTN (webhook).
+    The uplink is queued and acknowledged immediately; the ingest worker
+    persists it as part of the next micro-batch.
+    """
     # Extract signal info from rxInfo
     rssi = None
     snr = None
@@ -255,7 +459,7 @@ async def receive_uplink(
         rssi = data.rxInfo[0].get("rssi")
         snr = data.rxInfo[0].get("snr")
     
-    telemetry = service.process_uplink(
+    accepted = ingest_queue.submit(
         dev_eui=data.devEui,
         payload_raw=data.data or "",
         rssi=rssi,
@@ -263,18 +467,29 @@ async def receive_uplink(
         frame_count=data.fCnt,
     )
     
-    if telemetry:
-        return {"status": "processed", "telemetry_id": telemetry.id}
-    return {"status": "unknown_device"}
+    if not accepted:
+        # Back-pressure: ask the network server to retry later
+        raise HTTPException(status_code=503, detail="Uplink queue full", headers={"Retry-After": "5"})
+    return {"status": "queued"}
+
+
+@router.get("/ingest/stats")
+async def get_ingest_stats(user_id: int = Depends(get_current_user_id)):
+    """Uplink ingest queue depth, throughput and back-pressure counters"""
+    stats = ingest_queue.get_stats()
+    stats["node_cache"] = node_cache.get_stats()
+    stats["liveness"] = liveness.get_stats()
+    stats["downlinks"] = downlink_dispatcher.get_stats()
+    stats["db_pools"] = get_pool_stats()
+    return stats
 
 
 # ============ Analytics ============
 
 @router.get("/health", response_model=NetworkHealthResponse)
 async def get_network_health(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_reporting_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get overall LoRaWAN network health statistics"""
-    service = LoRaWANService(db)
-    return service.get_network_health(user_id)
+    return await db.run_sync(lambda session: LoRaWANService(session).get_network_health(user_id))
@@ -2,13 +2,25 @@
 LoRaWAN Gateway Service
 Business logic for gateway management, ChirpStack/TTN integration, and device provisioning.
 """
+from sqlalchemy import select, func, case
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable
 from datetime import datetime, timedelta
-import base64
-import json
-import httpx
+import time
+from app.core.config import settings
 from .lorawan_models import LoRaGateway, LoRaNode, LoRaTelemetry, LoRaDownlink
+from .lorawan_cache import node_cache, normalize_eui
+from .lorawan_codecs import codec_registry
+from .lorawan_rollups import TelemetryRollupService
+from .lorawan_liveness import liveness, GATEWAY
+from .lorawan_downlinks import downlink_dispatcher
+
+# Network health snapshots: user_id -> (health dict, monotonic timestamp)
+_health_cache: dict[int, tuple[dict, float]] = {}
+
+# Operator-supplied Dragino/RAK layouts extend or override the built-in codecs
+if settings.LORAWAN_CODECS_FILE:
+    codec_registry.load_file(settings.LORAWAN_CODECS_FILE)
 
 
 class LoRaWANService:
@@ -36,7 +48,7 @@ class LoRaWANService:
         gateway = LoRaGateway(
             user_id=user_id,
             farm_id=farm_id,
-            gateway_id=gateway_id,
+            gateway_id=normalize_eui(gateway_id),
             name=name,
             hardware_type=hardware_type,
             frequency_plan=frequency_plan,
@@ -48,6 +60,7 @@ class LoRaWANService:
         self.db.add(gateway)
         self.db.commit()
         self.db.refresh(gateway)
+        _health_cache.pop(user_id, None)
         return gateway
     
     def get_gateways(self, user_id: int) -> List[LoRaGateway]:
@@ -72,7 +85,7 @@ class LoRaWANService:
     ):
         """Update gateway online status (called by webhook)"""
         gateway = self.db.query(LoRaGateway).filter(
-            LoRaGateway.gateway_id == gateway_id
+            LoRaGateway.gateway_id == normalize_eui(gateway_id)
         ).first()
         
         if gateway:
@@ -83,6 +96,10 @@ class LoRaWANService:
             if tx_packets:
                 gateway.tx_packets_total += tx_packets
             self.db.commit()
+            if is_online:
+                liveness.observe_gateway(gateway.id, gateway.last_seen)
+            else:
+                liveness.forget(GATEWAY, gateway.id)
     
     # ============ Node Management ============
     
@@ -105,8 +122,8 @@ class LoRaWANService:
         node = LoRaNode(
             user_id=user_id,
             gateway_id=gateway_id,
-            dev_eui=dev_eui.upper(),
-            app_eui=app_eui.upper() if app_eui else None,
+            dev_eui=normalize_eui(dev_eui),
+            app_eui=normalize_eui(app_eui) if app_eui else None,
             name=name,
             node_type=node_type,
             sensor_type=sensor_type,
@@ -119,8 +136,37 @@ class LoRaWANService:
         self.db.add(node)
         self.db.commit()
         self.db.refresh(node)
+        # Clear any negative entry left by uplinks that arrived before provisioning
+        node_cache.invalidate([node.dev_eui])
+        _health_cache.pop(user_id, None)
         return node
     
+    def update_node(self, node_id: int, user_id: int, **fields) -> Optional[LoRaNode]:
+        """Update node settings and drop its cached uplink metadata"""
+        node = self.db.query(LoRaNode).filter(
+            LoRaNode.id == node_id,
+            LoRaNode.user_id == user_id
+        ).first()
+        if not node:
+            return None
+        
+        previous_eui = node.dev_eui
+        for key, value in fields.items():
+            if key == "dev_eui" and value:
+                value = normalize_eui(value)
+            setattr(node, key, value)
+        self.db.commit()
+        self.db.refresh(node)
+        node_cache.invalidate([previous_eui, node.dev_eui])
+        return node
+    
+    def get_node(self, node_id: int, user_id: int) -> Optional[LoRaNode]:
+        """Get a specific node"""
+        return self.db.query(LoRaNode).filter(
+            LoRaNode.id == node_id,
+            LoRaNode.user_id == user_id
+        ).first()
+    
     def get_nodes(self, user_id: int, gateway_id: int = None) -> List[LoRaNode]:
         """Get all nodes for a user, optionally filtered by gateway"""
         query = self.db.query(LoRaNode).filter(LoRaNode.user_id == user_id)
@@ -131,9 +177,44 @@ class LoRaWANService:
     def get_node_by_eui(self, dev_eui: str) -> Optional[LoRaNode]:
         """Get a node by its Device EUI"""
         return self.db.query(LoRaNode).filter(
-            LoRaNode.dev_eui == dev_eui.upper()
+            LoRaNode.dev_eui == normalize_eui(dev_eui)
         ).first()
     
+    def resolve_nodes(self, dev_euis: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Resolve DevEUIs to cached node metadata (id, sensor_type, user_id, gateway_id, telemetry_interval).
+        Only cache misses hit lora_nodes; unknown DevEUIs map to None and are negatively cached.
+        """
+        resolved: Dict[str, Optional[Dict[str, Any]]] = {}
+        misses = set()
+        for eui in {normalize_eui(e) for e in dev_euis}:
+            found, metadata = node_cache.lookup(eui)
+            if found:
+                resolved[eui] = metadata
+            else:
+                misses.add(eui)
+        
+        if misses:
+            rows = self.db.query(
+                LoRaNode.id, LoRaNode.dev_eui, LoRaNode.sensor_type, LoRaNode.user_id, LoRaNode.gateway_id,
+                LoRaNode.telemetry_interval,
+            ).filter(LoRaNode.dev_eui.in_(misses)).all()
+            for row in rows:
+                metadata = {
+                    "id": row.id,
+                    "sensor_type": row.sensor_type,
+                    "user_id": row.user_id,
+                    "gateway_id": row.gateway_id,
+                    "telemetry_interval": row.telemetry_interval,
+                }
+                resolved[row.dev_eui] = metadata
+                node_cache.put(row.dev_eui, metadata)
+            for eui in misses - resolved.keys():
+                resolved[eui] = None
+                node_cache.put(eui, None)
+        
+        return resolved
+    
     # ============ Telemetry Handling ============
     
     def process_uplink(
@@ -146,17 +227,18 @@ class LoRaWANService:
         frame_count: int = None,
     ) -> Optional[LoRaTelemetry]:
         """Process an uplink message from a node (called by webhook)"""
-        node = self.get_node_by_eui(dev_eui)
+        node = self.resolve_nodes([dev_eui]).get(normalize_eui(dev_eui))
         if not node:
             print(f"⚠️ Unknown device: {dev_eui}")
             return None
         
         # Decode payload based on sensor type
-        decoded = self.decode_payload(payload_raw, node.sensor_type)
+        decoded = self.decode_payload(payload_raw, node["sensor_type"])
         
         # Create telemetry log
+        received_at = datetime.utcnow()
         telemetry = LoRaTelemetry(
-            node_id=node.id,
+            node_id=node["id"],
             frame_count=frame_count,
             rssi=rssi,
             snr=snr,
@@ -167,76 +249,132 @@ class LoRaWANService:
             humidity=decoded.get("humidity"),
             soil_moisture=decoded.get("soil_moisture"),
             battery_voltage=decoded.get("battery_voltage"),
+            received_at=received_at,
         )
         self.db.add(telemetry)
+        TelemetryRollupService(self.db).apply([{
+            "node_id": node["id"],
+            "received_at": received_at,
+            **{metric: decoded.get(metric) for metric in ("temperature", "humidity", "soil_moisture", "battery_voltage")},
+        }])
         
-        # Update node status
-        node.is_online = True
-        node.last_seen = datetime.utcnow()
-        node.rssi = rssi
-        node.snr = snr
-        node.spreading_factor = spreading_factor
-        node.last_telemetry = decoded
+        # Update node status without loading the row
+        node_state = {
+            LoRaNode.is_online: True,
+            LoRaNode.last_seen: received_at,
+            LoRaNode.rssi: rssi,
+            LoRaNode.snr: snr,
+            LoRaNode.spreading_factor: spreading_factor,
+            LoRaNode.last_telemetry: decoded,
+        }
         if "battery" in decoded:
-            node.battery_level = decoded["battery"]
+            node_state[LoRaNode.battery_level] = decoded["battery"]
+        self.db.query(LoRaNode).filter(LoRaNode.id == node["id"]).update(node_state, synchronize_session=False)
+        if node["gateway_id"]:
+            self._touch_gateways([node["gateway_id"]], received_at)
         
         self.db.commit()
+        liveness.observe_node(node["id"], received_at, node.get("telemetry_interval"))
         self.db.refresh(telemetry)
         return telemetry
-    
-    def decode_payload(self, payload_b64: str, sensor_type: str = None) -> Dict[str, Any]:
-        """Decode raw payload based on sensor type"""
-        try:
-            raw = base64.b64decode(payload_b64)
-            
-            # Generic decoder - customize based on your sensor hardware
-            if sensor_type == "soil_moisture":
-                return self._decode_soil_sensor(raw)
-            elif sensor_type == "weather":
-                return self._decode_weather_sensor(raw)
-            elif sensor_type == "water_level":
-                return self._decode_water_level(raw)
-            else:
-                # Generic decode - try to interpret as JSON or hex values
-                try:
-                    return json.loads(raw.decode('utf-8'))
-                except:
-                    return {"raw_hex": raw.hex()}
-        except Exception as e:
-            return {"error": str(e), "raw_b64": payload_b64}
-    
-    def _decode_soil_sensor(self, raw: bytes) -> Dict[str, Any]:
-        """Decode soil moisture sensor payload (example: Dragino LSE01)"""
-        if len(raw) >= 11:
-            return {
-                "battery_voltage": ((raw[0] << 8) | raw[1]) / 1000,
-                "temperature": (((raw[2] << 8) | raw[3]) - 32768) / 10 if ((raw[2] << 8) | raw[3]) > 32767 else ((raw[2] << 8) | raw[3]) / 10,
-                "soil_moisture": ((raw[4] << 8) | raw[5]) / 100,
-                "soil_temperature": (((raw[6] << 8) | raw[7]) - 32768) / 10 if ((raw[6] << 8) | raw[7]) > 32767 else ((raw[6] << 8) | raw[7]) / 10,
-                "soil_ec": ((raw[8] << 8) | raw[9]),  # Electrical conductivity
-            }
-        return {"raw_hex": raw.hex()}
-    
-    def _decode_weather_sensor(self, raw: bytes) -> Dict[str, Any]:
-        """Decode weather station payload"""
-        if len(raw) >= 8:
-            return {
-                "temperature": (((raw[0] << 8) | raw[1]) - 400) / 10,  # Celsius
-                "humidity": raw[2],  # Percentage
-                "pressure": ((raw[3] << 8) | raw[4]) / 10,  # hPa
-                "wind_speed": raw[5] / 10,  # m/s
-                "wind_direction": ((raw[6] << 8) | raw[7]),  # Degrees
-            }
-        return {"raw_hex": raw.hex()}
-    
-    def _decode_water_level(self, raw: bytes) -> Dict[str, Any]:
-        """Decode water level sensor payload"""
-        if len(raw) >= 4:
-            return {
-                "battery_voltage": ((raw[0] << 8) | raw[1]) / 1000,
-                "water_level": ((raw[2] << 8) | raw[3]),  # mm or cm
+
+    def process_uplink_batch(self, uplinks: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Persist a micro-batch of uplinks in a single transaction (called by the ingest worker).
+        Telemetry rows are bulk-inserted and every node receives one UPDATE
+        carrying the state of its newest uplink in the batch.
+        """
+        nodes = self.resolve_nodes(u["dev_eui"] for u in uplinks)
+
+        known = []
+        for uplink in uplinks:
+            node = nodes.get(normalize_eui(uplink["dev_eui"]))
+            if node:
+                known.append((uplink, node))
+        unknown = len(uplinks) - len(known)
+        
+        # Decode the whole batch at once, grouped by sensor layout
+        decoded_batch = codec_registry.decode_base64_batch(
+            [(uplink["payload_raw"], node["sensor_type"]) for uplink, node in known]
+        )
+
+        telemetry_rows = []
+        node_state: Dict[int, Dict[str, Any]] = {}
+        gateway_ids = set()
+        now = datetime.utcnow()
+
+        for (uplink, node), decoded in zip(known, decoded_batch):
+            received_at = uplink.get("received_at") or now
+            telemetry_rows.append({
+                "node_id": node["id"],
+                "frame_count": uplink.get("frame_count"),
+                "rssi": uplink.get("rssi"),
+                "snr": uplink.get("snr"),
+                "spreading_factor": uplink.get("spreading_factor"),
+                "payload_raw": uplink["payload_raw"],
+                "payload_decoded": decoded,
+                "temperature": decoded.get("temperature"),
+                "humidity": decoded.get("humidity"),
+                "soil_moisture": decoded.get("soil_moisture"),
+                "battery_voltage": decoded.get("battery_voltage"),
+                "received_at": received_at,
+            })
+
+            # Coalesce: only the newest uplink per node decides its "last state"
+            previous = node_state.get(node["id"])
+            if previous and previous["last_seen"] > received_at:
+                continue
+            state = {
+                "id": node["id"],
+                "is_online": True,
+                "last_seen": received_at,
+                "rssi": uplink.get("rssi"),
+                "snr": uplink.get("snr"),
+                "spreading_factor": uplink.get("spreading_factor"),
+                "last_telemetry": decoded,
+                "updated_at": now,
             }
-        return {"raw_hex": raw.hex()}
+            if "battery" in decoded:
+                state["battery_level"] = decoded["battery"]
+            elif previous and "battery_level" in previous:
+                state["battery_level"] = previous["battery_level"]
+            node_state[node["id"]] = state
+            if node["gateway_id"]:
+                gateway_ids.add(node["gateway_id"])
+
+        if telemetry_rows:
+            self.db.bulk_insert_mappings(LoRaTelemetry, telemetry_rows)
+            TelemetryRollupService(self.db).apply(telemetry_rows)
+        if node_state:
+            self.db.bulk_update_mappings(LoRaNode, list(node_state.values()))
+        if gateway_ids:
+            self._touch_gateways(gateway_ids, now)
+        self.db.commit()
+
+        # Push every node's expected next-uplink deadline back
+        intervals = {node["id"]: node.get("telemetry_interval") for node in nodes.values() if node}
+        for node_id, state in node_state.items():
+            liveness.observe_node(node_id, state["last_seen"], intervals.get(node_id))
+
+        return {
+            "written": len(telemetry_rows),
+            "nodes_updated": len(node_state),
+            "unknown": unknown,
+        }
+
+    def _touch_gateways(self, gateway_ids: Iterable[int], seen_at: datetime):
+        """An uplink from an assigned node proves its gateway is forwarding traffic"""
+        gateway_ids = list(gateway_ids)
+        self.db.query(LoRaGateway).filter(LoRaGateway.id.in_(gateway_ids)).update(
+            {LoRaGateway.is_online: True, LoRaGateway.last_seen: seen_at},
+            synchronize_session=False,
+        )
+        for gateway_id in gateway_ids:
+            liveness.observe_gateway(gateway_id, seen_at)
+
+    def decode_payload(self, payload_b64: str, sensor_type: str = None) -> Dict[str, Any]:
+        """Decode raw payload with the codec registered for the sensor type"""
+        return codec_registry.decode_base64(payload_b64, sensor_type)
     
     # ============ Downlink Commands ============
     
@@ -260,60 +398,11 @@ class LoRaWANService:
         self.db.commit()
         self.db.refresh(downlink)
         
-        # Try to send via network server API
-        self._dispatch_downlink(downlink)
+        # Delivery happens in the outbox worker; the caller never waits on the network server
+        downlink_dispatcher.notify()
         
         return downlink
     
-    def _dispatch_downlink(self, downlink: LoRaDownlink):
-        """Send downlink to network server (ChirpStack/TTN)"""
-        node = self.db.query(LoRaNode).get(downlink.node_id)
-        if not node or not node.gateway_id:
-            return
-        
-        gateway = self.db.query(LoRaGateway).get(node.gateway_id)
-        if not gateway or not gateway.api_endpoint:
-            return
-        
-        try:
-            if gateway.network_server == "chirpstack":
-                self._send_chirpstack_downlink(gateway, node, downlink)
-            elif gateway.network_server == "ttn":
-                self._send_ttn_downlink(gateway, node, downlink)
-            
-            downlink.status = "QUEUED"
-            downlink.sent_at = datetime.utcnow()
-            self.db.commit()
-        except Exception as e:
-            print(f"❌ Downlink dispatch failed: {e}")
-            downlink.status = "FAILED"
-            self.db.commit()
-    
-    def _send_chirpstack_downlink(self, gateway: LoRaGateway, node: LoRaNode, downlink: LoRaDownlink):
-        """Send downlink via ChirpStack API"""
-        url = f"{gateway.api_endpoint}/api/devices/{node.dev_eui}/queue"
-        headers = {
-            "Authorization": f"Bearer {gateway.api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "deviceQueueItem": {
-                "devEui": node.dev_eui,
-                "confirmed": downlink.confirmed,
-                "fPort": downlink.port,
-                "data": downlink.payload,
-            }
-        }
-        
-        with httpx.Client() as client:
-            response = client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-    
-    def _send_ttn_downlink(self, gateway: LoRaGateway, node: LoRaNode, downlink: LoRaDownlink):
-        """Send downlink via The Things Network API"""
-        # TTN v3 API implementation
-        pass  # TODO: Implement TTN integration
-    
     # ============ Analytics ============
     
     def get_node_telemetry(
@@ -329,24 +418,58 @@ class LoRaWANService:
             LoRaTelemetry.received_at >= since,
         ).order_by(LoRaTelemetry.received_at.desc()).limit(limit).all()
     
+    def get_node_telemetry_series(
+        self,
+        node: LoRaNode,
+        hours: int = 24,
+        max_points: int = 500,
+        resolution: str = None,
+    ) -> Dict[str, Any]:
+        """Downsampled telemetry for dashboards: raw rows or the rollup level that fits max_points"""
+        end = datetime.utcnow()
+        return TelemetryRollupService(self.db).get_series(
+            node_id=node.id,
+            start=end - timedelta(hours=hours),
+            end=end,
+            max_points=max_points,
+            resolution=resolution,
+            raw_interval_seconds=node.telemetry_interval or 900,
+        )
+    
     def get_network_health(self, user_id: int) -> Dict[str, Any]:
-        """Get overall network health statistics"""
-        gateways = self.get_gateways(user_id)
-        nodes = self.get_nodes(user_id)
-        
-        online_gateways = sum(1 for g in gateways if g.is_online)
-        online_nodes = sum(1 for n in nodes if n.is_online)
+        """Get overall network health statistics (one aggregate query, briefly cached per user)"""
+        cached = _health_cache.get(user_id)
+        if cached and time.monotonic() - cached[1] < settings.LORAWAN_HEALTH_CACHE_TTL:
+            return cached[0]
         
-        # Calculate average signal quality
-        avg_rssi = sum(n.rssi or 0 for n in nodes if n.rssi) / max(len([n for n in nodes if n.rssi]), 1)
-        avg_snr = sum(n.snr or 0 for n in nodes if n.snr) / max(len([n for n in nodes if n.snr]), 1)
+        gateways_total = select(func.count(LoRaGateway.id)).where(
+            LoRaGateway.user_id == user_id
+        ).scalar_subquery()
+        gateways_online = select(func.count(LoRaGateway.id)).where(
+            LoRaGateway.user_id == user_id,
+            LoRaGateway.is_online.is_(True),
+        ).scalar_subquery()
+        # Zero readings are treated as "no reading", matching the dashboard's historical averages
+        row = self.db.query(
+            gateways_total.label("gateways_total"),
+            gateways_online.label("gateways_online"),
+            func.count(LoRaNode.id).label("nodes_total"),
+            func.count(case((LoRaNode.is_online.is_(True), 1))).label("nodes_online"),
+            func.avg(case((LoRaNode.rssi != 0, LoRaNode.rssi))).label("average_rssi"),
+            func.avg(case((LoRaNode.snr != 0, LoRaNode.snr))).label("average_snr"),
+            func.max(LoRaNode.last_seen).label("last_uplink_at"),
+        ).filter(LoRaNode.user_id == user_id).one()
         
-        return {
-            "gateways_total": len(gateways),
-            "gateways_online": online_gateways,
-            "nodes_total": len(nodes),
-            "nodes_online": online_nodes,
-            "average_rssi": round(avg_rssi, 1),
-            "average_snr": round(avg_snr, 1),
-            "network_coverage": (online_nodes / len(nodes) * 100) if nodes else 0,
+        health = {
+            "gateways_total": row.gateways_total or 0,
+            "gateways_online": row.gateways_online or 0,
+            "nodes_total": row.nodes_total,
+            "nodes_online": row.nodes_online,
+            "average_rssi": round(row.average_rssi or 0, 1),
+            "average_snr": round(row.average_snr or 0, 1),
+            "network_coverage": (row.nodes_online / row.nodes_total * 100) if row.nodes_total else 0,
+            "last_uplink_at": row.last_uplink_at,
+            "computed_at": datetime.utcnow(),
         }
+        _health_cache[user_id] = (health, time.monotonic())
+        return health
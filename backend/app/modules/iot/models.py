@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -39,6 +39,9 @@ class IoTDevice(Base):
 
 class IoTCommand(Base):
     __tablename__ = "iot_commands"
+    __table_args__ = (
+        Index("ix_iot_commands_device_created", "device_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(Integer, ForeignKey("iot_devices.id"), nullable=False, index=True)
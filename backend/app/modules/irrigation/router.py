@@ -3,11 +3,12 @@ VRI Irrigation API Router
 Endpoints for zone management, scheduling, and predictions.
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-from app.core.database import get_db
+from app.core.database import get_async_db, get_async_reporting_db
 from app.modules.auth.dependencies import get_current_user_id
 from .service import VRIService
 from .models import IrrigationZone, IrrigationPrediction
@@ -106,38 +107,32 @@ class WaterUsageResponse(BaseModel):
 @router.post("/zones", response_model=ZoneResponse)
 async def create_zone(
     data: ZoneCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Create a new irrigation zone"""
-    service = VRIService(db)
-    zone = service.create_zone(
-        user_id=user_id,
-        **data.model_dump()
-    )
-    return zone
+    fields = data.model_dump()
+    return await db.run_sync(lambda session: VRIService(session).create_zone(user_id=user_id, **fields))
 
 
 @router.get("/zones", response_model=List[ZoneResponse])
 async def get_zones(
     farm_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get all irrigation zones"""
-    service = VRIService(db)
-    return service.get_zones(user_id, farm_id)
+    return await db.run_sync(lambda session: VRIService(session).get_zones(user_id, farm_id))
 
 
 @router.get("/zones/{zone_id}", response_model=ZoneResponse)
 async def get_zone(
     zone_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get a specific zone"""
-    service = VRIService(db)
-    zone = service.get_zone(zone_id, user_id)
+    zone = await db.run_sync(lambda session: VRIService(session).get_zone(zone_id, user_id))
     if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
     return zone
@@ -147,12 +142,12 @@ async def get_zone(
 async def update_zone(
     zone_id: int,
     data: ZoneUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Update a zone"""
-    service = VRIService(db)
-    zone = service.update_zone(zone_id, user_id, **data.model_dump(exclude_unset=True))
+    fields = data.model_dump(exclude_unset=True)
+    zone = await db.run_sync(lambda session: VRIService(session).update_zone(zone_id, user_id, **fields))
     if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
     return zone
@@ -164,39 +159,43 @@ async def update_zone(
 async def generate_predictions(
     zone_id: int,
     days: int = 3,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Generate irrigation predictions for a zone"""
-    service = VRIService(db)
+    def generate(session):
+        service = VRIService(session)
+        # Verify user owns this zone
+        if not service.get_zone(zone_id, user_id):
+            return None
+        return service.generate_prediction(zone_id, days)
     
-    # Verify user owns this zone
-    zone = service.get_zone(zone_id, user_id)
-    if not zone:
+    predictions = await db.run_sync(generate)
+    if predictions is None:
         raise HTTPException(status_code=404, detail="Zone not found")
-    
-    predictions = service.generate_prediction(zone_id, days)
     return predictions
 
 
 @router.get("/zones/{zone_id}/predictions", response_model=List[PredictionResponse])
 async def get_predictions(
     zone_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Get existing predictions for a zone"""
-    service = VRIService(db)
-    zone = service.get_zone(zone_id, user_id)
+    zone = await db.scalar(select(IrrigationZone).where(
+        IrrigationZone.id == zone_id,
+        IrrigationZone.user_id == user_id,
+    ))
     if not zone:
         raise HTTPException(status_code=404, detail="Zone not found")
     
-    predictions = db.query(IrrigationPrediction).filter(
+    predictions = await db.scalars(select(IrrigationPrediction).where(
         IrrigationPrediction.zone_id == zone_id,
         IrrigationPrediction.prediction_date >= datetime.utcnow()
-    ).order_by(IrrigationPrediction.prediction_date).all()
+    ).order_by(IrrigationPrediction.prediction_date))
     
-    return predictions
+    return predictions.all()
 
 
 # ============ Irrigation Control ============
@@ -205,21 +204,24 @@ async def get_predictions(
 async def start_irrigation(
     zone_id: int,
     data: StartIrrigationRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user_id: int = Depends(get_current_user_id),
 ):
     """Start irrigation for a zone"""
-    service = VRIService(db)
-    zone = service.get_zone(zone_id, user_id)
-    if not zone:
-        raise HTTPException(status_code=404, detail="Zone not found")
+    def start(session):
+        service = VRIService(session)
+        if not service.get_zone(zone_id, user_id):
+            return None
+        return service.start_irrigation(
+            zone_id=zone_id,
+            duration_minutes=data.duration_minutes,
+            target_depth_mm=data.target_depth_mm,
+            trigger_reason=data.trigger_reason,
+        )
     
-    log = service.start_irrigation(
-        zone_id=zone_id,
-        duration_minutes=data.duration_minutes,
-        target_depth_mm=data.target_depth_mm,
-        trigger_reason=data.trigger_reason,
-    )
+    log = await db.run_sync(start)
+    if log is None:
+        raise HTTPException(status_code=404, detail="Zone not found")
     return log
 
 
@@ -227,12 +229,10 @@ async def start_irrigation(
 async def stop_irrigation(
     log_id: int,
     abort_reason: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Stop an ongoing irrigation event"""
-    service = VRIService(db)
-    log = service.stop_irrigation(log_id, abort_reason)
-    return log
+    return await db.run_sync(lambda session: VRIService(session).stop_irrigation(log_id, abort_reason))
 
 
 # ============ Analytics ============
@@ -241,12 +241,11 @@ async def stop_irrigation(
 async def get_water_usage(
     days: int = 30,
     zone_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_reporting_db),
     user_id: int = Depends(get_current_user_id),
 ):
-    """Get water usage analytics"""
-    service = VRIService(db)
-    return service.get_water_usage(user_id, days, zone_id)
+    """Get water usage analytics (served from the reporting pool / read replica)"""
+    return await db.run_sync(lambda session: VRIService(session).get_water_usage(user_id, days, zone_id))
 
 
 # ============ ET0 Calculation ============
@@ -261,12 +260,10 @@ class ET0Request(BaseModel):
 
 
 @router.post("/calculate-et0")
-async def calculate_et0(
-    data: ET0Request,
-    db: Session = Depends(get_db),
-):
+async def calculate_et0(data: ET0Request):
     """Calculate reference evapotranspiration (ET0)"""
-    service = VRIService(db)
+    # Pure FAO-56 arithmetic: no session needed
+    service = VRIService(None)
     et0 = service.calculate_et0(
         temp_max=data.temp_max,
         temp_min=data.temp_min,
@@ -0,0 +1,100 @@
+"""
+Treatment Index
+In-memory pest -> chemicals map built from the knowledge graph, so a
+treatment lookup on the diagnosis path never touches the database.
+
+- built once (one query per table) on first use or at bootstrap
+- lookups are case-, spacing- and punctuation-insensitive; a classifier
+  label that contains a known pest name ("Tomato___Late_blight") resolves to
+  it, and near-misses ("Late Blite") resolve by fuzzy match
+- resolved aliases are remembered, so the fuzzy scan runs once per new name
+- every KG write calls invalidate(); the next lookup rebuilds, and
+  `version` changes so derived caches can tell the graph moved on
+"""
+import difflib
+import re
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+FUZZY_CUTOFF = 0.85  # difflib ratio needed for a fuzzy alias match
+MAX_ALIASES = 4096  # Remembered lookup names (misses included)
+
+
+def normalize(name: str) -> str:
+    """'Tomato___Late_blight' -> 'tomato late blight'"""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (name or "").lower()).split())
+
+
+class TreatmentIndex:
+    """Thread-safe pest -> chemical names map with alias resolution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chemicals: Optional[Dict[str, List[str]]] = None  # normalized pest name -> chemical names
+        self._aliases: Dict[str, Optional[str]] = {}  # normalized lookup -> normalized pest name (None = unknown)
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self):
+        """Call after any write to kg_pests, kg_chemicals or their links"""
+        with self._lock:
+            self._chemicals = None
+            self._aliases.clear()
+            self._version += 1
+
+    def load(self, db: Session) -> int:
+        """(Re)build from the database; returns the number of pests indexed"""
+        version = self._version
+        pests = {pest_id: name for pest_id, name in db.query(models.KGPest.id, models.KGPest.name)}
+        chemicals = {chem_id: name for chem_id, name in db.query(models.KGChemical.id, models.KGChemical.name)}
+        index: Dict[str, List[str]] = {normalize(name): [] for name in pests.values()}
+        links = db.query(models.chemical_pest_association.c.pest_id, models.chemical_pest_association.c.chemical_id)
+        for pest_id, chem_id in links.order_by(models.chemical_pest_association.c.chemical_id):
+            if pest_id in pests and chem_id in chemicals:
+                index[normalize(pests[pest_id])].append(chemicals[chem_id])
+        with self._lock:
+            if version == self._version:  # A write during the load leaves the index stale for the next lookup
+                self._chemicals = index
+                self._aliases.clear()
+        return len(index)
+
+    def lookup(self, db: Session, pest_name: str) -> Optional[List[str]]:
+        """Chemical names for a pest (possibly empty); None if the pest is not in the graph"""
+        index = self._chemicals
+        if index is None:
+            self.load(db)
+            index = self._chemicals or {}
+        key = normalize(pest_name)
+        if key in index:
+            return index[key]
+        with self._lock:
+            cached = key in self._aliases
+            resolved = self._aliases.get(key)
+        if not cached:
+            resolved = self._resolve(key, index)
+            with self._lock:
+                if len(self._aliases) < MAX_ALIASES:
+                    self._aliases[key] = resolved
+        return index.get(resolved) if resolved is not None else None
+
+    @staticmethod
+    def _resolve(key: str, index: Dict[str, List[str]]) -> Optional[str]:
+        if not key:
+            return None
+        # Crop-prefixed classifier labels: the longest pest name contained word-for-word
+        padded = f" {key} "
+        contained = [name for name in index if name and f" {name} " in padded]
+        if contained:
+            return max(contained, key=len)
+        close = difflib.get_close_matches(key, list(index), n=1, cutoff=FUZZY_CUTOFF)
+        return close[0] if close else None
+
+
+treatment_index = TreatmentIndex()
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from . import models
+from .index import treatment_index
 
 class RegulatoryIngestionService:
     """
@@ -39,6 +40,7 @@ class RegulatoryIngestionService:
                 count += 1
         
         self.db.commit()
+        treatment_index.invalidate()
         return {"synced_count": count, "message": "Regulatory data synced successfully."}
 
     def check_compliance(self, chemical_name: str) -> dict:
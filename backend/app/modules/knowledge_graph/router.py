@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session, selectinload
 from app.core import database
+from app.core.config import settings
 from app.modules.auth.dependencies import get_current_user
 from app.modules.auth.models import User
 from app.core.ownership import require_admin
 from . import models
-from typing import List, Optional
-from pydantic import BaseModel
+from .index import treatment_index
+from typing import Any, Callable, List, Optional
+from pydantic import BaseModel, TypeAdapter
+from collections import OrderedDict
+import hashlib
+import threading
+import time
 
 router = APIRouter()
 
@@ -35,52 +41,96 @@ class CropDTO(BaseModel):
     class Config:
         from_attributes = True
 
+# --- Response cache ---
+# The knowledge bank changes rarely: serialized responses are kept per graph
+# version (bumped by every KG write in this process) and for at most
+# LIBRARY_CACHE_TTL seconds (writes made by other workers). The ETag is a hash
+# of the body, so it is the same on every worker and clients revalidate with 304s.
+
+_CACHE_MAX_ENTRIES = 256  # Distinct endpoint/search combinations kept
+_cache: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (version, expires_at, etag, body)
+_cache_lock = threading.Lock()
+
+def _cached_json(request: Request, key: tuple, adapter: TypeAdapter, load: Callable[[], Any]) -> Response:
+    """Serve `load()` serialized through `adapter`, from the cache when the graph has not changed"""
+    version, now = treatment_index.version, time.time()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and (entry[0] != version or entry[1] < now):
+            del _cache[key]
+            entry = None
+        if entry is not None:
+            _cache.move_to_end(key)
+    if entry is None:
+        body = adapter.dump_json(adapter.validate_python(load(), from_attributes=True))
+        entry = (version, now + settings.LIBRARY_CACHE_TTL, f'"{hashlib.sha1(body).hexdigest()}"', body)
+        if settings.LIBRARY_CACHE_TTL > 0:
+            with _cache_lock:
+                _cache[key] = entry
+                while len(_cache) > _CACHE_MAX_ENTRIES:
+                    _cache.popitem(last=False)
+    etag, body = entry[2], entry[3]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # Clients may store it but must revalidate
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+_pests_adapter = TypeAdapter(List[PestDTO])
+_crops_adapter = TypeAdapter(List[CropDTO])
+_pest_adapter = TypeAdapter(PestDTO)
+
 # --- Endpoints ---
 
 @router.get("/pests", response_model=List[PestDTO])
 def get_all_pests(
+    request: Request,
     search: Optional[str] = None, 
     db: Session = Depends(database.get_db)
 ):
     """
     Get a searchable list of all pests/diseases in the Knowledge Bank.
     """
-    # Auto-seed if empty
-    from .service import KnowledgeGraphService
-    svc = KnowledgeGraphService(db)
-    svc.seed_initial_data()
-    
-    query = db.query(models.KGPest)
-    if search:
-        query = query.filter(models.KGPest.name.ilike(f"%{search}%"))
-    return query.all()
+    def load():
+        # Chemicals for every pest in one extra query instead of one per pest
+        query = db.query(models.KGPest).options(selectinload(models.KGPest.chemicals))
+        if search:
+            query = query.filter(models.KGPest.name.ilike(f"%{search}%"))
+        return query.order_by(models.KGPest.id).all()
+
+    return _cached_json(request, ("pests", (search or "").strip().lower()), _pests_adapter, load)
 
 @router.get("/crops", response_model=List[CropDTO])
 def get_all_crops(
+    request: Request,
     db: Session = Depends(database.get_db)
 ):
     """
     Get all crops and their associated pests.
     """
-    # Auto-seed if empty
-    from .service import KnowledgeGraphService
-    svc = KnowledgeGraphService(db)
-    svc.seed_initial_data()
-    
-    return db.query(models.KGCrop).all()
+    def load():
+        # Three queries in total: crops, their pests, those pests' chemicals
+        return db.query(models.KGCrop).options(
+            selectinload(models.KGCrop.pests).selectinload(models.KGPest.chemicals)
+        ).order_by(models.KGCrop.id).all()
+
+    return _cached_json(request, ("crops",), _crops_adapter, load)
 
 @router.get("/pests/{pest_id}", response_model=PestDTO)
 def get_pest_details(
     pest_id: int, 
+    request: Request,
     db: Session = Depends(database.get_db)
 ):
     """
     Get detailed info about a specific pest, including treatments.
     """
-    pest = db.query(models.KGPest).filter(models.KGPest.id == pest_id).first()
-    if not pest:
-        raise HTTPException(status_code=404, detail="Pest not found")
-    return pest
+    def load():
+        pest = db.query(models.KGPest).options(selectinload(models.KGPest.chemicals)).filter(models.KGPest.id == pest_id).first()
+        if not pest:
+            raise HTTPException(status_code=404, detail="Pest not found")
+        return pest
+
+    return _cached_json(request, ("pest", pest_id), _pest_adapter, load)
 
 @router.post("/regulatory/sync")
 def sync_regulatory_data(db: Session = Depends(database.get_db), current_user: User = Depends(get_current_user)):
@@ -1,5 +1,7 @@
 from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
 from . import models
+from .index import treatment_index
 
 class KnowledgeGraphService:
     def __init__(self, db: Session):
@@ -8,16 +10,16 @@ class KnowledgeGraphService:
     def get_treatment_for_pest(self, pest_name: str) -> str:
         """
         Query the Graph to find chemicals that control the given pest.
+        Served from the in-memory treatment index (case-insensitive, fuzzy aliases).
         """
-        pest = self.db.query(models.KGPest).filter(models.KGPest.name == pest_name).first()
+        chemicals = treatment_index.lookup(self.db, pest_name)
         
-        if not pest:
+        if chemicals is None:
             return "No specific data found in Knowledge Graph."
             
-        if not pest.chemicals:
+        if not chemicals:
             return "No chemical treatments registered for this pest."
             
-        chemicals = [chem.name for chem in pest.chemicals]
         return f"Recommended treatments: {', '.join(chemicals)}."
 
     def seed_initial_data(self):
@@ -49,3 +51,15 @@ class KnowledgeGraphService:
         
         self.db.add_all([potato, tomato, late_blight, early_blight, mancozeb, metalaxyl])
         self.db.commit()
+        treatment_index.invalidate()
+
+
+def bootstrap_knowledge_graph():
+    """Startup: seed the graph if it is empty and build the treatment index (not on the request path)"""
+    db = SessionLocal()
+    try:
+        KnowledgeGraphService(db).seed_initial_data()
+        pests = treatment_index.load(db)
+        print(f"[OK] Knowledge graph ready ({pests} pests indexed)")
+    finally:
+        db.close()
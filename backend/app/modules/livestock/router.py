@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from app.core.database import get_db
+from app.core.database import get_db, get_reporting_db
 from app.modules.auth.dependencies import get_current_user
 from app.modules.auth.models import User
 from app.core.ownership import verify_farm_ownership
@@ -201,10 +201,16 @@ def get_farm_animals(farm_id: int, db: Session = Depends(get_db), current_user:
     return service.get_animals_by_farm(db, farm_id)
 
 @router.get("/farm/{farm_id}/stats", response_model=List[dict])
-def get_farm_stats(farm_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_farm_stats(
+    farm_id: int,
+    db: Session = Depends(get_db),
+    reporting_db: Session = Depends(get_reporting_db),
+    current_user: User = Depends(get_current_user),
+):
     if not verify_farm_ownership(db, farm_id, current_user.id, raise_error=False):
         return []
-    return service.get_farm_production_stats(db, farm_id)
+    # Aggregation runs on the reporting pool / read replica
+    return service.get_farm_production_stats(reporting_db, farm_id)
 
 # --- Animals (Generic routes with path parameters come LAST) ---
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -57,6 +57,9 @@ class TelemetryReading(Base):
     Time-series data for environmental sensors.
     """
     __tablename__ = "livestock_telemetry"
+    __table_args__ = (
+        Index("ix_livestock_telemetry_device_timestamp", "device_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(Integer, ForeignKey("livestock_monitoring_devices.id"))
@@ -13,6 +13,9 @@ from pathlib import Path
 
 router = APIRouter(prefix="/logs", tags=["logging"])
 
+# Endpoints here only do blocking file I/O, so they are plain def and run in
+# FastAPI's threadpool rather than stalling the event loop.
+
 # Define log storage directories
 LOGS_BASE_DIR = Path("logs")
 LOGS_BASE_DIR.mkdir(exist_ok=True)
@@ -96,7 +99,7 @@ class LogBatchRequest(BaseModel):
 
 
 @router.post("")
-async def receive_logs(batch: LogBatchRequest):
+def receive_logs(batch: LogBatchRequest):
     """
     Receive and store logs from frontend
     """
@@ -139,7 +142,7 @@ async def receive_logs(batch: LogBatchRequest):
 
 
 @router.get("/stats")
-async def get_log_stats():
+def get_log_stats():
     """
     Get statistics about stored logs
     """
@@ -175,7 +178,7 @@ async def get_log_stats():
 
 
 @router.get("/recent")
-async def get_recent_logs(
+def get_recent_logs(
     limit: int = 100,
     level: Optional[str] = None,
     category: Optional[str] = None
@@ -224,7 +227,7 @@ async def get_recent_logs(
 
 
 @router.delete("/clear")
-async def clear_logs(
+def clear_logs(
     days_old: int = 7
 ):
     """
@@ -0,0 +1,159 @@
+"""
+Voice Search Response Cache
+LRU + TTL cache in front of the LLM intent classification and answer
+generation calls.
+
+Farmers ask a small set of questions over and over ("price of onion in
+Nasik"), so transcripts are normalized before lookup: Unicode NFKC,
+lower case, punctuation and repeated whitespace removed, number words and
+formatted numbers ("ten", "1,000", "10.0") turned into plain digits. Keys
+also carry the language, since the answer text depends on it.
+
+Only answers that actually came from an LLM are cached; template fallbacks
+are not, so a recovering provider is used again immediately. With
+VOICE_CACHE_FILE set, entries survive restarts (loaded on first use, saved
+on shutdown).
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90, "hundred": 100,
+}
+_NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_STRAY_DOT_RE = re.compile(r"(?<!\d)\.|\.(?!\d)")  # Keep decimal points only
+
+
+def _canonical_number(match: "re.Match") -> str:
+    value = float(match.group().replace(",", ""))
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _NUMBER_RE.sub(_canonical_number, text)
+    # Drop punctuation/symbols by Unicode category: \w would also strip Indic vowel signs
+    text = "".join(" " if ch != "." and unicodedata.category(ch)[0] in "PS" else ch for ch in text)
+    text = _STRAY_DOT_RE.sub(" ", text)
+    return " ".join(str(_NUMBER_WORDS.get(word, word)) for word in text.split())
+
+
+def intent_key(text: str, language: str) -> str:
+    return f"intent|{language}|{normalize_text(text)}"
+
+
+def response_key(intent: str, params: Dict[str, Any], language: str) -> str:
+    normalized = {str(k).lower(): normalize_text(str(v)) for k, v in (params or {}).items()}
+    return f"response|{language}|{intent}|{json.dumps(normalized, sort_keys=True)}"
+
+
+class ResponseCache:
+    """Thread-safe LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 5000, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = path is None
+        self._stats = {kind: {"hits": 0, "misses": 0} for kind in ("intent", "response")}
+
+    def get(self, key: str) -> Optional[Any]:
+        self._ensure_loaded()
+        kind = key.split("|", 1)[0]
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats[kind]["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats[kind]["hits"] += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self._ensure_loaded()
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ============ Persistence ============
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    rows = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Voice cache file unreadable, starting empty: {e}")
+                return
+            now = time.time()
+            for key, value, expires_at in rows[-self.max_entries:]:
+                if expires_at > now:
+                    self._entries[key] = (value, expires_at)
+
+    def save(self):
+        """Write unexpired entries to VOICE_CACHE_FILE (atomic replace)"""
+        if not self.path or not self._loaded:
+            return
+        now = time.time()
+        with self._lock:
+            rows = [[key, value, expires_at] for key, (value, expires_at) in self._entries.items() if expires_at > now]
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"  # Per writer: several workers may save at shutdown
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[WARNING] Could not save voice cache: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    # ============ Metrics ============
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {kind: dict(counts) for kind, counts in self._stats.items()}
+            entries = len(self._entries)
+        for counts in stats.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / lookups * 100, 1) if lookups else 0.0
+        stats["entries"] = entries
+        return stats
+
+
+response_cache = ResponseCache(
+    max_entries=settings.VOICE_CACHE_MAX_ENTRIES,
+    path=settings.VOICE_CACHE_FILE,
+)
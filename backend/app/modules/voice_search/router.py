@@ -1,9 +1,22 @@
-from fastapi import APIRouter, Depends
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from app.modules.auth.dependencies import get_current_user
 from app.modules.auth.models import User
 import base64
-from . import service, schemas
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.inference_pool import get_inference_stats
+from app.core.llm_gateway import llm_gateway
+from app.core.model_manager import model_manager
+from . import service, schemas, streaming
+from .cache import response_cache
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
 
 router = APIRouter()
 
@@ -31,4 +44,176 @@ async def voice_search(request: VoiceQueryRequest, current_user: User = Depends(
         print(f"[ROUTER] Base64 decode error: {e}")
         audio_bytes = b"mock_audio_data"
 
-    return service.process_audio(audio_bytes)
+    # Decoding and waiting on the inference pool must not block the event loop
+    return await run_in_threadpool(service.process_audio, audio_bytes)
+
+
+MULTIPART_OVERHEAD = 16 * 1024  # Boundaries and part headers allowed on top of VOICE_MAX_UPLOAD_BYTES
+
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """Stream the request body into memory; 413 as soon as it passes `limit` (or Content-Length says it will)"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail="Recording too large")
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail="Recording too large")
+    return bytes(body)
+
+
+def _multipart_file(content_type: str, body: bytes, field: str = "file") -> bytes:
+    """
+    Bytes of one file field from a multipart body already in memory.
+    Parsed with python-multipart directly: request.form() would spool parts over 1 MB to disk.
+    """
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Missing multipart boundary")
+
+    part = {"header": b"", "value": b"", "name": None, "data": bytearray()}
+    found = []
+
+    def on_part_begin():
+        part.update(header=b"", value=b"", name=None, data=bytearray())
+
+    def on_header_field(data, start, end):
+        part["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        if part["header"].lower() == b"content-disposition":
+            part["name"] = parse_options_header(part["value"])[1].get(b"name", b"").decode("latin-1")
+        part["header"], part["value"] = b"", b""
+
+    def on_part_data(data, start, end):
+        if part["name"] == field:
+            part["data"] += data[start:end]
+
+    def on_part_end():
+        if part["name"] == field:
+            found.append(bytes(part["data"]))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+    try:
+        parser.write(body)
+        parser.finalize()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid multipart body")
+    if not found:
+        raise HTTPException(status_code=400, detail=f"Missing '{field}' field")
+    return found[0]
+
+
+@router.post("/query/audio", response_model=schemas.VoiceQueryResponse)
+async def voice_search_audio(request: Request, current_user: User = Depends(get_current_user)):
+    """
+    Voice search with the recording uploaded as-is instead of base64 JSON:
+    either multipart/form-data with a "file" field, or the raw bytes as the
+    body (audio/webm, audio/wav, application/octet-stream, ...).
+    The format is sniffed from the bytes, so the content type is not trusted.
+    The upload stays in memory and is rejected once it passes VOICE_MAX_UPLOAD_BYTES.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        body = await _read_body(request, settings.VOICE_MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD)
+        audio_bytes = _multipart_file(content_type, body)
+        if len(audio_bytes) > settings.VOICE_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Recording too large")
+    else:
+        audio_bytes = await _read_body(request, settings.VOICE_MAX_UPLOAD_BYTES)
+
+    if not audio_bytes:
+        raise HTTPException(status_code=400, detail="Empty recording")
+    print(f"[ROUTER] Received audio upload: {len(audio_bytes)} bytes")
+    return await run_in_threadpool(service.process_audio, audio_bytes)
+
+
+def _authenticate(token: str) -> User:
+    db = SessionLocal()
+    try:
+        return get_current_user(token=token, db=db)
+    finally:
+        db.close()
+
+
+@router.websocket("/stream")
+async def voice_stream(websocket: WebSocket, token: str = Query(...)):
+    """
+    Streaming voice search. Browsers cannot set headers on a WebSocket, so the
+    JWT is passed as ?token=.
+
+    Client -> server:
+      {"type": "start", "format": "pcm16" | "f32", "sample_rate": 48000, "language": "en"}  (optional)
+      binary frames of mono little-endian PCM in that format
+      {"type": "end"}
+    Server -> client:
+      {"type": "ready"}, {"type": "partial", "text"}, {"type": "segment", "index", "text"},
+      {"type": "final", "transcription"}, {"type": "result", ...VoiceQueryResponse}, {"type": "error", "detail"}
+    """
+    try:
+        await run_in_threadpool(_authenticate, token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    transcriber = None
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is not None:
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    await websocket.send_json({"type": "error", "detail": "Invalid control message"})
+                    continue
+                if control.get("type") == "start" and transcriber is None:
+                    try:
+                        transcriber = streaming.new_transcriber(websocket.send_json, control)
+                    except ValueError as e:
+                        await websocket.send_json({"type": "error", "detail": str(e)})
+                        continue
+                    await websocket.send_json({"type": "ready"})
+                elif control.get("type") == "end":
+                    break
+            elif message.get("bytes"):
+                if transcriber is None:
+                    transcriber = streaming.new_transcriber(websocket.send_json, {})
+                await transcriber.feed(message["bytes"])
+                if transcriber.received_seconds > settings.VOICE_STREAM_MAX_SECONDS:
+                    await websocket.send_json({"type": "error", "detail": "Maximum stream length reached"})
+                    break
+
+        if transcriber is None:
+            await websocket.send_json({"type": "error", "detail": "No audio received"})
+        else:
+            result = await transcriber.finish()
+            await websocket.send_json({"type": "result", **result.model_dump()})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if transcriber is not None:
+            transcriber.cancel()
+
+
+@router.get("/stats")
+def voice_stats(current_user: User = Depends(get_current_user)):
+    """Resident models, inference pool latency/batching and LLM gateway health metrics"""
+    return {
+        "models": model_manager.report(),
+        "inference": get_inference_stats(),
+        "cache": response_cache.get_stats(),
+        "llm": llm_gateway.get_stats(),
+    }
@@ -2,22 +2,28 @@
 # Free AI Implementation - Voice Search Service
 # Using: Whisper (Speech-to-Text) + Gemini (NLU) + Google TTS
 
-import os
 import json
-import tempfile
 from typing import Dict, Tuple
 from . import schemas
+from app.core.model_manager import model_manager, module_available
+from .audio import AudioDecodeError, decode_audio
 
 # Option 1: Using Whisper (100% Free, Self-hosted)
-try:
+# Loaded on first transcription (or ML_WARMUP_MODELS), not at import time
+WHISPER_AVAILABLE = module_available("whisper")
+if not WHISPER_AVAILABLE:
+    print("Whisper not installed. Install with: pip install openai-whisper")
+
+WHISPER_MODEL_NAME = "whisper-base"
+
+
+def _load_whisper():
     import whisper
-    WHISPER_AVAILABLE = True
-    # Load model once on startup (choose size based on your server)
     # Options: tiny, base, small, medium, large
-    whisper_model = whisper.load_model("base")  # Good balance of speed/accuracy
-except ImportError:
-    WHISPER_AVAILABLE = False
-    print("Whisper not installed. Install with: pip install openai-whisper")
+    return whisper.load_model("base")  # Good balance of speed/accuracy
+
+
+model_manager.register(WHISPER_MODEL_NAME, _load_whisper)
 
 # Option 2: Using LiteLLM (Unified AI)
 try:
@@ -49,28 +55,24 @@ def transcribe_audio_whisper(audio_bytes: bytes) -> Tuple[str, str]:
     Returns:
         (transcription_text, detected_language)
     """
-    if not WHISPER_AVAILABLE:
+    whisper_model = model_manager.get(WHISPER_MODEL_NAME) if WHISPER_AVAILABLE else None
+    if whisper_model is None:
         return "Whisper not available", "en"
     
-    # Save bytes to temporary file
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_audio:
-        temp_audio.write(audio_bytes)
-        temp_path = temp_audio.name
-    
+    # Whisper accepts the decoded 16 kHz float32 samples directly (no temp file / FFmpeg)
     try:
-        # Transcribe with Whisper
-        result = whisper_model.transcribe(
-            temp_path,
-            language=None,  # Auto-detect language
-            task="transcribe"
-        )
-        
-        return result["text"], result.get("language", "en")
+        samples = decode_audio(audio_bytes)
+    except AudioDecodeError as e:
+        print(f"Whisper decode error: {e}")
+        return "Could not process audio format", "en"
+
+    result = whisper_model.transcribe(
+        samples,
+        language=None,  # Auto-detect language
+        task="transcribe"
+    )
     
-    finally:
-        # Clean up temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    return result["text"], result.get("language", "en")
 
 
 def classify_intent_gemini(text: str) -> Dict:
@@ -122,7 +124,7 @@ OR
         
         # Use LiteLLM (defaulting to Gemini via configuration or explicit model)
         # Using gemini/gemini-1.5-flash as default efficient model
-        result_text = llm_service.generate_text(prompt, model="gemini/gemini-1.5-flash")
+        result_text = llm_service.generate_text(prompt, model="gemini/gemini-1.5-flash", hedge=True)
         result_text = result_text.strip()
         
         # Extract JSON from response (handle markdown code blocks)
@@ -237,7 +239,7 @@ If intent is "unknown":
 - Ask them to rephrase
 """
         
-        response_text = llm_service.generate_text(prompt, model="gemini/gemini-1.5-flash")
+        response_text = llm_service.generate_text(prompt, model="gemini/gemini-1.5-flash", hedge=True)
         return response_text.strip()
     
     except Exception as e:
@@ -0,0 +1,233 @@
+"""
+Streaming Voice Transcription
+Incremental speech-to-text for the /voice-search/stream WebSocket.
+
+Audio arrives as raw PCM frames while the farmer is still speaking. Each
+frame is resampled to 16 kHz and passed through a small energy VAD:
+
+- speech opens a segment (with a short pre-roll so the first syllable is kept)
+- while the segment grows, a partial transcript of it is produced every
+  VOICE_STREAM_PARTIAL_INTERVAL seconds of new audio (at most one in flight)
+- VOICE_VAD_SILENCE_MS of trailing silence (or ~28 s, Whisper's window)
+  commits the segment: it is transcribed once more and appended to the
+  transcript, and intent classification of the transcript so far starts
+  immediately in the background
+- when the client ends the stream, the last segment is committed and the
+  already-running classification is reused if the transcript did not change
+
+Transcription goes through the Whisper inference pool (or openai-whisper
+when transformers is not installed), so the event loop never runs a model.
+"""
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.inference_pool import InferenceError
+from app.core.model_manager import model_manager
+from . import schemas, service
+from .audio import TARGET_RATE, SampleBuffer, StreamingResampler
+
+FRAME_SAMPLES = TARGET_RATE * 30 // 1000  # 30 ms VAD frames
+SAMPLE_FORMATS = {"pcm16": np.int16, "f32": np.float32}
+
+
+class EnergyVAD:
+    """RMS speech detector with an adaptive noise floor (no extra dependencies)"""
+
+    def __init__(self, min_rms: float = 0.01, ratio: float = 3.0):
+        self.min_rms = min_rms
+        self.ratio = ratio
+        self.noise: Optional[float] = None
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms = float(np.sqrt(np.mean(frame * frame)))
+        if self.noise is None:
+            self.noise = rms
+        speech = rms > max(self.min_rms, self.noise * self.ratio)
+        if not speech:
+            self.noise = 0.95 * self.noise + 0.05 * rms
+        return speech
+
+
+async def transcribe_samples(samples: np.ndarray) -> str:
+    """Transcribe 16 kHz float32 samples without blocking the event loop"""
+    if service.TRANSFORMERS_AVAILABLE:
+        return await service.whisper_pool.arun(samples)
+    if service.WHISPER_AVAILABLE:
+        model = model_manager.get("whisper-base")
+        if model is not None:
+            result = await run_in_threadpool(model.transcribe, samples, task="transcribe")
+            return result["text"].strip()
+    raise InferenceError("No speech-to-text model available")
+
+
+class StreamingTranscriber:
+    def __init__(
+        self,
+        emit: Callable[[Dict[str, Any]], Awaitable[None]],
+        sample_rate: int = TARGET_RATE,
+        sample_format: str = "pcm16",
+        language: str = "en",
+        transcribe: Callable[[np.ndarray], Awaitable[str]] = transcribe_samples,
+        partial_interval: float = 1.0,
+        end_silence_ms: float = 600.0,
+        max_segment_seconds: float = 28.0,
+        pre_roll_ms: float = 210.0,
+    ):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format '{sample_format}' (use one of {', '.join(SAMPLE_FORMATS)})")
+        self.emit = emit
+        self.dtype = SAMPLE_FORMATS[sample_format]
+        self.language = language
+        self.transcribe = transcribe
+        self.partial_samples = int(partial_interval * TARGET_RATE)
+        self.end_silence_frames = max(int(end_silence_ms / 30), 1)
+        self.max_segment_samples = int(max_segment_seconds * TARGET_RATE)
+
+        self._resampler = StreamingResampler(sample_rate)
+        self._vad = EnergyVAD()
+        self._leftover = b""
+        self._pending = np.empty(0, dtype=np.float32)
+        self._pre_roll: Deque[np.ndarray] = deque(maxlen=max(int(pre_roll_ms / 30), 1))
+        self._segment: Optional[SampleBuffer] = None
+        self._segment_index = 0
+        self._silent_frames = 0
+        self._last_partial_at = 0
+        self._partial_task: Optional[asyncio.Task] = None
+        self._intent_task: Optional[asyncio.Task] = None
+        self._intent_text: Optional[str] = None
+
+        self.segments: List[str] = []
+        self.received_seconds = 0.0
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(text for text in self.segments if text)
+
+    # ============ Audio in ============
+
+    async def feed(self, data: bytes):
+        itemsize = np.dtype(self.dtype).itemsize
+        data = self._leftover + data
+        usable = len(data) - len(data) % itemsize
+        self._leftover = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self.dtype)
+        if self.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        self.received_seconds += len(samples) / self._resampler.src_rate
+
+        self._pending = np.concatenate((self._pending, self._resampler.process(samples)))
+        frames = len(self._pending) // FRAME_SAMPLES
+        for i in range(frames):
+            await self._frame(self._pending[i * FRAME_SAMPLES:(i + 1) * FRAME_SAMPLES])
+        self._pending = self._pending[frames * FRAME_SAMPLES:]
+
+        if self._segment is not None and len(self._segment) - self._last_partial_at >= self.partial_samples:
+            self._start_partial()
+
+    async def _frame(self, frame: np.ndarray):
+        speech = self._vad.is_speech(frame)
+        if self._segment is None:
+            self._pre_roll.append(frame)
+            if speech:
+                self._segment = SampleBuffer(self.max_segment_samples)
+                for buffered in self._pre_roll:
+                    self._segment.extend(buffered)
+                self._pre_roll.clear()
+                self._silent_frames = 0
+                self._last_partial_at = 0
+            return
+
+        self._segment.extend(frame)
+        self._silent_frames = 0 if speech else self._silent_frames + 1
+        if self._silent_frames >= self.end_silence_frames or len(self._segment) >= self.max_segment_samples:
+            await self._commit()
+
+    # ============ Transcripts out ============
+
+    def _start_partial(self):
+        if self._partial_task is not None and not self._partial_task.done():
+            return  # Keep at most one partial in flight; the next feed retries
+        self._last_partial_at = len(self._segment)
+        samples = self._segment.array().copy()
+        index = self._segment_index
+        self._partial_task = asyncio.create_task(self._partial(samples, index))
+
+    async def _partial(self, samples: np.ndarray, index: int):
+        try:
+            text = await self.transcribe(samples)
+        except Exception as e:
+            print(f"[WARNING] Partial transcription failed: {e}")
+            return
+        if index == self._segment_index:  # Segment not committed meanwhile
+            await self.emit({"type": "partial", "text": " ".join(filter(None, [self.transcript, text]))})
+
+    async def _commit(self):
+        segment, self._segment = self._segment, None
+        self._segment_index += 1
+        self._silent_frames = 0
+        if segment is None or len(segment) < FRAME_SAMPLES * 10:
+            return  # Under 300 ms: a click, not speech
+        try:
+            text = await self.transcribe(segment.array())
+        except Exception as e:
+            await self.emit({"type": "error", "detail": f"Transcription failed: {e}"})
+            return
+        self.segments.append(text)
+        await self.emit({"type": "segment", "index": len(self.segments) - 1, "text": text})
+        self._start_intent()
+
+    def _start_intent(self):
+        """Classify the transcript so far while the farmer may still be talking"""
+        transcript = self.transcript
+        if transcript and transcript != self._intent_text:
+            self._intent_text = transcript
+            self._intent_task = asyncio.create_task(
+                run_in_threadpool(service.classify_intent_gemini, transcript, self.language)
+            )
+
+    async def finish(self) -> schemas.VoiceQueryResponse:
+        """Commit the last segment and answer the query"""
+        if self._pending.size:
+            await self._frame(np.pad(self._pending, (0, FRAME_SAMPLES - len(self._pending))))
+            self._pending = self._pending[:0]
+        if self._segment is not None:
+            await self._commit()
+        transcript = self.transcript
+        await self.emit({"type": "final", "transcription": transcript})
+
+        if self._intent_task is not None and self._intent_text == transcript:
+            intent_result = await self._intent_task
+        else:
+            intent_result = await run_in_threadpool(service.classify_intent_gemini, transcript, self.language)
+        intent = intent_result.get("intent", "unknown")
+        params = intent_result.get("parameters", {})
+        response_text = await run_in_threadpool(service.generate_response_gemini, intent, params, self.language)
+        return schemas.VoiceQueryResponse(
+            transcription=transcript,
+            detected_language=self.language,
+            intent=intent,
+            parameters=params,
+            response_text=response_text,
+        )
+
+    def cancel(self):
+        for task in (self._partial_task, self._intent_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+def new_transcriber(emit: Callable[[Dict[str, Any]], Awaitable[None]], config: Dict[str, Any]) -> StreamingTranscriber:
+    """Build a transcriber from the client's "start" message"""
+    return StreamingTranscriber(
+        emit,
+        sample_rate=int(config.get("sample_rate", TARGET_RATE)),
+        sample_format=config.get("format", "pcm16"),
+        language=config.get("language", "en"),
+        partial_interval=settings.VOICE_STREAM_PARTIAL_INTERVAL,
+        end_silence_ms=settings.VOICE_VAD_SILENCE_MS,
+    )
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark: legacy per-payload LoRaWAN decoding vs. the batch codec registry.
+
+Usage (from backend/):
+    python benchmarks/bench_lorawan_codecs.py [uplinks]
+"""
+import base64
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.modules.iot.lorawan_codecs import codec_registry, np
+
+
+# ============ Legacy decoders (hand-written shift/or per payload) ============
+
+def legacy_decode(payload_b64, sensor_type):
+    raw = base64.b64decode(payload_b64)
+    if sensor_type == "soil_moisture" and len(raw) >= 11:
+        return {
+            "battery_voltage": ((raw[0] << 8) | raw[1]) / 1000,
+            "temperature": (((raw[2] << 8) | raw[3]) - 32768) / 10 if ((raw[2] << 8) | raw[3]) > 32767 else ((raw[2] << 8) | raw[3]) / 10,
+            "soil_moisture": ((raw[4] << 8) | raw[5]) / 100,
+            "soil_temperature": (((raw[6] << 8) | raw[7]) - 32768) / 10 if ((raw[6] << 8) | raw[7]) > 32767 else ((raw[6] << 8) | raw[7]) / 10,
+            "soil_ec": ((raw[8] << 8) | raw[9]),
+        }
+    if sensor_type == "weather" and len(raw) >= 8:
+        return {
+            "temperature": (((raw[0] << 8) | raw[1]) - 400) / 10,
+            "humidity": raw[2],
+            "pressure": ((raw[3] << 8) | raw[4]) / 10,
+            "wind_speed": raw[5] / 10,
+            "wind_direction": ((raw[6] << 8) | raw[7]),
+        }
+    if sensor_type == "water_level" and len(raw) >= 4:
+        return {
+            "battery_voltage": ((raw[0] << 8) | raw[1]) / 1000,
+            "water_level": ((raw[2] << 8) | raw[3]),
+        }
+    return {"raw_hex": raw.hex()}
+
+
+def make_uplinks(count):
+    rng = random.Random(42)
+    uplinks = []
+    for _ in range(count):
+        kind = rng.choice(["soil_moisture", "weather", "water_level"])
+        if kind == "soil_moisture":
+            raw = struct.pack(">HhHhHB", rng.randint(3000, 3600), rng.randint(0, 400),
+                              rng.randint(0, 10000), rng.randint(0, 400), rng.randint(0, 2000), 0)
+        elif kind == "weather":
+            raw = struct.pack(">HBHBH", rng.randint(400, 900), rng.randint(0, 100),
+                              rng.randint(9000, 11000), rng.randint(0, 200), rng.randint(0, 359))
+        else:
+            raw = struct.pack(">HH", rng.randint(3000, 3600), rng.randint(0, 5000))
+        uplinks.append((base64.b64encode(raw).decode(), kind))
+    return uplinks
+
+
+def timed(label, fn, count, repeat=5):
+    best = min(_run(fn) for _ in range(repeat))
+    print(f"{label:<32} {best * 1000:9.2f} ms   {count / best:12,.0f} uplinks/s")
+    return best
+
+
+def _run(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    uplinks = make_uplinks(count)
+    print(f"{count:,} uplinks, NumPy {'enabled' if np is not None else 'not installed (struct.iter_unpack path)'}")
+
+    legacy = timed("legacy per-payload decode", lambda: [legacy_decode(p, t) for p, t in uplinks], count)
+    timed("codec per-payload decode", lambda: [codec_registry.decode_base64(p, t) for p, t in uplinks], count)
+    batch = timed("codec batch decode", lambda: codec_registry.decode_base64_batch(uplinks), count)
+    print(f"batch speed-up vs legacy: {legacy / batch:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
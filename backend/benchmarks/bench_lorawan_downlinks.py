@@ -0,0 +1,157 @@
+"""
+Benchmark: legacy per-request downlink dispatch vs. the pooled outbox dispatcher,
+both against a local fake ChirpStack server.
+
+Usage (from backend/):
+    python benchmarks/bench_lorawan_downlinks.py [downlinks] [latency_ms] [fail_rate]
+
+The fake server answers POST /api/devices/{dev_eui}/queue after latency_ms and
+returns 503 for fail_rate of the requests, so retry handling is exercised too.
+It can also be run on its own to point real gateways at:
+    python benchmarks/bench_lorawan_downlinks.py --serve 8090
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.modules.iot.lorawan_downlinks import DownlinkDispatcher
+
+
+# ============ Fake ChirpStack ============
+
+class FakeChirpStack(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    latency = 0.02
+    fail_rate = 0.0
+    received = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        if not self.path.startswith("/api/devices/") or not self.path.endswith("/queue"):
+            return self._reply(404, {"error": "not found"})
+        if random.random() < self.fail_rate:
+            return self._reply(503, {"error": "unavailable"})
+        item = json.loads(body)["deviceQueueItem"]
+        type(self).received += 1
+        self._reply(200, {"id": f"{item['devEui']}-{type(self).received}"})
+
+    def _reply(self, code, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeChirpStack)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ============ Benchmarks ============
+
+def make_jobs(count, endpoint, gateways=4):
+    return [
+        {
+            "id": i,
+            "payload": "AQI=",
+            "port": 1,
+            "confirmed": False,
+            "attempts": 0,
+            "dev_eui": f"70B3D57ED00{i:05X}",
+            "gateway_id": i % gateways,
+            "network_server": "chirpstack",
+            "api_endpoint": endpoint,
+            "api_key": "bench",
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_dispatch(jobs):
+    """What _dispatch_downlink used to do: a fresh client per downlink, inline"""
+    ok = 0
+    for job in jobs:
+        try:
+            with httpx.Client() as client:
+                response = client.post(
+                    f"{job['api_endpoint']}/api/devices/{job['dev_eui']}/queue",
+                    json={"deviceQueueItem": {"devEui": job["dev_eui"], "fPort": job["port"], "data": job["payload"]}},
+                    headers={"Authorization": f"Bearer {job['api_key']}"},
+                )
+                response.raise_for_status()
+                ok += 1
+        except httpx.HTTPError:
+            pass
+    return ok
+
+
+async def outbox_dispatch(jobs, concurrency):
+    """Dispatcher cycles until every job is sent or failed (retries without backoff sleep)"""
+    dispatcher = DownlinkDispatcher(gateway_concurrency=concurrency, retry_base=0, max_attempts=5)
+    pending, sent, failed = jobs, 0, 0
+    try:
+        while pending:
+            results = await dispatcher.dispatch(pending)
+            by_id = {job["id"]: job for job in pending}
+            retry = []
+            for result in results:
+                if result["status"] == "QUEUED":
+                    sent += 1
+                elif result["status"] == "FAILED":
+                    failed += 1
+                else:
+                    retry.append(dict(by_id[result["id"]], attempts=result["attempts"]))
+            pending = retry
+    finally:
+        await dispatcher.aclose()
+    return sent, failed
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--serve":
+        server = serve(int(sys.argv[2]))
+        print(f"Fake ChirpStack listening on http://127.0.0.1:{server.server_address[1]}")
+        threading.Event().wait()
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    FakeChirpStack.latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    FakeChirpStack.fail_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    server = serve()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    jobs = make_jobs(count, endpoint)
+    print(f"{count} downlinks, {FakeChirpStack.latency * 1000:.0f} ms server latency, {FakeChirpStack.fail_rate:.0%} 503s")
+
+    started = time.perf_counter()
+    ok = legacy_dispatch(jobs)
+    legacy = time.perf_counter() - started
+    print(f"legacy (client per request, inline): {legacy:7.2f} s  sent={ok} lost={count - ok}")
+
+    for concurrency in (1, 4, 16):
+        started = time.perf_counter()
+        sent, failed = asyncio.run(outbox_dispatch(jobs, concurrency))
+        elapsed = time.perf_counter() - started
+        print(f"outbox (pooled, {concurrency:2d}/gateway):         {elapsed:7.2f} s  sent={sent} failed={failed}  ({legacy / elapsed:.1f}x)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
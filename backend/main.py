@@ -19,11 +19,10 @@ import traceback
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy import text
 
-from app.core import database
+from app.core.config import settings
 
-# --- Model imports (needed for create_all) ---
+# --- Model imports (register tables on Base.metadata for migrations.run_migrations) ---
 from app.modules.registry import models as registry_models
 from app.modules.auth import models as auth_models
 from app.modules.knowledge_graph import models as kg_models
@@ -60,6 +59,7 @@ from app.modules.diagnosis import model_router as model_registry_router
 from app.modules.knowledge_graph import router as kg_router
 from app.modules.iot import router as iot_router
 from app.modules.iot import lorawan_router
+from app.modules.iot import lorawan_ingest, lorawan_liveness, lorawan_downlinks
 from app.modules.dashboard import router as dashboard_router
 from app.modules.irrigation import router as irrigation_router
 from app.modules.irrigation import models as irrigation_models
@@ -68,9 +68,12 @@ from app.modules.feed import router as feed_router
 from app.modules.chat import router as chat_router
 
 from app.admin import setup_admin
-
-# Create tables
-database.Base.metadata.create_all(bind=database.engine)
+from app.core import telemetry_storage, migrations
+from app.core.model_manager import model_manager
+from app.core import inference_pool
+from app.core.llm_gateway import llm_gateway
+from app.modules.voice_search.cache import response_cache as voice_response_cache
+from app.modules.knowledge_graph.service import bootstrap_knowledge_graph
 
 app = FastAPI(title="Agri-OS Backend")
 
@@ -130,112 +133,43 @@ def read_root():
     return {"message": "Welcome to Agri-OS Universal Backend"}
 
 
-from app.core.id_generator import generate_numeric_id, generate_alphanumeric_id
-
-def _run_schema_migrations():
-    """Internal schema migration — runs at startup, not exposed as an endpoint."""
+@app.on_event("startup")
+def startup_event():
+    if settings.RUN_MIGRATIONS_ON_STARTUP:
+        try:
+            outcome = migrations.run_migrations()
+            if outcome["applied"]:
+                print(f"Schema migrations applied: {', '.join(outcome['applied'])}")
+        except Exception as e:
+            print(f"Schema migration error: {e}")
     try:
-        with database.engine.connect() as connection:
-            # Helper for safe column addition (works on both PostgreSQL and SQLite)
-            def _add_column(table, col_def):
-                try:
-                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col_def};"))
-                    connection.commit()
-                except Exception:
-                    connection.rollback()
-                    try:
-                        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {col_def};"))
-                        connection.commit()
-                    except Exception as e2:
-                        connection.rollback()
-                        # print(f"Migration skipped: {table}.{col_def.split()[0]} — {e2}")
-
-            # 1. Labor jobs
-            _add_column("labor_jobs", "filled_count INTEGER DEFAULT 0")
-
-            # 2. Diagnosis detailed columns
-            for col in ["cause TEXT", "prevention TEXT", "treatment_organic TEXT", "treatment_chemical TEXT", "identified_crop VARCHAR"]:
-                _add_column("diagnosis_logs", col)
-
-            # 3. Commercial products
-            for col in ["category VARCHAR", "image_url VARCHAR"]:
-                _add_column("commercial_products", col)
-
-            # 4. Product listings
-            for col in ["listing_type VARCHAR DEFAULT 'SELL'", "description TEXT", "image_url VARCHAR", "category VARCHAR"]:
-                _add_column("product_listings", col)
-            _add_column("product_listings", "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-
-            # 5. Users
-            for col in ["survey_number VARCHAR", "boundary JSON"]:
-                _add_column("users", col)
-
-            # 6. Livestock QR + profile columns
-            for col in ["qr_code VARCHAR", "qr_created_at TIMESTAMP", "name VARCHAR", "gender VARCHAR DEFAULT 'Female'", "purpose VARCHAR DEFAULT 'Dairy'", "origin VARCHAR DEFAULT 'BORN'", "source_details TEXT", "parent_id INTEGER"]:
-                _add_column("livestock", col)
-
-            # 7. Multi-user isolation
-            _add_column("diagnosis_logs", "user_id INTEGER")
-            _add_column("supply_chain_batches", "user_id INTEGER")
-
-            # 9. IoT Smart Logic (Fixes OperationalError)
-            for col in ["parent_device_id INTEGER", "last_active_at TIMESTAMP", "total_runtime_minutes FLOAT DEFAULT 0.0", "current_run_start_time TIMESTAMP", "target_turn_off_at TIMESTAMP", "asset_type VARCHAR DEFAULT 'Device'"]:
-                _add_column("iot_devices", col)
-
-            # 10. Chat Enhancements
-            for col in ["message_type VARCHAR DEFAULT 'text'", "attachment_url VARCHAR"]:
-                _add_column("chat_messages", col)
-
-            # --- Unique ID Migration ---
-            # Format: (table_name, id_column_name, is_numeric)
-            unique_id_configs = [
-                ("users", "user_unique_id", True),
-                ("farms", "farm_unique_id", False),
-                ("zones", "zone_unique_id", False),
-                ("machines", "machine_unique_id", False),
-                ("crop_cycles", "crop_unique_id", False),
-                ("iot_devices", "device_unique_id", False),
-                ("livestock", "animal_unique_id", False),
-                ("labor_jobs", "job_unique_id", False),
-                ("field_workers", "worker_unique_id", False),
-                ("inventory_items", "item_unique_id", False),
-            ]
-
-            for table, id_col, is_numeric in unique_id_configs:
-                # 1. Add the primary unique ID column
-                _add_column(table, f"{id_col} VARCHAR")
-                
-                # 2. Add user_unique_id column for linking (except on users table itself)
-                if table != "users":
-                    _add_column(table, "user_unique_id VARCHAR")
-
-                # 3. Backfill Logic
-                try:
-                    # Check for NULL unique IDs
-                    rows = connection.execute(text(f"SELECT id, {id_col} FROM {table} WHERE {id_col} IS NULL")).fetchall()
-                    if rows:
-                        # print(f"Backfilling {len(rows)} IDs for {table}...")
-                        for row in rows:
-                            row_id = row[0]
-                            if is_numeric:
-                                new_id = generate_numeric_id(12)
-                            else:
-                                new_id = generate_alphanumeric_id(12)
-                            
-                            connection.execute(text(f"UPDATE {table} SET {id_col} = :uid WHERE id = :rid"), {"uid": new_id, "rid": row_id})
-                        connection.commit()
-                except Exception:
-                    connection.rollback()
-
-            print("Schema migrations completed.")
+        bootstrap_knowledge_graph()  # Seed once here instead of on library/diagnosis requests
     except Exception as e:
-        print(f"Schema migration error: {e}")
+        print(f"[WARNING] Knowledge graph bootstrap failed: {e}")
+    telemetry_storage.init_telemetry_storage()
+    if settings.LORAWAN_PARTITIONING or settings.LORAWAN_RAW_RETENTION_DAYS or settings.LORAWAN_ROLLUP_5M_RETENTION_DAYS:
+        telemetry_storage.maintenance_worker.start()
+    lorawan_ingest.ingest_queue.start()
+    lorawan_liveness.liveness.start()
+    lorawan_downlinks.downlink_dispatcher.start()
+    # ML models load on first use; ML_WARMUP_MODELS preloads them in the background
+    warm = [m.strip() for m in settings.ML_WARMUP_MODELS.split(",") if m.strip()]
+    model_manager.start(warm=inference_pool.warm_up(warm))  # Pooled models warm inside their worker
+    model_manager.print_report()
+    print("Agri-OS Backend started.")
 
 
-@app.on_event("startup")
-def startup_event():
-    _run_schema_migrations()
-    print("Agri-OS Backend started.")
+@app.on_event("shutdown")
+def shutdown_event():
+    # Flush uplinks that were acknowledged but not yet written
+    lorawan_ingest.ingest_queue.stop()
+    telemetry_storage.maintenance_worker.stop()
+    lorawan_liveness.liveness.stop()
+    lorawan_downlinks.downlink_dispatcher.stop()
+    model_manager.stop()
+    inference_pool.stop_all()
+    llm_gateway.shutdown()
+    voice_response_cache.save()
 
 
 if __name__ == "__main__":